@@ -0,0 +1,171 @@
+"""State DB size and lookup cost: v1 (TEXT paths, rowid tables) vs v2 (interned).
+
+    PYTHONPATH=src python3 benchmarks/bench_db.py --rows 1000000 5000000 --dir /srv/bench
+
+For each row count a v1 vision.db is generated (file_state and synced_files
+with that many rows each, --per-dir files per inspection folder), copied, and
+migrated to v2 with db.init_db, which is timed too. Both are VACUUMed and
+compared on file size, --lookups random synced lookups (what is_synced costs
+a file BatchState did not preload) and the BatchState preload query. Names
+repeat across folders (img_000.jpg ...) unless --unique-names is given.
+"""
+
+import argparse
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from vision_sync.db import BatchState, PathIds, init_db, is_already_synced
+
+MIRROR = "/srv/vision_mirror"
+
+
+def source_path(i: int, per_dir: int, unique: bool) -> str:
+    folder = i // per_dir
+    name = f"img_{i:08d}.jpg" if unique else f"img_{i % per_dir:03d}.jpg"
+    return f"line{folder % 4}/2024_{folder // 400 % 366:04d}/insp_{folder:07d}/{name}"
+
+
+def build_v1(path: Path, rows: int, per_dir: int, unique: bool) -> None:
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE file_state (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER,"
+        " stable_count INTEGER, last_seen INTEGER)"
+    )
+    conn.execute(
+        "CREATE TABLE synced_files (id INTEGER PRIMARY KEY AUTOINCREMENT, source_path TEXT,"
+        " size INTEGER, mtime INTEGER, raw_path TEXT, bydate_path TEXT, synced_at INTEGER,"
+        " digest TEXT DEFAULT '', hash_algo TEXT DEFAULT '', stable_via TEXT DEFAULT '')"
+    )
+    conn.execute("CREATE INDEX idx_file_state_last_seen ON file_state(last_seen)")
+    conn.execute("CREATE INDEX idx_synced_lookup ON synced_files(source_path, size, mtime)")
+    conn.execute("CREATE INDEX idx_synced_at ON synced_files(synced_at)")
+    step = 100000
+    for start in range(0, rows, step):
+        batch = [source_path(i, per_dir, unique) for i in range(start, min(rows, start + step))]
+        conn.executemany(
+            "INSERT INTO file_state VALUES (?, 1000, 1700000000, 2, 1700000000)",
+            [(p,) for p in batch],
+        )
+        conn.executemany(
+            "INSERT INTO synced_files (source_path, size, mtime, raw_path, bydate_path,"
+            " synced_at, digest, hash_algo, stable_via)"
+            " VALUES (?, 1000, 1700000000, ?, ?, 1700000000, ?, 'sha256', 'scan')",
+            [
+                (p, f"{MIRROR}/raw/{p}", f"{MIRROR}/bydate/2024/01/01/{p.rsplit('/', 1)[1]}",
+                 f"{hash(p) & 0xFFFFFFFFFFFFFFFF:064x}")
+                for p in batch
+            ],
+        )
+        conn.commit()
+    conn.close()
+
+
+def vacuumed_size(path: Path) -> int:
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+    return path.stat().st_size
+
+
+def time_lookups_v1(path: Path, keys: list[str]) -> float:
+    conn = sqlite3.connect(str(path))
+    t0 = time.perf_counter()
+    for key in keys:
+        conn.execute(
+            "SELECT 1 FROM synced_files WHERE source_path=? AND size=? AND mtime=? LIMIT 1",
+            (key, 1000, 1700000000),
+        ).fetchone()
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    return elapsed
+
+
+def time_lookups_v2(path: Path, keys: list[str]) -> float:
+    conn = sqlite3.connect(str(path))
+    ids = PathIds(conn)
+    t0 = time.perf_counter()
+    for key in keys:
+        is_already_synced(conn, key, 1000, 1700000000, ids)
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    return elapsed
+
+
+def time_preload_v1(path: Path) -> float:
+    conn = sqlite3.connect(str(path))
+    t0 = time.perf_counter()
+    rows = {p: r for p, *r in conn.execute(
+        "SELECT path, size, mtime, stable_count, last_seen FROM file_state"
+    )}
+    set(conn.execute(
+        "SELECT s.source_path, s.size, s.mtime FROM synced_files s JOIN file_state f"
+        " ON f.path = s.source_path AND f.size = s.size AND f.mtime = s.mtime"
+    ))
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    assert rows
+    return elapsed
+
+
+def time_preload_v2(path: Path) -> float:
+    conn = sqlite3.connect(str(path))
+    t0 = time.perf_counter()
+    BatchState(conn, 2)
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="*", default=[1000000, 5000000])
+    parser.add_argument("--per-dir", type=int, default=50)
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--unique-names", action="store_true")
+    parser.add_argument("--dir", type=Path, default=None)
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="bench-db-", dir=args.dir))
+    try:
+        print(
+            f"{'rows':>9} {'schema':>6} {'size MiB':>9} {'B/row':>6}"
+            f" {'lookup us':>10} {'preload s':>10} {'migrate s':>10}"
+        )
+        for rows in args.rows:
+            v1 = work / f"v1-{rows}" / ".state" / "vision.db"
+            v2 = work / f"v2-{rows}" / ".state" / "vision.db"
+            v1.parent.mkdir(parents=True)
+            v2.parent.mkdir(parents=True)
+            build_v1(v1, rows, args.per_dir, args.unique_names)
+            shutil.copy(v1, v2)
+            t0 = time.perf_counter()
+            init_db(v2, Path(MIRROR)).close()
+            migrate = time.perf_counter() - t0
+
+            rng = random.Random(rows)
+            keys = [
+                source_path(rng.randrange(rows), args.per_dir, args.unique_names)
+                for _ in range(args.lookups)
+            ]
+            for schema, path, lookups, preload, mig in (
+                ("v1", v1, time_lookups_v1, time_preload_v1, ""),
+                ("v2", v2, time_lookups_v2, time_preload_v2, f"{migrate:10.1f}"),
+            ):
+                size = vacuumed_size(path)
+                per_lookup = lookups(path, keys) / len(keys) * 1e6
+                print(
+                    f"{rows:>9} {schema:>6} {size / 1048576:>9.1f} {size // (2 * rows):>6}"
+                    f" {per_lookup:>10.1f} {preload(path):>10.2f} {mig:>10}"
+                )
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
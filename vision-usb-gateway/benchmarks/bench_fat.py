@@ -0,0 +1,95 @@
+"""FatVolume (parse the snapshot device) vs the scandir scanner on the mount.
+
+    PYTHONPATH=src python3 benchmarks/bench_fat.py --device /dev/vg0/usb_snap \\
+        --offset 1048576 --mount /mnt/vision_snap --read-under cv-x/image/SD1_000
+
+On the unit, point --device/--offset at a snapshot and --mount at its vfat
+mount (drop caches between runs for cold numbers). Without --device a FAT32
+image of --files empty files (--per-dir per folder) is generated with the
+test image builder and only the FAT scan is timed. --read-under also reads
+every file below that folder, once as device extents (FatVolume.open_file)
+and once through the mount, in --chunk-mb reads.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from vision_sync.fat import FatVolume
+from vision_sync.fsops import scan_files
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests"))
+
+
+def generate(path: Path, files: int, per_dir: int) -> None:
+    from fat_image import build_fat32
+
+    tree: dict = {}
+    for i in range(files):
+        session = tree.setdefault(f"session_{i // per_dir:05d}", {})
+        session[f"img_{i:07d}.jpg"] = b""
+    build_fat32(path, tree, cluster_size=4096)
+
+
+def timed(label: str, fn) -> None:
+    t0 = time.perf_counter()
+    count = sum(1 for _ in fn())
+    print(f"{label:8s} files={count} time={time.perf_counter() - t0:.2f}s")
+
+
+def read_all(open_fn, records, chunk: int) -> int:
+    buf = bytearray(chunk)
+    total = 0
+    for rec in records:
+        with open_fn(rec) as f:
+            while n := f.readinto(buf):
+                total += n
+    return total
+
+
+def timed_read(label: str, open_fn, records, chunk: int) -> None:
+    t0 = time.perf_counter()
+    total = read_all(open_fn, records, chunk)
+    elapsed = time.perf_counter() - t0
+    mb = total / (1 << 20)
+    rate = mb / max(elapsed, 1e-9)
+    print(f"{label:8s} read={mb:.0f}MiB time={elapsed:.2f}s rate={rate:.0f}MiB/s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--device", type=Path, default=None)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--mount", type=Path, default=None)
+    parser.add_argument("--dir", type=Path, default=None)
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--per-dir", type=int, default=1000)
+    parser.add_argument("--read-under", default=None)
+    parser.add_argument("--chunk-mb", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-fat-", dir=args.dir) as work:
+        device = args.device
+        if device is None:
+            device = Path(work) / "usb.img"
+            t0 = time.perf_counter()
+            generate(device, args.files, args.per_dir)
+            print(f"generated {args.files} files in {time.perf_counter() - t0:.1f}s")
+        with FatVolume(device, args.offset) as vol:
+            timed("fat", vol.scan_files)
+            if args.mount is not None:
+                timed("scandir", lambda: scan_files(args.mount))
+            if args.read_under is not None:
+                chunk = args.chunk_mb << 20
+                records = list(vol.scan_files(args.read_under))
+                timed_read(
+                    "extents", lambda r: vol.open_file(r.rel, r.size, r.mtime), records, chunk
+                )
+                if args.mount is not None:
+                    timed_read("mount", lambda r: (args.mount / r.rel).open("rb"), records, chunk)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Throughput of each SYNC_HASH_ALGO candidate at the sync's chunk sizes.
+
+    PYTHONPATH=src python3 benchmarks/bench_hash.py --total-mb 256
+
+Run it on the CM5 itself: the ranking on an x86 box with SHA extensions is
+not the ranking on the ARM cores.
+"""
+
+import argparse
+import os
+import time
+
+from vision_sync.fsops import new_hasher
+
+ALGOS = ["sha256", "sha1", "md5", "blake2b", "blake2b-128", "blake2b-64", "blake2s"]
+CHUNKS = [64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+
+
+def measure(algo: str, chunk: bytes, total: int) -> float:
+    h = new_hasher(algo)
+    rounds = max(1, total // len(chunk))
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        h.update(chunk)
+    h.hexdigest()
+    return rounds * len(chunk) / (time.perf_counter() - t0) / (1024 * 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--total-mb", type=int, default=256)
+    parser.add_argument("--algos", nargs="*", default=ALGOS)
+    args = parser.parse_args()
+    total = args.total_mb * 1024 * 1024
+
+    header = "algo".ljust(14) + "".join(f"{c // 1024:>10}K" for c in CHUNKS)
+    print(header + "   (MiB/s)")
+    for algo in args.algos:
+        cells = []
+        for size in CHUNKS:
+            cells.append(f"{measure(algo, os.urandom(size), total):>11.0f}")
+        print(algo.ljust(14) + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Retention's untracked-file fallback: rebuild per deletion vs one-pass index.
+
+    PYTHONPATH=src python3 benchmarks/bench_retention.py --files 1000000 --dir /srv/bench
+
+Generates a mirror of --files empty files under raw/ (--per-dir per folder),
+each with a bydate/ hardlink, and no DB rows, so every deletion goes through
+the fallback. The legacy fallback (rglob both trees and sort, once per file
+deleted) is timed for one call and extrapolated to --deletes calls; the
+UntrackedFiles index is timed for its build plus --deletes real deletions.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from vision_sync.retention import Retention, settings_from_env
+
+
+def generate(mirror: Path, files: int, per_dir: int) -> None:
+    for i in range(files):
+        folder = i // per_dir
+        rel = f"line{folder % 4}/insp_{folder:06d}"
+        d = mirror / "raw" / rel
+        b = mirror / "bydate" / "2024" / f"{folder // 1000 % 12 + 1:02d}" / rel
+        if i % per_dir == 0:
+            d.mkdir(parents=True, exist_ok=True)
+            b.mkdir(parents=True, exist_ok=True)
+        f = d / f"img_{i:07d}.jpg"
+        f.write_bytes(b"")
+        os.utime(f, (i, i))
+        os.link(f, b / f.name)
+
+
+def legacy_pick(mirror: Path) -> Path | None:
+    """One call of the fallback as it was: both walks and a sort per file."""
+    inode_links: dict[tuple[int, int], list[Path]] = {}
+    for p in (mirror / "bydate").rglob("*"):
+        if not p.is_file():
+            continue
+        st = p.stat()
+        inode_links.setdefault((st.st_dev, st.st_ino), []).append(p)
+    candidates = []
+    for p in (mirror / "raw").rglob("*"):
+        if not p.is_file():
+            continue
+        st = p.stat()
+        candidates.append((st.st_mtime, p, (st.st_dev, st.st_ino)))
+    candidates.sort(key=lambda x: x[0])
+    return candidates[0][1] if candidates else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", type=Path, default=None)
+    parser.add_argument("--files", type=int, default=1_000_000)
+    parser.add_argument("--per-dir", type=int, default=50)
+    parser.add_argument("--deletes", type=int, default=1000)
+    args = parser.parse_args()
+
+    work = Path(tempfile.mkdtemp(prefix="bench-retention-", dir=args.dir))
+    mirror = work / "mirror"
+    try:
+        t0 = time.perf_counter()
+        generate(mirror, args.files, args.per_dir)
+        print(f"generated {args.files} files (+ bydate links) in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        legacy_pick(mirror)
+        one = time.perf_counter() - t0
+        print(
+            f"legacy   one call={one:.2f}s"
+            f"  {args.deletes} deletions~{one * args.deletes:.0f}s (extrapolated)"
+        )
+
+        settings = settings_from_env({"MIRROR_MOUNT": str(mirror)})
+        r = Retention(settings, sqlite3.connect(":memory:"))
+        t0 = time.perf_counter()
+        r.file_fallback_delete_one()
+        build = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        done = 1
+        while done < args.deletes and r.file_fallback_delete_one():
+            done += 1
+        rest = time.perf_counter() - t0
+        print(
+            f"indexed  build+first={build:.2f}s  next {done - 1} deletions={rest:.2f}s"
+            f"  total={build + rest:.2f}s"
+        )
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""os.walk + Path.stat scanner vs the scandir scanner (fsops.scan_files).
+
+    PYTHONPATH=src python3 benchmarks/bench_scan.py --files 500000 --dir /mnt/vision_bench
+
+Generates a tree of --files files (--per-dir per folder, the AOI's layout) under
+--dir, or scans an existing tree with --root (e.g. a mounted snapshot). When
+strace is installed each scanner is also run under `strace -c -f`, and the
+syscall totals are printed next to the timings.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from vision_sync.fsops import SKIP_DIRS, scan_files
+
+
+def legacy_scan(root: Path) -> int:
+    """The os.walk scanner stable_and_copy used before scan_files."""
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(root, topdown=True):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for name in filenames:
+            p = Path(dirpath) / name
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            if not p.is_file():
+                continue
+            count += 1 if st.st_size >= 0 else 0
+    return count
+
+
+def scandir_scan(root: Path) -> int:
+    return sum(1 for _ in scan_files(root))
+
+
+SCANNERS = {"legacy": legacy_scan, "scandir": scandir_scan}
+
+
+def generate(root: Path, files: int, per_dir: int) -> None:
+    for i in range(files):
+        d = root / f"session_{i // per_dir:05d}"
+        if i % per_dir == 0:
+            d.mkdir(parents=True, exist_ok=True)
+        (d / f"img_{i:07d}.jpg").write_bytes(b"")
+
+
+def strace_totals(scanner: str, root: Path) -> str:
+    with tempfile.NamedTemporaryFile(prefix="bench-scan-strace-", delete=False) as tmp:
+        out = Path(tmp.name)
+    cmd = [
+        "strace", "-f", "-c", "-o", str(out),
+        sys.executable, __file__, "--root", str(root), "--only", scanner,
+    ]
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        text = out.read_text()
+    finally:
+        out.unlink(missing_ok=True)
+    calls = {}
+    total = 0
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 4 and parts[-1] == "total":
+            total = int(parts[2]) if re.fullmatch(r"\d+", parts[2]) else total
+        elif len(parts) >= 5 and re.fullmatch(r"\d+", parts[3]):
+            calls[parts[-1]] = int(parts[3])
+    keys = ("newfstatat", "statx", "lstat", "stat", "getdents64", "openat")
+    detail = " ".join(f"{k}={calls[k]}" for k in keys if k in calls)
+    return f"syscalls={total or sum(calls.values())} ({detail})"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=Path, default=None)
+    parser.add_argument("--dir", type=Path, default=None)
+    parser.add_argument("--files", type=int, default=500_000)
+    parser.add_argument("--per-dir", type=int, default=1000)
+    parser.add_argument("--only", choices=sorted(SCANNERS), default=None)
+    args = parser.parse_args()
+
+    if args.only:
+        SCANNERS[args.only](args.root)
+        return
+
+    work = None
+    root = args.root
+    if root is None:
+        work = Path(tempfile.mkdtemp(prefix="bench-scan-", dir=args.dir))
+        root = work / "tree"
+        t0 = time.perf_counter()
+        generate(root, args.files, args.per_dir)
+        print(f"generated {args.files} files in {time.perf_counter() - t0:.1f}s")
+    try:
+        for name, fn in SCANNERS.items():
+            t0 = time.perf_counter()
+            count = fn(root)
+            elapsed = time.perf_counter() - t0
+            line = f"{name:8s} files={count} time={elapsed:.2f}s"
+            if shutil.which("strace"):
+                line += " " + strace_totals(name, root)
+            print(line)
+        if not shutil.which("strace"):
+            print("strace not installed: syscall counts skipped")
+    finally:
+        if work is not None:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
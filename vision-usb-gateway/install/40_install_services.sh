@@ -18,6 +18,8 @@ load_config
 : "${SYNC_ONACTIVE_SEC:=2min}"
 : "${SYNC_INTERVAL_SEC:=2min}"
 : "${SYNC_HI_INTERVAL_SEC:=10s}"
+: "${SYNC_ACTIVITY_SCHEDULER:=false}"
+: "${SYNC_ACTIVITY_FALLBACK_INTERVAL:=10min}"
 : "${RTC_SYNC_INTERVAL:=1h}"
 
 write_gateway_env
@@ -84,6 +86,7 @@ fi
 log "installing snapshot udev rule"
 cat > /etc/udev/rules.d/59-citostore-snapshot.rules <<EOF
 SUBSYSTEM=="block", KERNEL=="dm-*", ENV{DM_NAME}=="${LVM_VG:-vg0}-${SYNC_SNAPSHOT_NAME:-usb_sync_snap}", ENV{DM_NOSCAN}="1", OPTIONS+="nowatch"
+SUBSYSTEM=="block", KERNEL=="dm-*", ENV{DM_NAME}=="${LVM_VG:-vg0}-${SYNC_PREV_SNAPSHOT_NAME:-${SYNC_SNAPSHOT_NAME:-usb_sync_snap}_prev}", ENV{DM_NOSCAN}="1", OPTIONS+="nowatch"
 EOF
 udevadm control --reload-rules >/dev/null 2>&1 || true
 
@@ -102,6 +105,12 @@ fi
 mkdir -p "${USB_EXPORT_MOUNT:-/srv/usb_backup}"
 
 log "configuring vision-sync.timer override"
+# With the activity scheduler starting cycles on writes, the timer is only
+# the safety net.
+SYNC_TIMER_INTERVAL=$SYNC_INTERVAL_SEC
+if [[ "$SYNC_ACTIVITY_SCHEDULER" == "true" ]]; then
+  SYNC_TIMER_INTERVAL=$SYNC_ACTIVITY_FALLBACK_INTERVAL
+fi
 SYNC_TIMER_DIR=/etc/systemd/system/vision-sync.timer.d
 SYNC_TIMER_OVERRIDE=$SYNC_TIMER_DIR/override.conf
 mkdir -p "$SYNC_TIMER_DIR"
@@ -109,7 +118,7 @@ cat > "$SYNC_TIMER_OVERRIDE" <<EOF
 [Timer]
 OnBootSec=$SYNC_ONBOOT_SEC
 OnActiveSec=$SYNC_ONACTIVE_SEC
-OnUnitActiveSec=$SYNC_INTERVAL_SEC
+OnUnitActiveSec=$SYNC_TIMER_INTERVAL
 EOF
 
 log "configuring vision-sync-fast.timer override"
@@ -142,6 +151,16 @@ systemctl enable usb-gadget.service
 systemctl enable vision-gw-network.service
 systemctl enable vision-gw-config.service
 systemctl enable vision-sync.timer mirror-retention.timer
+if [[ "$SYNC_ACTIVITY_SCHEDULER" == "true" ]]; then
+  systemctl enable vision-sync-activity.service
+else
+  systemctl disable vision-sync-activity.service >/dev/null 2>&1 || true
+fi
+if [[ "${SYNC_DAEMON:-false}" == "true" ]]; then
+  systemctl enable vision-sync-daemon.service
+else
+  systemctl disable vision-sync-daemon.service >/dev/null 2>&1 || true
+fi
 systemctl disable vision-sync-fast.timer >/dev/null 2>&1 || true
 systemctl stop vision-sync-fast.timer >/dev/null 2>&1 || true
 # The rotator runs only from vision-sync's ExecStopPost; the monitor ALSO runs
@@ -10,10 +10,15 @@ load_config
 
 VG="${LVM_VG:-vg0}"
 SNAP_NAME=${SYNC_SNAPSHOT_NAME:-usb_sync_snap}
+PREV_SNAP_NAME=${SYNC_PREV_SNAPSHOT_NAME:-${SNAP_NAME}_prev}
 
 if command -v lvs >/dev/null 2>&1; then
-  if lvs "$VG/$SNAP_NAME" >/dev/null 2>&1; then
-    log "stale snapshot detected: $VG/$SNAP_NAME (removing)"
-    lvremove -f "$VG/$SNAP_NAME" || true
-  fi
+  # The _prev base kept by SYNC_BLOCK_DELTA goes too: the next cycle then
+  # scans in full and keeps a fresh one.
+  for name in "$SNAP_NAME" "$PREV_SNAP_NAME"; do
+    if lvs "$VG/$name" >/dev/null 2>&1; then
+      log "stale snapshot detected: $VG/$name (removing)"
+      lvremove -f "$VG/$name" || true
+    fi
+  done
 fi
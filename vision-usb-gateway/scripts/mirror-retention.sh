@@ -23,283 +23,34 @@ fi
 # reclaimed, so a file still on the active USB LV is not re-copied (NVMe churn).
 # Must exceed the worst-case USB LV residency; prune only bounds the DB.
 : "${RETENTION_ROW_TTL_DAYS:=90}"
-
-# Gate on the SAME used/total ratio the Python delete-loop below uses
+# Rows whose paths are blanked per commit, and parallel unlinks per batch.
+: "${RETENTION_BATCH:=500}"
+: "${RETENTION_DELETE_THREADS:=4}"
+# Free small batches in quiet periods once RETENTION_HI is forecast to be near.
+: "${RETENTION_PREDICT:=false}"
+: "${RETENTION_PREDICT_WINDOW_H:=24}"
+: "${RETENTION_PREDICT_HORIZON_H:=24}"
+: "${RETENTION_IDLE_QUIET_MIN:=10}"
+: "${RETENTION_IDLE_BATCH_MB:=512}"
+: "${RETENTION_IDLE_PROFILE_DAYS:=7}"
+
+# Gate on the SAME used/total ratio vision_sync.retention uses
 # (shutil.disk_usage). df -P's Use% excludes the ext4 root-reserved blocks, so
 # it reads ~5% higher than shutil; using it here let retention "trigger" in a
 # 90–95% band where the loop's shutil check was still < HI and deleted nothing.
 usage=$(python3 -c "import shutil; t,u,_=shutil.disk_usage('$MIRROR_MOUNT'); print(int(u*100/t))")
 if [[ $usage -lt $RETENTION_HI ]]; then
-  exit 0
+  # Below HI only the predictive pre-free has work to do, and only above LO.
+  if [[ "$RETENTION_PREDICT" != "true" || $usage -le $RETENTION_LO ]]; then
+    exit 0
+  fi
 fi
 
 export MIRROR_MOUNT RETENTION_HI RETENTION_LO DRY_RUN DB_MAINT_INTERVAL_SEC FILE_STATE_PRUNE_DAYS
-export RETENTION_ROW_TTL_DAYS INGEST_DIR
-
-python3 - <<'PY'
-import os
-import sqlite3
-from pathlib import Path
-import shutil
-
-mirror = os.environ.get("MIRROR_MOUNT", "/srv/vision_mirror")
-ret_hi = int(os.environ.get("RETENTION_HI", "90"))
-ret_lo = int(os.environ.get("RETENTION_LO", "85"))
-dry = os.environ.get("DRY_RUN", "false") == "true"
-db_maint_interval = int(os.environ.get("DB_MAINT_INTERVAL_SEC", "86400"))
-file_state_prune_days = int(os.environ.get("FILE_STATE_PRUNE_DAYS", "30"))
-row_ttl_days = int(os.environ.get("RETENTION_ROW_TTL_DAYS", "90"))
-now = int(__import__("time").time())
-
-state_db = Path(mirror) / ".state" / "vision.db"
-maint_state = Path(mirror) / ".state" / "retention.state.json"
-# Folders an operator marked keep-forever, chosen in the WebUI. Lives on the NVMe
-# so it survives an OS reflash — protection quietly lapsing after an update would
-# be worse than never having offered it.
-protected_file = Path(mirror) / ".state" / "retention-protected.json"
-if not state_db.exists():
-    raise SystemExit("state DB not found")
-
-def load_protected() -> list:
-    """Absolute, resolved roots that must never be deleted.
-
-    Fail closed: if the list cannot be read, protect nothing is the wrong answer
-    — but so is deleting everything on a parse error. Raise instead, so the run
-    aborts loudly and a broken file cannot silently un-protect an operator's data.
-    """
-    if not protected_file.exists():
-        return []
-    import json
-    raw = json.loads(protected_file.read_text(encoding="utf-8"))
-    roots = []
-    base = Path(mirror).resolve()
-    for rel in raw.get("paths", []):
-        p = (base / str(rel).lstrip("/")).resolve()
-        if p == base or base not in p.parents:
-            continue  # never let a bad entry protect (or escape) the whole mirror
-        roots.append(p)
-    return roots
-
-protected = load_protected()
-
-def is_protected(path: Path) -> bool:
-    try:
-        rp = path.resolve()
-    except OSError:
-        return False
-    return any(rp == r or r in rp.parents for r in protected)
-
-def usage_pct():
-    total, used, _ = shutil.disk_usage(mirror)
-    return int(used * 100 / total)
-
-def remove_empty_ancestors(path: Path, stop: Path) -> None:
-    d = path.parent
-    for _ in range(8):
-        if d == stop:
-            break
-        try:
-            d.rmdir()
-        except OSError:
-            break
-        d = d.parent
-
-def load_maint_state() -> dict:
-    if not maint_state.exists():
-        return {}
-    try:
-        import json
-        return json.loads(maint_state.read_text(encoding="utf-8"))
-    except Exception:
-        return {}
-
-def save_maint_state(data: dict) -> None:
-    try:
-        import json
-        maint_state.parent.mkdir(parents=True, exist_ok=True)
-        maint_state.write_text(json.dumps(data), encoding="utf-8")
-    except Exception:
-        pass
-
-def file_fallback_delete_one() -> bool:
-    raw_root = Path(mirror) / "raw"
-    bydate_root = Path(mirror) / "bydate"
-    # FTP/SFTP ingest data lives here and is not tracked in the DB.
-    ingest_data = Path(os.environ.get("INGEST_DIR", str(Path(mirror) / "ingest"))) / "data"
-    prune_roots = [r for r in (raw_root, ingest_data) if r.exists()]
-    if not prune_roots:
-        return False
-
-    inode_links: dict[tuple[int, int], list[Path]] = {}
-    if bydate_root.exists():
-        for p in bydate_root.rglob("*"):
-            if not p.is_file():
-                continue
-            try:
-                st = p.stat()
-            except OSError:
-                continue
-            inode_links.setdefault((st.st_dev, st.st_ino), []).append(p)
-
-    candidates: list[tuple[float, Path, tuple[int, int], Path]] = []
-    for root in prune_roots:
-        for p in root.rglob("*"):
-            if not p.is_file():
-                continue
-            try:
-                st = p.stat()
-            except OSError:
-                continue
-            inode = (st.st_dev, st.st_ino)
-            # raw/ and bydate/ are the same inodes (hardlinks), so protection is
-            # about the data, not a path: an image is protected if EITHER its raw
-            # file or ANY of its bydate links is protected. Freeing space means
-            # deleting every link, so if one link is kept none may go — checking
-            # only the raw path would let an unprotected raw file drag a protected
-            # bydate link to deletion with it.
-            if is_protected(p) or any(is_protected(l) for l in inode_links.get(inode, [])):
-                continue
-            candidates.append((st.st_mtime, p, inode, root))
-    candidates.sort(key=lambda x: x[0])
-
-    for _, raw_path, inode, root in candidates:
-        if dry:
-            print(f"DRY fallback delete: {raw_path}")
-            return True
-        try:
-            raw_path.unlink(missing_ok=True)
-        except OSError:
-            continue
-        for link in inode_links.get(inode, []):
-            try:
-                link.unlink(missing_ok=True)
-            except OSError:
-                pass
-            remove_empty_ancestors(link, bydate_root)
-        remove_empty_ancestors(raw_path, root)
-        return True
-    return False
-
-conn = sqlite3.connect(str(state_db))
-conn.row_factory = sqlite3.Row
-
-if not dry:
-    # Prune synced_files rows by age (bounds the DB). Rows are intentionally
-    # kept even after their mirror copy is reclaimed below, so a file still on
-    # the active USB LV is not re-copied (is_already_synced stays true). A row
-    # older than the TTL has surely rotated away, so dropping it is safe.
-    row_ttl = max(1, row_ttl_days) * 86400
-    conn.execute("DELETE FROM synced_files WHERE synced_at < ?", (now - row_ttl,))
-    conn.commit()
-
-    # Prune old file_state entries to keep DB bounded.
-    ttl = max(1, file_state_prune_days) * 86400
-    conn.execute("DELETE FROM file_state WHERE last_seen < ?", (now - ttl,))
-    conn.commit()
-
-progress_failures = 0
-while usage_pct() >= ret_hi:
-    before = usage_pct()
-    # Walk oldest-first and skip anything an operator protected. SQL cannot know
-    # about the protected roots, so ask for a window rather than a single row —
-    # otherwise one protected file at the head of the queue stalls the whole run.
-    row = None
-    for cand in conn.execute(
-        "SELECT id, raw_path, bydate_path FROM synced_files "
-        "WHERE raw_path != '' OR bydate_path != '' "
-        "ORDER BY synced_at ASC LIMIT 200"
-    ):
-        paths = [Path(p) for p in (cand["raw_path"], cand["bydate_path"]) if p]
-        if any(is_protected(p) for p in paths):
-            continue
-        row = cand
-        break
-    if row is None:
-        if not file_fallback_delete_one():
-            break
-        progress_failures = 0
-        if usage_pct() <= ret_lo:
-            break
-        continue
-
-    raw = Path(row["raw_path"]) if row["raw_path"] else None
-    bydate = Path(row["bydate_path"]) if row["bydate_path"] else None
-
-    if dry:
-        print(f"DRY delete: {raw} and {bydate}")
-    else:
-        for p in (bydate, raw):
-            if p is None:
-                continue
-            try:
-                p.unlink(missing_ok=True)
-            except OSError:
-                pass
-        # Keep the identity row (blank its paths) so the same file still on the
-        # active USB LV is not re-synced back into the mirror; age-prune clears
-        # it later. This is what stops the retention<->sync re-copy churn.
-        conn.execute(
-            "UPDATE synced_files SET raw_path='', bydate_path='' WHERE id=?",
-            (row["id"],),
-        )
-        conn.commit()
-        if bydate is not None:
-            remove_empty_ancestors(bydate, Path(mirror) / "bydate")
-
-    if usage_pct() <= ret_lo:
-        break
-
-    after = usage_pct()
-    if after >= before:
-        progress_failures += 1
-    else:
-        progress_failures = 0
-
-    # DB says we deleted, but usage didn't move; use file fallback.
-    if progress_failures >= 3:
-        if file_fallback_delete_one():
-            progress_failures = 0
-        else:
-            break
-
-# Protection holds: protected data is never deleted to make room. But retention
-# giving up quietly is how the mirror fills, the sync's free-space guard trips,
-# and the AOI's images stop being captured while everything still looks green.
-# Say so loudly enough that it is noticed before that happens.
-final = usage_pct()
-if final >= ret_hi and protected:
-    health = Path(mirror) / ".state" / "retention-blocked.json"
-    import json
-    try:
-        health.parent.mkdir(parents=True, exist_ok=True)
-        health.write_text(
-            json.dumps({"usage": final, "target": ret_lo, "protected": len(protected), "ts": now}),
-            encoding="utf-8",
-        )
-    except OSError:
-        pass
-    print(
-        f"CRITICAL: mirror at {final}% and retention cannot reach {ret_lo}% — "
-        f"{len(protected)} protected folder(s) are keeping the rest. Free space or "
-        f"unprotect something: when the mirror fills, the sync stops capturing.",
-        flush=True,
-    )
-else:
-    try:
-        (Path(mirror) / ".state" / "retention-blocked.json").unlink(missing_ok=True)
-    except OSError:
-        pass
-
-if not dry and db_maint_interval > 0:
-    state = load_maint_state()
-    last_vacuum_ts = int(state.get("last_vacuum_ts", 0) or 0)
-    if now - last_vacuum_ts >= db_maint_interval:
-        try:
-            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-            conn.execute("VACUUM")
-            save_maint_state({"last_vacuum_ts": now})
-        except Exception:
-            pass
+export RETENTION_ROW_TTL_DAYS INGEST_DIR RETENTION_BATCH RETENTION_DELETE_THREADS
+export RETENTION_PREDICT RETENTION_PREDICT_WINDOW_H RETENTION_PREDICT_HORIZON_H
+export RETENTION_IDLE_QUIET_MIN RETENTION_IDLE_BATCH_MB RETENTION_IDLE_PROFILE_DAYS
 
-conn.close()
-PY
+# Plans deletions from synced_files sizes down to RETENTION_LO, falling back to
+# delete-one-and-measure; see src/vision_sync/retention.py.
+exec python3 -m vision_sync.retention
@@ -128,7 +128,7 @@ if [[ "$DRY_RUN" == "true" ]]; then
 fi
 
 systemctl stop vision-sync.timer vision-monitor.timer vision-rotator.timer || true
-systemctl stop vision-sync.service vision-monitor.service vision-rotator.service || true
+systemctl stop vision-sync.service vision-sync-daemon.service vision-sync-activity.service vision-monitor.service vision-rotator.service || true
 systemctl stop usb-gadget.service || true
 
 if mountpoint -q "$MIRROR_MOUNT"; then
@@ -198,6 +198,11 @@ if [[ "$UPDATE_CONFIG" == "true" ]]; then
 fi
 
 systemctl start usb-gadget.service || true
+for unit in vision-sync-daemon.service vision-sync-activity.service; do
+  if systemctl is-enabled --quiet "$unit" 2>/dev/null; then
+    systemctl start "$unit" || true
+  fi
+done
 systemctl start vision-sync.service vision-monitor.service vision-rotator.service || true
 systemctl start vision-sync.timer vision-monitor.timer vision-rotator.timer || true
 
@@ -25,11 +25,19 @@ load_config
 : "${SYNC_ONACTIVE_SEC:=2min}"
 : "${SYNC_INTERVAL_SEC:=2min}"
 : "${SYNC_HI_INTERVAL_SEC:=10s}"
+: "${SYNC_ACTIVITY_SCHEDULER:=false}"
+: "${SYNC_ACTIVITY_FALLBACK_INTERVAL:=10min}"
 : "${RTC_SYNC_INTERVAL:=1h}"
 
 write_gateway_env
 
 # Update timer override from config.
+# With the activity scheduler starting cycles on writes, the timer is only
+# the safety net.
+SYNC_TIMER_INTERVAL=$SYNC_INTERVAL_SEC
+if [[ "$SYNC_ACTIVITY_SCHEDULER" == "true" ]]; then
+  SYNC_TIMER_INTERVAL=$SYNC_ACTIVITY_FALLBACK_INTERVAL
+fi
 SYNC_TIMER_DIR=/etc/systemd/system/vision-sync.timer.d
 SYNC_TIMER_OVERRIDE=$SYNC_TIMER_DIR/override.conf
 mkdir -p "$SYNC_TIMER_DIR"
@@ -37,7 +45,7 @@ cat > "$SYNC_TIMER_OVERRIDE" <<EOF
 [Timer]
 OnBootSec=$SYNC_ONBOOT_SEC
 OnActiveSec=$SYNC_ONACTIVE_SEC
-OnUnitActiveSec=$SYNC_INTERVAL_SEC
+OnUnitActiveSec=$SYNC_TIMER_INTERVAL
 EOF
 
 SYNC_FAST_TIMER_DIR=/etc/systemd/system/vision-sync-fast.timer.d
@@ -50,6 +58,19 @@ OnUnitActiveSec=$SYNC_HI_INTERVAL_SEC
 EOF
 
 systemctl daemon-reload
+# The resident daemon re-reads the config itself; only its on/off state
+# follows SYNC_DAEMON here.
+if [[ "${SYNC_DAEMON:-false}" == "true" ]]; then
+  systemctl enable --now vision-sync-daemon.service || true
+else
+  systemctl disable --now vision-sync-daemon.service >/dev/null 2>&1 || true
+fi
+if [[ "$SYNC_ACTIVITY_SCHEDULER" == "true" ]]; then
+  systemctl enable vision-sync-activity.service || true
+  systemctl restart vision-sync-activity.service || true
+else
+  systemctl disable --now vision-sync-activity.service >/dev/null 2>&1 || true
+fi
 systemctl restart vision-sync.timer
 systemctl restart vision-sync-fast.timer >/dev/null 2>&1 || true
 systemctl restart vision-rtc-sync.timer || true
@@ -81,7 +81,7 @@ if [[ "$DRY_RUN" == "true" ]]; then
 fi
 
 systemctl stop vision-sync.timer vision-monitor.timer vision-rotator.timer mirror-retention.timer nas-sync.timer || true
-systemctl stop vision-sync.service vision-monitor.service vision-rotator.service mirror-retention.service nas-sync.service || true
+systemctl stop vision-sync.service vision-sync-daemon.service vision-sync-activity.service vision-monitor.service vision-rotator.service mirror-retention.service nas-sync.service || true
 systemctl stop usb-gadget.service vision-webui.service smbd.service nmbd.service wsdd.service || true
 systemctl stop srv-vision_mirror.mount srv-vision_mirror.automount || true
 
@@ -187,6 +187,11 @@ done
 systemctl start usb-gadget.service || true
 systemctl start smbd.service nmbd.service wsdd.service || true
 systemctl start vision-webui.service || true
+for unit in vision-sync-daemon.service vision-sync-activity.service; do
+  if systemctl is-enabled --quiet "$unit" 2>/dev/null; then
+    systemctl start "$unit" || true
+  fi
+done
 systemctl start vision-sync.service vision-monitor.service vision-rotator.service || true
 systemctl enable --now vision-sync.timer vision-monitor.timer vision-rotator.timer || true
 
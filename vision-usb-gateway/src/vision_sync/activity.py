@@ -0,0 +1,126 @@
+"""Start sync cycles from the active USB LV's write counters.
+
+vision-sync-activity.service samples /sys/block/dm-N/stat of the LV named in
+/run/vision-usb-active every SYNC_ACTIVITY_POLL_SEC and starts
+vision-sync.service (so ExecStopPost monitor/rotator still follow every
+cycle) when:
+
+- the host's write burst has ended: no sectors written for
+  SYNC_ACTIVITY_QUIET_SEC;
+- writes keep streaming: at most every SYNC_ACTIVITY_MAX_DEFER_SEC, so a
+  long session is still mirrored while it runs;
+- a burst was synced but its files need STABLE_SCAN_REQUIRED scans: the
+  follow-up cycles run SYNC_ACTIVITY_QUIET_SEC apart, not one timer period.
+
+With no writes since the last cycle nothing is started; vision-sync.timer
+(SYNC_ACTIVITY_FALLBACK_INTERVAL) remains as the safety net.
+"""
+
+import argparse
+import subprocess
+import time
+from pathlib import Path
+
+from .config import get_config
+from .daemon import sd_notify
+from .iostat import ACTIVE_FILE, stat_path, written_sectors
+from .sync import log
+
+SYNC_UNIT = "vision-sync.service"
+
+
+class ActivityScheduler:
+    """Decides from (time, written-sector counter) samples when to sync."""
+
+    def __init__(self, quiet_sec: float, max_defer_sec: float, followups: int) -> None:
+        self.quiet_sec = quiet_sec
+        self.max_defer_sec = max_defer_sec
+        self.followups = max(0, followups)
+        self.last_written: int | None = None
+        self.last_change = 0.0
+        self.first_unsynced: float | None = None
+        self.pending_followups = 0
+        self.last_fire = 0.0
+
+    def observe(self, now: float, written: int) -> bool:
+        """Feed one sample; True when a cycle should start now."""
+        if self.last_written is None:
+            # Unknown history (startup, rotation): sync once when quiet.
+            self.first_unsynced = now
+            self.last_change = now
+        elif written != self.last_written:
+            self.last_change = now
+            if self.first_unsynced is None:
+                self.first_unsynced = now
+        self.last_written = written
+
+        if self.first_unsynced is not None:
+            quiet = now - self.last_change >= self.quiet_sec
+            return quiet or now - self.first_unsynced >= self.max_defer_sec
+        return self.pending_followups > 0 and now - self.last_fire >= self.quiet_sec
+
+    def fired(self, now: float) -> None:
+        """A cycle was started: writes up to now are covered by it."""
+        if self.first_unsynced is not None:
+            self.pending_followups = self.followups
+        else:
+            self.pending_followups -= 1
+        self.first_unsynced = None
+        self.last_fire = now
+
+    def reset(self) -> None:
+        self.last_written = None
+
+
+def sync_unit_busy() -> bool:
+    state = subprocess.run(
+        ["systemctl", "show", "-p", "ActiveState", "--value", SYNC_UNIT],
+        text=True, capture_output=True, check=False,
+    ).stdout.strip()
+    return state in ("activating", "active", "deactivating", "reloading")
+
+
+def start_sync() -> None:
+    subprocess.run(["systemctl", "start", "--no-block", SYNC_UNIT], check=False)
+
+
+def serve(cfg) -> None:
+    scheduler = ActivityScheduler(
+        float(cfg.sync_activity_quiet_sec),
+        float(cfg.sync_activity_max_defer_sec),
+        int(cfg.stable_scans) - 1,
+    )
+    poll = max(0.2, float(cfg.sync_activity_poll_sec))
+    active = ""
+    sd_notify("READY=1")
+    while True:
+        sd_notify("WATCHDOG=1")
+        time.sleep(poll)
+        try:
+            current = Path(ACTIVE_FILE).read_text().strip()
+            written = written_sectors(stat_path(current))
+        except (OSError, ValueError, IndexError):
+            continue
+        if current != active:
+            log(f"activity: watching {current} ({stat_path(current)})")
+            active = current
+            scheduler.reset()
+        now = time.monotonic()
+        if not scheduler.observe(now, written):
+            continue
+        # A cycle already running keeps the pending writes for the next one.
+        if sync_unit_busy():
+            continue
+        start_sync()
+        scheduler.fired(now)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="/etc/vision-gw.conf")
+    args = parser.parse_args()
+    serve(get_config(args.config))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,14 +15,46 @@ class Config:
     usb_persist_backing: Path
     sync_change_detect: bool
     sync_manifest_path: Path
+    sync_dir_manifest_file: Path
     sync_change_resume_scans: int
+    sync_block_delta: bool
+    sync_prev_snapshot_name: str
+    sync_delta_state_file: Path
+    sync_geometry_file: Path
+    sync_daemon: bool
+    sync_daemon_socket: Path
+    sync_daemon_cycle_timeout_sec: int
+    sync_activity_poll_sec: float
+    sync_activity_quiet_sec: float
+    sync_activity_max_defer_sec: float
+    sync_idle_fast_path: bool
+    sync_write_mark_file: Path
+    sync_cycle_budget_sec: float
+    sync_cycle_backlog_file: Path
+    sync_checkpoint_files: int
+    sync_checkpoint_sec: float
+    sync_resume_min_mb: int
+    sync_resume_segment_mb: int
+    sync_resume_ttl_days: float
+    sync_resume_file: Path
+    sync_progressive_globs: list[str]
+    sync_folder_units: bool
     stable_scans: int
+    sync_state_batch: bool
     max_file_size: int
     copy_chunk: int
+    sync_copy_workers: int
+    sync_hash_algo: str
+    sync_durability: str
+    sync_durability_batch_files: int
+    sync_durability_batch_mb: int
     append_always: bool
     bydate_use_file_time: bool
     sync_log_every: int
     sync_scan_depth: int
+    sync_scan_source: str
+    sync_copy_source: str
+    sync_fat_tz_offset_min: int
     sync_hot_dirs: int
     sync_cold_audit_dirs_per_run: int
     sync_dir_index_file: Path
@@ -86,12 +118,61 @@ def get_config(path: str) -> Config:
     sync_manifest_path = Path(
         data.get("SYNC_MANIFEST_FILE", str(mirror_mount / ".state" / "usb_sync.manifest"))
     )
+    sync_dir_manifest_file = Path(
+        data.get("SYNC_DIR_MANIFEST_FILE", str(mirror_mount / ".state" / "usb_sync.dirs.json"))
+    )
     sync_change_resume_scans = int(
         data.get("SYNC_CHANGE_RESUME_SCANS", data.get("STABLE_SCAN_REQUIRED", "2"))
     )
+    sync_block_delta = (
+        str(data.get("SYNC_BLOCK_DELTA", "false")).lower() in _truthy
+    )
+    sync_prev_snapshot_name = data.get("SYNC_PREV_SNAPSHOT_NAME", f"{snapshot_name}_prev")
+    sync_delta_state_file = Path(
+        data.get("SYNC_DELTA_STATE_FILE", str(mirror_mount / ".state" / "usb_sync.delta.json"))
+    )
+    sync_geometry_file = Path(
+        data.get("SYNC_GEOMETRY_FILE", str(mirror_mount / ".state" / "usb_sync.geometry.json"))
+    )
+    sync_daemon = str(data.get("SYNC_DAEMON", "false")).lower() in _truthy
+    sync_daemon_socket = Path(data.get("SYNC_DAEMON_SOCKET", "/run/vision-sync.sock"))
+    sync_daemon_cycle_timeout_sec = int(data.get("SYNC_DAEMON_CYCLE_TIMEOUT_SEC", "1800"))
+    sync_activity_poll_sec = float(data.get("SYNC_ACTIVITY_POLL_SEC", "1"))
+    sync_activity_quiet_sec = float(data.get("SYNC_ACTIVITY_QUIET_SEC", "5"))
+    sync_activity_max_defer_sec = float(data.get("SYNC_ACTIVITY_MAX_DEFER_SEC", "120"))
+    sync_idle_fast_path = str(data.get("SYNC_IDLE_FAST_PATH", "false")).lower() in _truthy
+    sync_write_mark_file = Path(
+        data.get("SYNC_WRITE_MARK_FILE", str(mirror_mount / ".state" / "usb_sync.writes.json"))
+    )
+    sync_cycle_budget_sec = float(data.get("SYNC_CYCLE_BUDGET_SEC", "0"))
+    sync_cycle_backlog_file = Path(
+        data.get("SYNC_CYCLE_BACKLOG_FILE", str(mirror_mount / ".state" / "usb_sync.backlog.json"))
+    )
+    sync_checkpoint_files = int(data.get("SYNC_CHECKPOINT_FILES", "500"))
+    sync_checkpoint_sec = float(data.get("SYNC_CHECKPOINT_SEC", "30"))
+    sync_resume_min_mb = int(data.get("SYNC_RESUME_MIN_MB", "0"))
+    sync_resume_segment_mb = int(data.get("SYNC_RESUME_SEGMENT_MB", "64"))
+    sync_resume_ttl_days = float(data.get("SYNC_RESUME_TTL_DAYS", "3"))
+    sync_resume_file = Path(
+        data.get("SYNC_RESUME_FILE", str(mirror_mount / ".state" / "usb_sync.partial.json"))
+    )
+    sync_progressive_globs = data.get("SYNC_PROGRESSIVE_GLOBS", [])
+    if isinstance(sync_progressive_globs, str):
+        sync_progressive_globs = [g for g in sync_progressive_globs.split(",") if g.strip()]
+    sync_folder_units = str(data.get("SYNC_FOLDER_UNITS", "false")).lower() in _truthy
     stable_scans = int(data.get("STABLE_SCAN_REQUIRED", "2"))
+    sync_state_batch = (
+        str(data.get("SYNC_STATE_BATCH", "false")).lower() in _truthy
+    )
     max_file_size = int(data.get("MAX_FILE_SIZE_BYTES", str(4 * 1024 ** 3)))
     copy_chunk = int(data.get("COPY_CHUNK_BYTES", str(8 * 1024 ** 2)))
+    sync_copy_workers = int(data.get("SYNC_COPY_WORKERS", "1"))
+    sync_hash_algo = str(data.get("SYNC_HASH_ALGO", "sha256")).strip().lower()
+    sync_durability = str(data.get("SYNC_DURABILITY", "file")).strip().lower()
+    if sync_durability not in ("file", "batch"):
+        sync_durability = "file"
+    sync_durability_batch_files = int(data.get("SYNC_DURABILITY_BATCH_FILES", "256"))
+    sync_durability_batch_mb = int(data.get("SYNC_DURABILITY_BATCH_MB", "512"))
     append_always = (
         str(data.get("RAW_APPEND_ALWAYS", "false")).lower() in _truthy
     )
@@ -100,6 +181,13 @@ def get_config(path: str) -> Config:
     )
     sync_log_every = int(data.get("SYNC_LOG_EVERY", "0"))
     sync_scan_depth = int(data.get("SYNC_SCAN_DEPTH", "1"))
+    sync_scan_source = str(data.get("SYNC_SCAN_SOURCE", "mount")).strip().lower()
+    if sync_scan_source not in ("mount", "fat"):
+        sync_scan_source = "mount"
+    sync_copy_source = str(data.get("SYNC_COPY_SOURCE", "mount")).strip().lower()
+    if sync_copy_source not in ("mount", "fat"):
+        sync_copy_source = "mount"
+    sync_fat_tz_offset_min = int(data.get("SYNC_FAT_TZ_OFFSET_MIN", "0"))
     sync_hot_dirs = int(data.get("SYNC_HOT_DIRS", "1"))
     sync_cold_audit_dirs_per_run = int(data.get("SYNC_COLD_AUDIT_DIRS_PER_RUN", "1"))
     sync_dir_index_file = Path(
@@ -118,14 +206,46 @@ def get_config(path: str) -> Config:
         usb_persist_backing=usb_persist_backing,
         sync_change_detect=sync_change_detect,
         sync_manifest_path=sync_manifest_path,
+        sync_dir_manifest_file=sync_dir_manifest_file,
         sync_change_resume_scans=sync_change_resume_scans,
+        sync_block_delta=sync_block_delta,
+        sync_prev_snapshot_name=sync_prev_snapshot_name,
+        sync_delta_state_file=sync_delta_state_file,
+        sync_geometry_file=sync_geometry_file,
+        sync_daemon=sync_daemon,
+        sync_daemon_socket=sync_daemon_socket,
+        sync_daemon_cycle_timeout_sec=sync_daemon_cycle_timeout_sec,
+        sync_activity_poll_sec=sync_activity_poll_sec,
+        sync_activity_quiet_sec=sync_activity_quiet_sec,
+        sync_activity_max_defer_sec=sync_activity_max_defer_sec,
+        sync_idle_fast_path=sync_idle_fast_path,
+        sync_write_mark_file=sync_write_mark_file,
+        sync_cycle_budget_sec=sync_cycle_budget_sec,
+        sync_cycle_backlog_file=sync_cycle_backlog_file,
+        sync_checkpoint_files=sync_checkpoint_files,
+        sync_checkpoint_sec=sync_checkpoint_sec,
+        sync_resume_min_mb=sync_resume_min_mb,
+        sync_resume_segment_mb=sync_resume_segment_mb,
+        sync_resume_ttl_days=sync_resume_ttl_days,
+        sync_resume_file=sync_resume_file,
+        sync_progressive_globs=sync_progressive_globs,
+        sync_folder_units=sync_folder_units,
         stable_scans=stable_scans,
+        sync_state_batch=sync_state_batch,
         max_file_size=max_file_size,
         copy_chunk=copy_chunk,
+        sync_copy_workers=sync_copy_workers,
+        sync_hash_algo=sync_hash_algo,
+        sync_durability=sync_durability,
+        sync_durability_batch_files=sync_durability_batch_files,
+        sync_durability_batch_mb=sync_durability_batch_mb,
         append_always=append_always,
         bydate_use_file_time=bydate_use_file_time,
         sync_log_every=sync_log_every,
         sync_scan_depth=sync_scan_depth,
+        sync_scan_source=sync_scan_source,
+        sync_copy_source=sync_copy_source,
+        sync_fat_tz_offset_min=sync_fat_tz_offset_min,
         sync_hot_dirs=sync_hot_dirs,
         sync_cold_audit_dirs_per_run=sync_cold_audit_dirs_per_run,
         sync_dir_index_file=sync_dir_index_file,
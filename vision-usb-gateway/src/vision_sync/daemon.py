@@ -0,0 +1,280 @@
+"""Resident sync process: cycles triggered over a Unix socket.
+
+With SYNC_DAEMON=true, vision-sync-daemon.service keeps one Python process,
+the parsed config, the SQLite connection and (with SYNC_STATE_BATCH) the
+loaded file_state/synced rows alive between cycles. vision-sync.service stays
+the oneshot the timers start; `vision_sync.sync` then only sends `cycle` to
+SYNC_DAEMON_SOCKET, waits for the result and exits with it. If no daemon
+answers, the oneshot runs the cycle itself.
+
+SIGTERM on the oneshot (stop, TimeoutStartSec) is forwarded as `cancel`:
+the daemon raises CycleCancelled inside the running cycle, which unwinds it
+like an in-process SIGTERM (copies salvaged, rows committed, snapshot
+unmounted and removed), and the oneshot exits 143 only once that is done,
+so ExecStopPost (monitor, rotator) never runs next to a live cycle and
+$SERVICE_RESULT reports the timeout as before. A client that vanishes
+without a word (SIGKILL) cancels its cycle the same way.
+
+Protocol: one line per connection, `cycle` or `ping`; the reply is `ok` or
+`error <reason>`. While a cycle runs the client may send `cancel`. Cycles run
+one at a time in accept order.
+
+The warm state is dropped when the config file changes, when the database
+file is replaced, when another connection committed (PRAGMA data_version:
+retention, offline-maint, WebUI) and after a failed cycle.
+"""
+
+import argparse
+import contextlib
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from . import sync
+from .config import get_config
+from .db import BatchState, init_db
+
+log = sync.log
+
+
+class CycleCancelled(BaseException):
+    """Raised in a running cycle whose trigger client cancelled or went away.
+
+    Not an Exception, like the SystemExit of sync's SIGTERM handler, so no
+    handler inside the cycle swallows it on the way out.
+    """
+
+
+def sd_notify(msg: str) -> None:
+    addr = os.environ.get("NOTIFY_SOCKET")
+    if not addr:
+        return
+    if addr.startswith("@"):
+        addr = "\0" + addr[1:]
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.sendto(msg.encode(), addr)
+        sock.close()
+    except OSError:
+        pass
+
+
+def trigger(sock_path: Path, command: str = "cycle") -> int | None:
+    """Run `command` in the daemon; exit status, or None if none is listening.
+
+    SIGTERM while waiting asks the daemon to cancel the cycle and keeps
+    waiting for it to unwind; the status is then 128 + SIGTERM, as for a
+    cycle run in-process.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(sock_path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    cancelled: list[int] = []
+
+    def cancel(signum, frame) -> None:
+        if cancelled:
+            return
+        cancelled.append(signum)
+        log("sync: SIGTERM, cancelling the daemon cycle and waiting for it to stop")
+        with contextlib.suppress(OSError):
+            sock.sendall(b"cancel\n")
+
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, cancel)
+    try:
+        with sock:
+            sock.sendall(f"{command}\n".encode())
+            with sock.makefile("r") as reply_file:
+                reply = reply_file.readline().strip()
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+    if reply == "ok" and not cancelled:
+        return 0
+    log(f"sync daemon: {reply or 'no reply (daemon exited mid-cycle)'}")
+    return 128 + cancelled[0] if cancelled else 1
+
+
+class SyncDaemon:
+    def __init__(self, config_path: str) -> None:
+        self.config_path = config_path
+        self.cfg = None
+        self._cfg_mtime: int | None = None
+        self.conn = None
+        self._db_ino: int | None = None
+        self._data_version: int | None = None
+        self.state: BatchState | None = None
+        # monotonic start of the running cycle, 0 while idle (watchdog reads it)
+        self.cycle_started = 0.0
+        self.cancel_requested = False
+        # Cycles run on the main thread and can be cancelled (serve() sets it).
+        self.cancellable = False
+
+    def _close_db(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+        self.state = None
+
+    def config(self):
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self.cfg is None or mtime != self._cfg_mtime:
+            self.cfg = get_config(self.config_path)
+            self._cfg_mtime = mtime
+            self._close_db()
+        return self.cfg
+
+    def _db(self, cfg):
+        db_path = cfg.state_dir / "vision.db"
+        try:
+            ino = os.stat(db_path).st_ino
+        except OSError:
+            ino = None
+        if self.conn is not None and ino != self._db_ino:
+            # Wiped or restored underneath us: reopen and reload.
+            self._close_db()
+        if self.conn is None:
+            self.conn = init_db(db_path)
+            self._db_ino = os.stat(db_path).st_ino
+            self._data_version = None
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self.state = None
+            self._data_version = version
+        if self.state is None and getattr(cfg, "sync_state_batch", False):
+            self.state = BatchState(self.conn, max(1, int(cfg.stable_scans)))
+        return self.conn, self.state
+
+    def cycle(self) -> str:
+        self.cycle_started = time.monotonic()
+        try:
+            try:
+                if self.cancel_requested:
+                    raise CycleCancelled()
+                cfg = self.config()
+                conn, state = self._db(cfg)
+                sync.run(cfg, None, False, conn=conn, state=state)
+            finally:
+                self.cycle_started = 0.0
+        except CycleCancelled:
+            log("sync daemon: cycle cancelled by its trigger client")
+            # Committed what it copied, but the warm rows may be ahead of the DB.
+            self.state = None
+            return "error cancelled"
+        except Exception as exc:
+            traceback.print_exc()
+            # The cycle rolled back; in-memory rows no longer match the DB.
+            self.state = None
+            return f"error {type(exc).__name__}: {exc}"
+        return "ok"
+
+    def _cancel_signal(self, signum, frame) -> None:
+        # A SIGUSR1 that lands after the cycle ended is ignored.
+        if self.cycle_started and self.cancel_requested:
+            raise CycleCancelled()
+
+    def _watch_client(self, request) -> None:
+        """Cancel the running cycle once its client sends `cancel` or hangs up."""
+        with contextlib.suppress(OSError):
+            request.readline()
+        # Set before cycle_started is read; cycle() reads them the other way
+        # round, so a cancel racing the cycle start is seen by one side.
+        self.cancel_requested = True
+        if self.cycle_started and self.cancellable:
+            log("sync daemon: trigger client cancelled or went away, stopping the cycle")
+            signal.pthread_kill(threading.main_thread().ident, signal.SIGUSR1)
+
+    def serve_client(self, client: socket.socket) -> None:
+        with client, client.makefile("r") as request:
+            try:
+                line = request.readline().strip()
+            except OSError:
+                return
+            watcher = None
+            if line == "cycle":
+                self.cancel_requested = False
+                watcher = threading.Thread(
+                    target=self._watch_client, args=(request,), daemon=True
+                )
+                watcher.start()
+            try:
+                reply = self.handle(line)
+                client.sendall(f"{reply}\n".encode())
+            except OSError:
+                # Trigger client gone (killed): the cycle result is still in
+                # the journal.
+                pass
+            finally:
+                if watcher is not None:
+                    # Wakes the watcher; the cycle is over, so it does nothing.
+                    with contextlib.suppress(OSError):
+                        client.shutdown(socket.SHUT_RDWR)
+                    watcher.join()
+
+    def handle(self, line: str) -> str:
+        if line == "cycle":
+            reply = self.cycle()
+            sd_notify(f"STATUS=last cycle {reply} at {time.strftime('%H:%M:%S')}")
+            return reply
+        if line == "ping":
+            return "ok"
+        return f"error unknown command: {line}"
+
+    def _watchdog(self, interval: float) -> None:
+        # A cycle stuck past SYNC_DAEMON_CYCLE_TIMEOUT_SEC (D-state mount, LVM
+        # stall) stops the pings, so systemd kills and restarts the daemon:
+        # the backstop for a cycle that cannot unwind on `cancel`.
+        while True:
+            started = self.cycle_started
+            limit = int(getattr(self.cfg, "sync_daemon_cycle_timeout_sec", 1800))
+            if not started or time.monotonic() - started < limit:
+                sd_notify("WATCHDOG=1")
+            time.sleep(interval)
+
+    def serve(self) -> None:
+        cfg = self.config()
+        sock_path = Path(cfg.sync_daemon_socket)
+        sock_path.parent.mkdir(parents=True, exist_ok=True)
+        sock_path.unlink(missing_ok=True)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(str(sock_path))
+        os.chmod(sock_path, 0o600)
+        listener.listen(8)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self._cancel_signal)
+            self.cancellable = True
+        log(f"sync daemon listening on {sock_path}")
+        sd_notify("READY=1")
+        watchdog_usec = os.environ.get("WATCHDOG_USEC")
+        if watchdog_usec:
+            interval = int(watchdog_usec) / 1_000_000 / 2
+            threading.Thread(target=self._watchdog, args=(interval,), daemon=True).start()
+        while True:
+            client, _ = listener.accept()
+            self.serve_client(client)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="/etc/vision-gw.conf")
+    parser.add_argument("--trigger", action="store_true", help="ask a running daemon for a cycle")
+    args = parser.parse_args()
+    if args.trigger:
+        status = trigger(get_config(args.config).sync_daemon_socket)
+        raise SystemExit(2 if status is None else status)
+    SyncDaemon(args.config).serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,276 @@
 import sqlite3
 from pathlib import Path
 
+# PRAGMA user_version of the current layout. Version 2 interns source paths
+# into src_dirs/src_names: file_state is a WITHOUT ROWID table keyed by
+# (dir_id, name_id) and synced_files refers to the same ids, with raw_path and
+# bydate_path relative to MIRROR_MOUNT (readers still accept absolute paths,
+# which older rows and hand-made DBs carry). v_file_state and v_synced_files
+# show full source paths for ad-hoc queries.
+SCHEMA_VERSION = 2
 
-def init_db(db_path: Path) -> sqlite3.Connection:
+# Rows moved per transaction by the v1 -> v2 migration. Each batch is
+# committed and removed from the old table, so readers (retention, WebUI) are
+# blocked for one batch at a time and an interrupted migration resumes.
+MIGRATE_BATCH = 50000
+
+_SOURCE_PATH = "CASE WHEN d.path = '' THEN n.name ELSE d.path || '/' || n.name END"
+
+
+def init_db(db_path: Path, mirror_root: Path | None = None) -> sqlite3.Connection:
+    """Open (and create or migrate) the state DB at MIRROR_MOUNT/.state/vision.db.
+
+    `mirror_root` is what migrated raw/bydate paths are made relative to; it
+    defaults to the DB's grandparent.
+    """
     db_path.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(str(db_path))
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA synchronous=NORMAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        _migrate(conn, mirror_root or db_path.parent.parent)
+    return conn
+
+
+def _create_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS src_dirs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT NOT NULL UNIQUE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS src_names (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+        """
+    )
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS file_state (
-            path TEXT PRIMARY KEY,
+            dir_id INTEGER NOT NULL,
+            name_id INTEGER NOT NULL,
             size INTEGER,
             mtime INTEGER,
             stable_count INTEGER,
-            last_seen INTEGER
-        )
+            last_seen INTEGER,
+            PRIMARY KEY (dir_id, name_id)
+        ) WITHOUT ROWID
         """
     )
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS synced_files (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source_path TEXT,
+            dir_id INTEGER NOT NULL,
+            name_id INTEGER NOT NULL,
             size INTEGER,
             mtime INTEGER,
             raw_path TEXT,
             bydate_path TEXT,
-            synced_at INTEGER
+            synced_at INTEGER,
+            digest TEXT DEFAULT '',
+            hash_algo TEXT DEFAULT '',
+            stable_via TEXT DEFAULT ''
         )
         """
     )
     conn.execute("CREATE INDEX IF NOT EXISTS idx_file_state_last_seen ON file_state(last_seen)")
     conn.execute(
-        "CREATE INDEX IF NOT EXISTS idx_synced_lookup ON synced_files(source_path, size, mtime)"
+        "CREATE INDEX IF NOT EXISTS idx_synced_lookup"
+        " ON synced_files(dir_id, name_id, size, mtime)"
     )
     conn.execute("CREATE INDEX IF NOT EXISTS idx_synced_at ON synced_files(synced_at)")
+    conn.execute(
+        "CREATE VIEW IF NOT EXISTS v_file_state AS"
+        f" SELECT {_SOURCE_PATH} AS path, f.size, f.mtime, f.stable_count, f.last_seen"
+        " FROM file_state f JOIN src_dirs d ON d.id = f.dir_id"
+        " JOIN src_names n ON n.id = f.name_id"
+    )
+    conn.execute(
+        "CREATE VIEW IF NOT EXISTS v_synced_files AS"
+        f" SELECT s.id, {_SOURCE_PATH} AS source_path, s.size, s.mtime, s.raw_path,"
+        " s.bydate_path, s.synced_at, s.digest, s.hash_algo, s.stable_via"
+        " FROM synced_files s JOIN src_dirs d ON d.id = s.dir_id"
+        " JOIN src_names n ON n.id = s.name_id"
+    )
+
+
+def _migrate(conn: sqlite3.Connection, mirror_root: Path) -> None:
+    """Bring a v0/v1 DB (full TEXT paths, rowid tables) to SCHEMA_VERSION."""
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    conn.execute("BEGIN IMMEDIATE")
+    if "file_state" in tables and "file_state_v1" not in tables:
+        cols = {row[1] for row in conn.execute("PRAGMA table_info(file_state)")}
+        if "path" in cols:
+            conn.execute("ALTER TABLE file_state RENAME TO file_state_v1")
+            tables.add("file_state_v1")
+    if "synced_files" in tables and "synced_files_v1" not in tables:
+        cols = {row[1] for row in conn.execute("PRAGMA table_info(synced_files)")}
+        if "source_path" in cols:
+            # Columns added after the first release.
+            for col in ("digest", "hash_algo", "stable_via"):
+                if col not in cols:
+                    conn.execute(f"ALTER TABLE synced_files ADD COLUMN {col} TEXT DEFAULT ''")
+            conn.execute("ALTER TABLE synced_files RENAME TO synced_files_v1")
+            tables.add("synced_files_v1")
+    # The old indexes moved with the renamed tables; free their names.
+    for index in ("idx_file_state_last_seen", "idx_synced_lookup", "idx_synced_at"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+    _create_schema(conn)
     conn.commit()
-    return conn
 
+    ids = PathIds(conn)
+    prefix = f"{str(mirror_root).rstrip('/')}/"
+
+    def rel(path: str | None) -> str:
+        return path[len(prefix):] if path and path.startswith(prefix) else (path or "")
+
+    if "file_state_v1" in tables:
+        while True:
+            rows = conn.execute(
+                "SELECT rowid, path, size, mtime, stable_count, last_seen FROM file_state_v1"
+                " ORDER BY rowid LIMIT ?",
+                (MIGRATE_BATCH,),
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                "INSERT OR REPLACE INTO file_state"
+                " (dir_id, name_id, size, mtime, stable_count, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(*ids.ids(path), *rest) for _, path, *rest in rows],
+            )
+            conn.execute("DELETE FROM file_state_v1 WHERE rowid <= ?", (rows[-1][0],))
+            conn.commit()
+        conn.execute("DROP TABLE file_state_v1")
+    if "synced_files_v1" in tables:
+        while True:
+            rows = conn.execute(
+                "SELECT id, source_path, size, mtime, raw_path, bydate_path, synced_at,"
+                " digest, hash_algo, stable_via FROM synced_files_v1 ORDER BY id LIMIT ?",
+                (MIGRATE_BATCH,),
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany(
+                "INSERT OR REPLACE INTO synced_files"
+                " (id, dir_id, name_id, size, mtime, raw_path, bydate_path, synced_at,"
+                " digest, hash_algo, stable_via) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (rid, *ids.ids(src or ""), size, mtime, rel(raw), rel(bydate), at,
+                     digest or "", algo or "", via or "")
+                    for rid, src, size, mtime, raw, bydate, at, digest, algo, via in rows
+                ],
+            )
+            conn.execute("DELETE FROM synced_files_v1 WHERE id <= ?", (rows[-1][0],))
+            conn.commit()
+        conn.execute("DROP TABLE synced_files_v1")
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+
+class PathIds:
+    """Interned (dir_id, name_id) of source paths, cached for one state object.
+
+    mirror-retention.sh drops unreferenced src_dirs/src_names rows, but only
+    while the cycle lock is free, so a cache must not outlive its cycle.
+    """
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self.dirs: dict[str, int] = {}
+        self.names: dict[str, int] = {}
+
+    def _id(self, table: str, col: str, cache: dict[str, int], value: str, create: bool):
+        ident = cache.get(value)
+        if ident is None:
+            row = self.conn.execute(f"SELECT id FROM {table} WHERE {col}=?", (value,)).fetchone()
+            if row is not None:
+                ident = row[0]
+            elif create:
+                ident = self.conn.execute(
+                    f"INSERT INTO {table} ({col}) VALUES (?)", (value,)
+                ).lastrowid
+            else:
+                return None
+            cache[value] = ident
+        return ident
+
+    def dir_id(self, directory: str, create: bool = True) -> int | None:
+        return self._id("src_dirs", "path", self.dirs, directory, create)
 
-def update_state(conn: sqlite3.Connection, path: str, size: int, mtime: int, now: int) -> int:
-    cur = conn.execute("SELECT size, mtime, stable_count FROM file_state WHERE path=?", (path,))
+    def ids(self, path: str, create: bool = True) -> tuple[int, int] | None:
+        directory, _, name = path.rpartition("/")
+        dir_id = self.dir_id(directory, create)
+        if dir_id is None:
+            return None
+        name_id = self._id("src_names", "name", self.names, name, create)
+        if name_id is None:
+            return None
+        return dir_id, name_id
+
+
+def update_state(
+    conn: sqlite3.Connection,
+    path: str,
+    size: int,
+    mtime: int,
+    now: int,
+    ids: PathIds | None = None,
+) -> int:
+    dir_id, name_id = (ids or PathIds(conn)).ids(path)
+    cur = conn.execute(
+        "SELECT size, mtime, stable_count FROM file_state WHERE dir_id=? AND name_id=?",
+        (dir_id, name_id),
+    )
     row = cur.fetchone()
     if row is None:
         stable = 1
         conn.execute(
-            "INSERT INTO file_state (path, size, mtime, stable_count, last_seen)"
-            " VALUES (?, ?, ?, ?, ?)",
-            (path, size, mtime, stable, now),
+            "INSERT INTO file_state (dir_id, name_id, size, mtime, stable_count, last_seen)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (dir_id, name_id, size, mtime, stable, now),
         )
     else:
         prev_size, prev_mtime, prev_stable = row
         stable = prev_stable + 1 if prev_size == size and prev_mtime == mtime else 1
         conn.execute(
-            "UPDATE file_state SET size=?, mtime=?, stable_count=?, last_seen=? WHERE path=?",
-            (size, mtime, stable, now, path),
+            "UPDATE file_state SET size=?, mtime=?, stable_count=?, last_seen=?"
+            " WHERE dir_id=? AND name_id=?",
+            (size, mtime, stable, now, dir_id, name_id),
         )
     return stable
 
 
-def is_already_synced(conn: sqlite3.Connection, path: str, size: int, mtime: int) -> bool:
+def touch_dir(
+    conn: sqlite3.Connection, directory: str, now: int, ids: PathIds | None = None
+) -> None:
+    """Refresh last_seen of the file_state rows in `directory`, one UPDATE.
+
+    Rows seen within LAST_SEEN_REFRESH_SEC are left as they are.
+    """
+    dir_id = (ids or PathIds(conn)).dir_id(directory, create=False)
+    if dir_id is not None:
+        conn.execute(
+            "UPDATE file_state SET last_seen=? WHERE dir_id=? AND last_seen<?",
+            (now, dir_id, now - LAST_SEEN_REFRESH_SEC),
+        )
+
+
+def is_already_synced(
+    conn: sqlite3.Connection, path: str, size: int, mtime: int, ids: PathIds | None = None
+) -> bool:
+    key = (ids or PathIds(conn)).ids(path, create=False)
+    if key is None:
+        return False
     cur = conn.execute(
-        "SELECT 1 FROM synced_files WHERE source_path=? AND size=? AND mtime=? LIMIT 1",
-        (path, size, mtime),
+        "SELECT 1 FROM synced_files WHERE dir_id=? AND name_id=? AND size=? AND mtime=? LIMIT 1",
+        (*key, size, mtime),
     )
     return cur.fetchone() is not None
 
@@ -76,10 +283,185 @@ def mark_synced(
     raw_path: str,
     bydate_path: str,
     now: int,
+    digest: str = "",
+    hash_algo: str = "",
+    stable_via: str = "",
+    ids: PathIds | None = None,
 ) -> None:
     conn.execute(
         "INSERT INTO synced_files"
-        " (source_path, size, mtime, raw_path, bydate_path, synced_at)"
-        " VALUES (?, ?, ?, ?, ?, ?)",
-        (source_path, size, mtime, raw_path, bydate_path, now),
+        " (dir_id, name_id, size, mtime, raw_path, bydate_path, synced_at, digest, hash_algo,"
+        " stable_via) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (*(ids or PathIds(conn)).ids(source_path), size, mtime, raw_path, bydate_path, now,
+         digest, hash_algo, stable_via),
     )
+
+
+# A stable file is re-seen on every scan. Rewriting its row each time just to
+# bump last_seen is what made the DB cost scale with the tree, so the batched
+# state only refreshes last_seen once per this interval. file_state pruning
+# works in days (FILE_STATE_PRUNE_DAYS), so a day of staleness is harmless.
+# Files of folders the dir manifest skips are not re-read at all; touch()
+# refreshes them on the same schedule so the prune does not drop their rows.
+LAST_SEEN_REFRESH_SEC = 86400
+
+
+class DirectState:
+    """Per-file state access: every call is its own SQLite round trip."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self.ids = PathIds(conn)
+
+    def update(self, path: str, size: int, mtime: int, now: int) -> int:
+        return update_state(self.conn, path, size, mtime, now, self.ids)
+
+    def is_synced(self, path: str, size: int, mtime: int) -> bool:
+        return is_already_synced(self.conn, path, size, mtime, self.ids)
+
+    def touch(self, paths: list[str], now: int) -> None:
+        for directory in {path.rpartition("/")[0] for path in paths}:
+            touch_dir(self.conn, directory, now, self.ids)
+
+    def mark_synced(
+        self,
+        source_path: str,
+        size: int,
+        mtime: int,
+        raw_path: str,
+        bydate_path: str,
+        now: int,
+        digest: str = "",
+        hash_algo: str = "",
+        stable_via: str = "",
+    ) -> None:
+        mark_synced(
+            self.conn, source_path, size, mtime, raw_path, bydate_path, now, digest, hash_algo,
+            stable_via, self.ids,
+        )
+
+    def flush(self) -> None:
+        return
+
+
+class BatchState:
+    """In-memory file_state and synced identity set for one sync run.
+
+    Rows are loaded once, stability is decided in Python, and only rows that
+    actually changed are written back by flush() with executemany. A file that
+    stays stable is not rewritten: its stable_count is capped at `stable_cap`
+    and last_seen is refreshed at most every LAST_SEEN_REFRESH_SEC.
+
+    The synced set is only preloaded for identities file_state already tracks
+    (a JOIN, not the whole 90-day synced_files table). A path file_state has
+    never seen falls back to a direct lookup, which happens once per new file.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, stable_cap: int) -> None:
+        self.conn = conn
+        self.stable_cap = max(1, int(stable_cap))
+        self.ids = PathIds(conn)
+        self.rows: dict[str, tuple[int, int, int, int]] = {}
+        paths: dict[tuple[int, int], str] = {}
+        dirs, names = self.ids.dirs, self.ids.names
+        for dir_id, directory, name_id, name, size, mtime, stable, last_seen in conn.execute(
+            "SELECT d.id, d.path, n.id, n.name, f.size, f.mtime, f.stable_count, f.last_seen"
+            " FROM file_state f JOIN src_dirs d ON d.id = f.dir_id"
+            " JOIN src_names n ON n.id = f.name_id"
+        ):
+            path = f"{directory}/{name}" if directory else name
+            dirs[directory] = dir_id
+            names[name] = name_id
+            paths[(dir_id, name_id)] = path
+            self.rows[path] = (size, mtime, stable, last_seen)
+        self.known = set(self.rows)
+        self.synced: set[tuple[str, int, int]] = {
+            (paths[(dir_id, name_id)], size, mtime)
+            for dir_id, name_id, size, mtime in conn.execute(
+                "SELECT s.dir_id, s.name_id, s.size, s.mtime FROM synced_files s"
+                " JOIN file_state f ON f.dir_id = s.dir_id AND f.name_id = s.name_id"
+                " AND f.size = s.size AND f.mtime = s.mtime"
+            )
+        }
+        self.changed: set[str] = set()
+        self.dirty: dict[str, tuple[int, int, int, int]] = {}
+        self.pending_synced: list[tuple] = []
+
+    def update(self, path: str, size: int, mtime: int, now: int) -> int:
+        row = self.rows.get(path)
+        if row is None:
+            stable = 1
+        else:
+            prev_size, prev_mtime, prev_stable, last_seen = row
+            if prev_size != size or prev_mtime != mtime:
+                self.changed.add(path)
+                stable = 1
+            elif prev_stable >= self.stable_cap:
+                if now - last_seen < LAST_SEEN_REFRESH_SEC:
+                    return prev_stable
+                stable = prev_stable
+            else:
+                stable = prev_stable + 1
+        row = (size, mtime, stable, now)
+        self.rows[path] = row
+        self.dirty[path] = row
+        return stable
+
+    def touch(self, paths: list[str], now: int) -> None:
+        for path in paths:
+            row = self.rows.get(path)
+            if row is not None and now - row[3] >= LAST_SEEN_REFRESH_SEC:
+                row = (*row[:3], now)
+                self.rows[path] = row
+                self.dirty[path] = row
+
+    def is_synced(self, path: str, size: int, mtime: int) -> bool:
+        key = (path, size, mtime)
+        if key in self.synced:
+            return True
+        if path in self.known and path not in self.changed:
+            # Same identity file_state held at load time: the preload JOIN
+            # already returned its synced row if there is one.
+            return False
+        if is_already_synced(self.conn, path, size, mtime, self.ids):
+            self.synced.add(key)
+            return True
+        return False
+
+    def mark_synced(
+        self,
+        source_path: str,
+        size: int,
+        mtime: int,
+        raw_path: str,
+        bydate_path: str,
+        now: int,
+        digest: str = "",
+        hash_algo: str = "",
+        stable_via: str = "",
+    ) -> None:
+        self.synced.add((source_path, size, mtime))
+        self.pending_synced.append(
+            (source_path, size, mtime, raw_path, bydate_path, now, digest, hash_algo, stable_via)
+        )
+
+    def flush(self) -> None:
+        ids = self.ids.ids
+        if self.dirty:
+            self.conn.executemany(
+                "INSERT INTO file_state (dir_id, name_id, size, mtime, stable_count, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(dir_id, name_id) DO UPDATE SET size=excluded.size,"
+                " mtime=excluded.mtime, stable_count=excluded.stable_count,"
+                " last_seen=excluded.last_seen",
+                [(*ids(path), *row) for path, row in self.dirty.items()],
+            )
+            self.dirty.clear()
+        if self.pending_synced:
+            self.conn.executemany(
+                "INSERT INTO synced_files"
+                " (dir_id, name_id, size, mtime, raw_path, bydate_path, synced_at, digest,"
+                " hash_algo, stable_via) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(*ids(row[0]), *row[1:]) for row in self.pending_synced],
+            )
+            self.pending_synced.clear()
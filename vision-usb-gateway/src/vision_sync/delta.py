@@ -0,0 +1,261 @@
+"""Changed-block driven change detection between consecutive snapshots.
+
+With SYNC_BLOCK_DELTA the previous cycle's thin snapshot is kept (renamed to
+SYNC_PREV_SNAPSHOT_NAME) instead of removed. The next cycle asks thin_delta
+which pool blocks differ between it and the new snapshot, maps those byte
+ranges to FAT clusters, and the clusters to directories through an index of
+every directory's cluster chain kept in the state dir. Only those
+directories are listed, plus new subdirectories found in them (walked in
+full) and the folders of files still waiting to become stable. Any file
+change on FAT rewrites its directory entry (size, mtime), so a changed file
+always lands in a changed directory.
+"""
+
+import bisect
+import json
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import NamedTuple
+
+from . import proc
+from .fat import FatError, FatVolume
+
+DELTA_STATE_VERSION = 1
+COMPARE_CHUNK = 1 << 20
+
+
+class DeltaPlan(NamedTuple):
+    """What a delta cycle lists: `dirs` one level each, `trees` recursively."""
+
+    dirs: list[str]
+    trees: list[str]
+
+
+def _lvs(fields: str, target: str) -> list[str]:
+    out = proc.run(
+        ["lvs", "--noheadings", "--units", "b", "--nosuffix", "-o", fields, target],
+        check=True, text=True, capture_output=True,
+    ).stdout
+    return out.split()
+
+
+def _dm_name(vg: str, lv: str) -> str:
+    return f"{vg.replace('-', '--')}-{lv.replace('-', '--')}"
+
+
+def parse_thin_delta(text: str, block_bytes: int) -> list[tuple[int, int]]:
+    """Byte ranges of every non-`same` block run in thin_delta's XML output."""
+    ranges: list[tuple[int, int]] = []
+    for node in ET.fromstring(text).iter():
+        if node.tag in ("different", "left_only", "right_only"):
+            begin = int(node.get("begin", "0")) * block_bytes
+            length = int(node.get("length", "0")) * block_bytes
+            if ranges and ranges[-1][0] + ranges[-1][1] == begin:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            elif length:
+                ranges.append((begin, length))
+    return ranges
+
+
+def thin_delta_ranges(vg: str, old_lv: str, new_lv: str) -> list[tuple[int, int]] | None:
+    """Byte ranges that differ between two thin LVs of one pool, or None.
+
+    Reads the pool metadata through a metadata snapshot (reserved and
+    released around the call), so the live pool is never touched. None means
+    "no delta available" (not thin, different pools, tools missing, ...) and
+    the caller must fall back to a full scan.
+    """
+    try:
+        old_id, old_pool = _lvs("thin_id,pool_lv", f"{vg}/{old_lv}")
+        new_id, new_pool = _lvs("thin_id,pool_lv", f"{vg}/{new_lv}")
+        if old_pool != new_pool:
+            return None
+        (chunk,) = _lvs("chunk_size", f"{vg}/{old_pool}")
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+    tpool = _dm_name(vg, f"{old_pool}-tpool")
+    tmeta = f"/dev/mapper/{_dm_name(vg, f'{old_pool}_tmeta')}"
+    try:
+        proc.run(
+            ["dmsetup", "message", tpool, "0", "reserve_metadata_snap"],
+            check=True, capture_output=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    try:
+        out = proc.run(
+            ["thin_delta", "-m", "--snap1", old_id, "--snap2", new_id, tmeta],
+            check=True, text=True, capture_output=True,
+        ).stdout
+        return parse_thin_delta(out, int(chunk))
+    except (OSError, ValueError, ET.ParseError, subprocess.CalledProcessError):
+        return None
+    finally:
+        proc.run(
+            ["dmsetup", "message", tpool, "0", "release_metadata_snap"],
+            check=False, capture_output=True,
+        )
+
+
+def compare_ranges(old: Path, new: Path, chunk: int = COMPARE_CHUNK) -> list[tuple[int, int]]:
+    """Chunked byte compare of two images; the stand-in for thin_delta off-device."""
+    ranges: list[tuple[int, int]] = []
+    pos = 0
+    with open(old, "rb") as fa, open(new, "rb") as fb:
+        while True:
+            a = fa.read(chunk)
+            b = fb.read(chunk)
+            if not a and not b:
+                break
+            if a != b:
+                length = max(len(a), len(b))
+                if ranges and ranges[-1][0] + ranges[-1][1] == pos:
+                    ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+                else:
+                    ranges.append((pos, length))
+            pos += max(len(a), len(b))
+    return ranges
+
+
+class DeltaState:
+    """Directory cluster index of the snapshot last synced, persisted as JSON.
+
+    `source` names the LV the index describes; after a rotation it no longer
+    matches and the next cycle scans in full and rebuilds the index.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.source = ""
+        self.cycle_start = 0
+        self.dirs: dict[str, list[int]] = {}
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            data = {}
+        if isinstance(data, dict) and data.get("version") == DELTA_STATE_VERSION:
+            self.source = str(data.get("source", ""))
+            self.cycle_start = int(data.get("cycle_start", 0))
+            dirs = data.get("dirs", {})
+            if isinstance(dirs, dict):
+                self.dirs = {str(k): [int(c) for c in v] for k, v in dirs.items()}
+        self._owners: list[tuple[int, str]] | None = None
+
+    def usable(self, source: str) -> bool:
+        return bool(self.dirs) and self.source == source
+
+    def _owner_index(self) -> list[tuple[int, str]]:
+        if self._owners is None:
+            self._owners = sorted((c, rel) for rel, cs in self.dirs.items() for c in cs)
+        return self._owners
+
+    def _owners_in(self, spans: list[tuple[int, int]]) -> set[str]:
+        owners = self._owner_index()
+        keys = [c for c, _ in owners]
+        found: set[str] = set()
+        for first, last in spans:
+            i = bisect.bisect_left(keys, first)
+            while i < len(keys) and keys[i] <= last:
+                found.add(owners[i][1])
+                i += 1
+        return found
+
+    def changed_dirs(self, volume: FatVolume, ranges: list[tuple[int, int]]) -> set[str]:
+        changed = self._owners_in(volume.data_spans(ranges))
+        # A FAT block hit is coarse; it only counts if the chain really moved.
+        for rel in self._owners_in(volume.fat_spans(ranges)) - changed:
+            try:
+                if volume.chain(self.dirs[rel][0]) != self.dirs[rel]:
+                    changed.add(rel)
+            except FatError:
+                changed.add(rel)
+        return changed
+
+    def plan(
+        self,
+        volume: FatVolume,
+        ranges: list[tuple[int, int]],
+        pending: set[str],
+    ) -> DeltaPlan:
+        """Directories to list this cycle for the given changed byte ranges.
+
+        `pending` adds the folders of files seen but not yet stable, which
+        must be listed again even though nothing in them changed.
+        """
+        dirs = sorted(self.changed_dirs(volume, ranges) | pending)
+        trees: list[str] = []
+        for rel in dirs:
+            prefix = f"{rel}/" if rel else ""
+            for name in volume.scan_level(rel)[1]:
+                child = prefix + name
+                known = self.dirs.get(child)
+                # New, renamed, or deleted and recreated under the same name
+                # (new clusters the index has never seen): walk it in full.
+                if not known or volume.lookup(child).cluster != known[0]:
+                    trees.append(child)
+        return DeltaPlan(dirs, trees)
+
+    def _drop(self, rel: str) -> None:
+        prefix = f"{rel}/"
+        for key in [k for k in self.dirs if k == rel or k.startswith(prefix)]:
+            del self.dirs[key]
+
+    def _index_tree(self, volume: FatVolume, rel: str) -> None:
+        for current, _, _ in volume.scan_tree(rel):
+            self.dirs[current] = volume.dir_chain(current)
+
+    def update(self, volume: FatVolume, plan: DeltaPlan) -> None:
+        """Refresh the index for what a delta cycle listed."""
+        for rel in plan.dirs:
+            try:
+                self.dirs[rel] = volume.dir_chain(rel)
+            except FileNotFoundError:
+                self._drop(rel)
+                continue
+            prefix = f"{rel}/" if rel else ""
+            present = set(volume.scan_level(rel)[1])
+            for key in [k for k in self.dirs if k.startswith(prefix) and k != rel]:
+                if "/" not in key[len(prefix):] and key[len(prefix):] not in present:
+                    self._drop(key)
+        for rel in plan.trees:
+            self._drop(rel)
+            self._index_tree(volume, rel)
+        self._owners = None
+
+    def rebuild(self, volume: FatVolume) -> None:
+        """Index every directory after a full scan."""
+        self.dirs = {}
+        self._index_tree(volume, "")
+        self._owners = None
+
+    def save(self, source: str, cycle_start: int) -> None:
+        self.source = source
+        self.cycle_start = cycle_start
+        payload = {
+            "version": DELTA_STATE_VERSION,
+            "source": source,
+            "cycle_start": cycle_start,
+            "dirs": self.dirs,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload, separators=(",", ":")))
+        os.replace(tmp, self.path)
+
+    def invalidate(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.dirs = {}
+        self._owners = None
+
+
+def pending_dirs(conn, stable_scans: int, since: int) -> set[str]:
+    """Folders of files seen since `since` that have not reached stable_scans yet."""
+    rows = conn.execute(
+        "SELECT DISTINCT d.path FROM file_state f JOIN src_dirs d ON d.id = f.dir_id"
+        " WHERE f.last_seen >= ? AND f.stable_count < ?",
+        (since, stable_scans),
+    )
+    return {path for (path,) in rows}
+
@@ -0,0 +1,490 @@
+"""Read-only FAT32 directory reader working on the snapshot block device.
+
+Listing a snapshot through the kernel vfat driver costs a syscall per entry on
+a slow loop/dm stack. FatVolume mmaps the device (or an image file) at the
+partition offset and parses directory clusters directly, producing the same
+FileRecord stream as fsops.MountTree, so the scanner can use either.
+
+Names and mtimes follow what the sync mounts with (vfat, utf8,
+shortname=mixed): long names as stored, short-only names honouring the NT
+lowercase flags, and the FAT local timestamp read as UTC shifted by
+`tz_offset` (the kernel's sys_tz, 0 on a UTC-RTC unit).
+"""
+
+import io
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+from pathlib import Path
+
+from .fsops import SKIP_DIRS, FileRecord
+
+ATTR_READ_ONLY = 0x01
+ATTR_HIDDEN = 0x02
+ATTR_SYSTEM = 0x04
+ATTR_VOLUME_ID = 0x08
+ATTR_DIRECTORY = 0x10
+ATTR_LFN = 0x0F
+
+CASE_LOWER_BASE = 0x08
+CASE_LOWER_EXT = 0x10
+
+FAT32_MASK = 0x0FFFFFFF
+FAT32_BAD = 0x0FFFFFF7
+FAT32_EOC = 0x0FFFFFF8
+
+_DIRENT = struct.Struct("<11sBBBHHHHHHHI")
+_DAYS_BEFORE_MONTH = (0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334)
+
+
+class FatError(ValueError):
+    """The volume or a directory/cluster chain on it is not consistent."""
+
+
+class FatEntry:
+    __slots__ = ("name", "is_dir", "size", "mtime", "cluster")
+
+    def __init__(self, name: str, is_dir: bool, size: int, mtime: int, cluster: int) -> None:
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.cluster = cluster
+
+
+def fat_time_to_unix(date: int, time_: int, tz_offset: int = 0) -> int:
+    """FAT date/time words to epoch seconds, the way the kernel's vfat does."""
+    year = 1980 + (date >> 9)
+    month = min(12, max(1, (date >> 5) & 0x0F))
+    day = max(1, date & 0x1F) - 1
+    days = (year - 1970) * 365 + (year - 1969) // 4 + _DAYS_BEFORE_MONTH[month] + day
+    if month > 2 and year % 4 == 0:
+        days += 1
+    secs = (time_ >> 11) * 3600 + ((time_ >> 5) & 0x3F) * 60 + (time_ & 0x1F) * 2
+    return days * 86400 + secs - tz_offset
+
+
+def _lfn_checksum(short: bytes) -> int:
+    s = 0
+    for b in short:
+        s = (((s & 1) << 7) + (s >> 1) + b) & 0xFF
+    return s
+
+
+def _short_name(raw: bytes, lcase: int) -> str:
+    base = raw[:8].rstrip(b" ")
+    ext = raw[8:11].rstrip(b" ")
+    if base[:1] == b"\x05":
+        base = b"\xe5" + base[1:]
+    name = base.decode("cp437")
+    if lcase & CASE_LOWER_BASE:
+        name = name.lower()
+    if ext:
+        e = ext.decode("cp437")
+        name += "." + (e.lower() if lcase & CASE_LOWER_EXT else e)
+    return name
+
+
+class ExtentReader(io.RawIOBase):
+    """Raw reader over a file's cluster runs on the device, via os.preadv.
+
+    Each readinto fills the caller's buffer with as few positioned reads as
+    the runs allow (one per run crossed), so a contiguous file is read in
+    COPY_CHUNK_BYTES requests instead of the vfat driver's page-sized ones.
+    The device fd belongs to the FatVolume and stays open.
+    """
+
+    def __init__(self, fd: int, extents: list[tuple[int, int]], size: int) -> None:
+        super().__init__()
+        self.fd = fd
+        self.extents = extents
+        self.size = size
+        self._index = 0
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return sum(length for _, length in self.extents[:self._index]) + self._pos
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        """Position at byte `pos` of the file (SEEK_SET only); used to resume."""
+        if whence != io.SEEK_SET or pos < 0:
+            raise io.UnsupportedOperation("ExtentReader seeks from the start only")
+        self._index, self._pos = 0, 0
+        left = min(pos, self.size)
+        while left and self._index < len(self.extents):
+            length = self.extents[self._index][1]
+            if left < length:
+                self._pos = left
+                break
+            left -= length
+            self._index += 1
+        return self.tell()
+
+    def readinto(self, buf) -> int:
+        view = memoryview(buf).cast("B")
+        filled = 0
+        while filled < len(view) and self._index < len(self.extents):
+            start, length = self.extents[self._index]
+            want = min(len(view) - filled, length - self._pos)
+            n = os.preadv(self.fd, [view[filled:filled + want]], start + self._pos)
+            if n <= 0:
+                raise FatError("short read from device")
+            filled += n
+            self._pos += n
+            if self._pos == length:
+                self._index += 1
+                self._pos = 0
+        return filled
+
+
+class FatVolume:
+    """A FAT32 filesystem starting `offset` bytes into `path`.
+
+    Implements the scanner interface of fsops.MountTree (scan_level,
+    scan_tree, scan_files, subdirs). If `fallback` is given, a directory that
+    cannot be parsed consistently is listed through it instead of failing the
+    whole scan.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        offset: int = 0,
+        tz_offset: int = 0,
+        fallback=None,
+    ) -> None:
+        self.path = str(path)
+        self.offset = offset
+        self.tz_offset = tz_offset
+        self.fallback = fallback
+        self.fd = os.open(self.path, os.O_RDONLY)
+        try:
+            length = os.lseek(self.fd, 0, os.SEEK_END)
+            if length < offset + 512:
+                raise FatError("device smaller than its boot sector")
+            self.mm = mmap.mmap(self.fd, length, prot=mmap.PROT_READ)
+        except BaseException:
+            os.close(self.fd)
+            raise
+        try:
+            self._parse_boot_sector(length)
+        except BaseException:
+            self.close()
+            raise
+        self._dir_cache: dict[str, list[FatEntry]] = {}
+
+    def _parse_boot_sector(self, length: int) -> None:
+        bs = self.mm[self.offset:self.offset + 512]
+        if bs[510:512] != b"\x55\xaa":
+            raise FatError("missing boot sector signature")
+        (bps, spc, reserved, nfats, root_entries, total16, _media, fat16_len) = struct.unpack_from(
+            "<HBHBHHBH", bs, 11
+        )
+        total32, fat32_len, _flags, _ver, root_cluster = struct.unpack_from("<IIHHI", bs, 32)
+        if bps not in (512, 1024, 2048, 4096) or spc == 0 or spc & (spc - 1):
+            raise FatError("invalid BPB geometry")
+        if fat16_len != 0 or root_entries != 0 or fat32_len == 0:
+            raise FatError("not a FAT32 volume")
+        total = total16 or total32
+        self.bytes_per_sector = bps
+        self.cluster_size = bps * spc
+        self.fat_offset = self.offset + reserved * bps
+        self.fat_bytes = fat32_len * bps
+        self.data_offset = self.fat_offset + nfats * self.fat_bytes
+        data_sectors = total - reserved - nfats * fat32_len
+        self.cluster_count = data_sectors // spc
+        self.root_cluster = root_cluster
+        self.end = self.offset + total * bps
+        if self.end > length or self.cluster_count <= 0:
+            raise FatError("volume extends past the device")
+        if (self.cluster_count + 2) * 4 > self.fat_bytes:
+            raise FatError("FAT too small for the cluster count")
+        if not self.valid_cluster(root_cluster):
+            raise FatError("invalid root cluster")
+
+    def close(self) -> None:
+        mm = getattr(self, "mm", None)
+        if mm is not None:
+            mm.close()
+            self.mm = None
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __enter__(self) -> "FatVolume":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # -- clusters ---------------------------------------------------------
+
+    def valid_cluster(self, cluster: int) -> bool:
+        return 2 <= cluster < self.cluster_count + 2
+
+    def cluster_offset(self, cluster: int) -> int:
+        """Absolute byte offset of a data cluster in the device."""
+        return self.data_offset + (cluster - 2) * self.cluster_size
+
+    def next_cluster(self, cluster: int) -> int:
+        return struct.unpack_from("<I", self.mm, self.fat_offset + 4 * cluster)[0] & FAT32_MASK
+
+    def chain(self, start: int, limit: int | None = None) -> list[int]:
+        """Cluster chain from `start`; raises FatError on loops or bad links."""
+        if limit is None:
+            limit = self.cluster_count
+        clusters: list[int] = []
+        cluster = start
+        while True:
+            if not self.valid_cluster(cluster):
+                raise FatError(f"cluster {cluster} out of range")
+            clusters.append(cluster)
+            if len(clusters) > limit:
+                raise FatError("cluster chain longer than expected (loop?)")
+            nxt = self.next_cluster(cluster)
+            if nxt >= FAT32_EOC:
+                return clusters
+            if nxt == FAT32_BAD or nxt < 2:
+                raise FatError(f"broken chain after cluster {cluster}")
+            cluster = nxt
+
+    def dir_chain(self, rel: str) -> list[int]:
+        """Clusters holding directory `rel` ("" is the root)."""
+        if not rel:
+            return self.chain(self.root_cluster)
+        entry = self.lookup(rel)
+        if not entry.is_dir:
+            raise FileNotFoundError(rel)
+        return self.chain(entry.cluster) if entry.cluster else []
+
+    def data_spans(self, ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """[first, last] spans of clusters whose data lies in the ranges.
+
+        `ranges` are (device offset, length) on the device FatVolume reads.
+        """
+        spans: list[tuple[int, int]] = []
+        last = self.cluster_count + 1
+        for start, length in ranges:
+            lo, hi = max(start, self.data_offset), min(start + length, self.end)
+            if lo < hi:
+                first = (lo - self.data_offset) // self.cluster_size + 2
+                final = (hi - 1 - self.data_offset) // self.cluster_size + 2
+                spans.append((first, min(last, final)))
+        return spans
+
+    def fat_spans(self, ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """[first, last] spans of clusters whose FAT entry lies in the ranges.
+
+        A changed block of the FAT covers thousands of entries, so a hit here
+        only means the chain may have changed (a directory that grew into a
+        new cluster shows up only this way: its old clusters are not
+        rewritten).
+        """
+        spans: list[tuple[int, int]] = []
+        last = self.cluster_count + 1
+        for start, length in ranges:
+            end = start + length
+            # Either FAT copy: fold the offsets into the first one.
+            for copy_start in range(self.fat_offset, self.data_offset, self.fat_bytes):
+                a = max(start, copy_start) - copy_start
+                b = min(end, copy_start + self.fat_bytes) - copy_start
+                if a < b and max(2, a // 4) <= min(last, (b - 1) // 4):
+                    spans.append((max(2, a // 4), min(last, (b - 1) // 4)))
+        return spans
+
+    def extents(self, start: int, size: int) -> list[tuple[int, int]]:
+        """(device offset, length) runs holding the `size` bytes from `start`.
+
+        The chain must be exactly as long as the size needs; anything else
+        means the directory entry and the FAT disagree.
+        """
+        if size == 0:
+            return []
+        need = (size + self.cluster_size - 1) // self.cluster_size
+        clusters = self.chain(start, limit=need)
+        if len(clusters) != need:
+            raise FatError(f"chain of {len(clusters)} clusters for {size} bytes")
+        runs: list[tuple[int, int]] = []
+        run_start = prev = clusters[0]
+        for c in clusters[1:] + [0]:
+            if c == prev + 1:
+                prev = c
+                continue
+            runs.append(
+                (self.cluster_offset(run_start), (prev - run_start + 1) * self.cluster_size)
+            )
+            run_start = prev = c
+        off, length = runs[-1]
+        runs[-1] = (off, length - (need * self.cluster_size - size))
+        return runs
+
+    def open_file(self, rel: str, size: int, mtime: int) -> ExtentReader:
+        """Reader for `rel` straight from the device.
+
+        Raises FatError (or FileNotFoundError) unless the entry still has the
+        scanned size and mtime and a consistent chain, so the caller can fall
+        back to reading through the mount.
+        """
+        entry = self.lookup(rel)
+        if entry.is_dir or entry.size != size or entry.mtime != mtime:
+            raise FatError(f"{rel} does not match the scanned entry")
+        if size and not self.valid_cluster(entry.cluster):
+            raise FatError(f"{rel} has no valid first cluster")
+        return ExtentReader(self.fd, self.extents(entry.cluster, size), size)
+
+    # -- directories ------------------------------------------------------
+
+    def read_dir(self, cluster: int) -> list[FatEntry]:
+        entries: list[FatEntry] = []
+        mm = self.mm
+        csize = self.cluster_size
+        lfn_parts: dict[int, bytes] = {}
+        lfn_sum = -1
+        for c in self.chain(cluster):
+            base = self.cluster_offset(c)
+            for pos in range(base, base + csize, 32):
+                first = mm[pos]
+                if first == 0x00:
+                    return entries
+                if first == 0xE5:
+                    lfn_parts = {}
+                    continue
+                attr = mm[pos + 11]
+                if attr & 0x3F == ATTR_LFN:
+                    seq = first & 0x1F
+                    if first & 0x40:
+                        lfn_parts = {}
+                        lfn_sum = mm[pos + 13]
+                    elif mm[pos + 13] != lfn_sum:
+                        lfn_parts = {}
+                        continue
+                    lfn_parts[seq] = (
+                        mm[pos + 1:pos + 11] + mm[pos + 14:pos + 26] + mm[pos + 28:pos + 32]
+                    )
+                    continue
+                (raw, attr, lcase, _cms, _ct, _cd, _ad, hi, mtime_t, mtime_d, lo, size) = (
+                    _DIRENT.unpack_from(mm, pos)
+                )
+                parts, lfn_parts = lfn_parts, {}
+                if attr & ATTR_VOLUME_ID or raw[:1] == b".":
+                    continue
+                name = None
+                if parts and lfn_sum == _lfn_checksum(raw) and set(parts) == set(
+                    range(1, len(parts) + 1)
+                ):
+                    name = self._long_name(parts)
+                if name is None:
+                    name = _short_name(raw, lcase)
+                entries.append(
+                    FatEntry(
+                        name,
+                        bool(attr & ATTR_DIRECTORY),
+                        0 if attr & ATTR_DIRECTORY else size,
+                        fat_time_to_unix(mtime_d, mtime_t, self.tz_offset),
+                        (hi << 16) | lo,
+                    )
+                )
+        return entries
+
+    @staticmethod
+    def _long_name(parts: dict[int, bytes]) -> str:
+        data = b"".join(parts[i] for i in range(1, len(parts) + 1))
+        end = len(data)
+        for i in range(0, len(data), 2):
+            if data[i:i + 2] == b"\x00\x00":
+                end = i
+                break
+        try:
+            return data[:end].decode("utf-16-le")
+        except UnicodeDecodeError as exc:
+            # The kernel would show something else for a broken name; do not
+            # guess, let the caller fall back to the mounted listing.
+            raise FatError("undecodable long name") from exc
+
+    def _entries(self, rel: str) -> list[FatEntry]:
+        cached = self._dir_cache.get(rel)
+        if cached is not None:
+            return cached
+        if not rel:
+            entries = self.read_dir(self.root_cluster)
+        else:
+            parent, _, leaf = rel.rpartition("/")
+            entry = self._find(self._entries(parent), leaf)
+            if entry is None or not entry.is_dir:
+                raise FileNotFoundError(rel)
+            entries = [] if entry.cluster == 0 else self.read_dir(entry.cluster)
+        self._dir_cache[rel] = entries
+        return entries
+
+    @staticmethod
+    def _find(entries: list[FatEntry], name: str) -> FatEntry | None:
+        folded = None
+        for e in entries:
+            if e.name == name:
+                return e
+            if folded is None and e.name.casefold() == name.casefold():
+                folded = e
+        return folded
+
+    def lookup(self, rel: str) -> FatEntry:
+        parent, _, leaf = rel.strip("/").rpartition("/")
+        entry = self._find(self._entries(parent), leaf)
+        if entry is None:
+            raise FileNotFoundError(rel)
+        return entry
+
+    # -- scanner interface (see fsops.MountTree) --------------------------
+
+    def scan_level(self, rel: str = "") -> tuple[list[FileRecord], list[str]]:
+        try:
+            entries = self._entries(rel)
+        except FileNotFoundError:
+            return [], []
+        except FatError:
+            if self.fallback is None:
+                raise
+            return self.fallback.scan_level(rel)
+        prefix = f"{rel}/" if rel else ""
+        files: list[FileRecord] = []
+        dirs: list[str] = []
+        for e in entries:
+            if e.is_dir:
+                if e.name not in SKIP_DIRS:
+                    dirs.append(e.name)
+            else:
+                files.append(FileRecord(prefix + e.name, e.size, e.mtime))
+        return files, dirs
+
+    def scan_tree(self, rel: str = "") -> Iterator[tuple[str, list[FileRecord], list[str]]]:
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            files, dirs = self.scan_level(current)
+            yield current, files, dirs
+            prefix = f"{current}/" if current else ""
+            stack.extend(prefix + d for d in reversed(dirs))
+
+    def scan_files(self, rel: str = "", recursive: bool = True) -> Iterator[FileRecord]:
+        if not recursive:
+            yield from self.scan_level(rel)[0]
+            return
+        for _, files, _ in self.scan_tree(rel):
+            yield from files
+
+    def subdirs(self, rel: str = "", with_mtime: bool = True) -> list[tuple[str, int]]:
+        try:
+            entries = self._entries(rel)
+        except FileNotFoundError:
+            return []
+        except FatError:
+            if self.fallback is None:
+                raise
+            return self.fallback.subdirs(rel, with_mtime)
+        return [(e.name, e.mtime) for e in entries if e.is_dir and e.name not in SKIP_DIRS]
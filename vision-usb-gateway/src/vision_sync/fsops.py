@@ -1,24 +1,111 @@
+import ctypes
 import hashlib
 import os
+import queue
+import threading
 import time
 from collections.abc import Iterator
 from pathlib import Path
+from typing import NamedTuple
 
 SKIP_DIRS = {"System Volume Information", "$RECYCLE.BIN"}
+DEFAULT_HASH_ALGO = "sha256"
 
 
-def iter_files(root: Path) -> Iterator[tuple[Path, os.stat_result]]:
-    for dirpath, dirnames, filenames in os.walk(root, topdown=True):
-        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
-        for name in filenames:
-            p = Path(dirpath) / name
-            try:
-                st = p.stat()
-            except FileNotFoundError:
-                continue
-            if not p.is_file():
-                continue
-            yield p, st
+class FileRecord(NamedTuple):
+    """A regular file found by the scanner; `rel` is relative to the scan base."""
+
+    rel: str
+    size: int
+    mtime: int
+
+
+def scan_level(base: Path, rel: str = "") -> tuple[list[FileRecord], list[str]]:
+    """List one directory: its regular files and its subdirectory names.
+
+    Costs one scandir plus one lstat per file. The file/dir split comes from
+    the dirent type (no syscall) and size/mtime from DirEntry.stat, instead of
+    the separate stat + is_file calls the os.walk scanner made per file. That
+    difference is most of a scan on vfat over a loop/dm device. SKIP_DIRS are
+    dropped; symlinks and special files are ignored.
+    """
+    files: list[FileRecord] = []
+    dirs: list[str] = []
+    prefix = f"{rel}/" if rel else ""
+    try:
+        with os.scandir(base / rel if rel else base) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIP_DIRS:
+                            dirs.append(entry.name)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                files.append(FileRecord(prefix + entry.name, st.st_size, int(st.st_mtime)))
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return files, dirs
+
+
+def scan_tree(base: Path, rel: str = "") -> Iterator[tuple[str, list[FileRecord], list[str]]]:
+    """Walk top-down from `rel`, yielding (dir_rel, files, subdir_names).
+
+    Like os.walk, a caller may prune the yielded subdir list in place.
+    """
+    stack = [rel]
+    while stack:
+        current = stack.pop()
+        files, dirs = scan_level(base, current)
+        yield current, files, dirs
+        prefix = f"{current}/" if current else ""
+        stack.extend(prefix + d for d in reversed(dirs))
+
+
+def scan_files(base: Path, rel: str = "", recursive: bool = True) -> Iterator[FileRecord]:
+    if not recursive:
+        yield from scan_level(base, rel)[0]
+        return
+    for _, files, _ in scan_tree(base, rel):
+        yield from files
+
+
+class MountTree:
+    """Scanner over a mounted directory; fat.FatVolume offers the same methods."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def scan_level(self, rel: str = "") -> tuple[list[FileRecord], list[str]]:
+        return scan_level(self.root, rel)
+
+    def scan_tree(self, rel: str = "") -> Iterator[tuple[str, list[FileRecord], list[str]]]:
+        return scan_tree(self.root, rel)
+
+    def scan_files(self, rel: str = "", recursive: bool = True) -> Iterator[FileRecord]:
+        return scan_files(self.root, rel, recursive)
+
+    def subdirs(self, rel: str = "", with_mtime: bool = True) -> list[tuple[str, int]]:
+        """(name, mtime) of each subdirectory; mtime is 0 unless requested."""
+        out: list[tuple[str, int]] = []
+        try:
+            with os.scandir(self.root / rel if rel else self.root) as it:
+                for entry in it:
+                    if entry.name in SKIP_DIRS or not entry.is_dir(follow_symlinks=False):
+                        continue
+                    mtime = 0
+                    if with_mtime:
+                        try:
+                            mtime = int(entry.stat(follow_symlinks=False).st_mtime)
+                        except FileNotFoundError:
+                            continue
+                    out.append((entry.name, mtime))
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        return out
 
 
 def safe_join(base: Path, rel: Path) -> Path:
@@ -35,9 +122,8 @@ def compute_manifest(root: Path) -> str:
     if not root.exists():
         return ""
     entries: list[str] = []
-    for path, st in iter_files(root):
-        rel = path.relative_to(root).as_posix()
-        entries.append(f"{rel}\t{int(st.st_size)}\t{int(st.st_mtime)}")
+    for rec in scan_files(root):
+        entries.append(f"{rec.rel}\t{rec.size}\t{rec.mtime}")
     entries.sort()
     h = hashlib.sha256()
     for line in entries:
@@ -46,20 +132,211 @@ def compute_manifest(root: Path) -> str:
     return h.hexdigest()
 
 
-def atomic_copy(src: Path, dest_dir: Path, final_name: str, chunk_size: int) -> tuple[Path, str]:
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    temp = dest_dir / f".{final_name}.{os.getpid()}.{int(time.time())}.tmp"
-    h = hashlib.sha256()
-    with src.open("rb") as fsrc, temp.open("wb") as fdst:
+def new_hasher(algo: str):
+    """hashlib object for a SYNC_HASH_ALGO name.
+
+    Plain hashlib names (sha256, sha1, md5, blake2b, ...) are used as-is;
+    blake2b-<bits> / blake2s-<bits> select a shorter BLAKE2 digest. Digests
+    name collision copies by their first 8 hex chars, so 32 bits is the floor.
+    """
+    name = algo.strip().lower()
+    family, _, bits = name.partition("-")
+    if family in ("blake2b", "blake2s") and bits:
+        size = int(bits) // 8 if bits.isdigit() and int(bits) % 8 == 0 else 0
+        limit = 64 if family == "blake2b" else 32
+        if not 4 <= size <= limit:
+            raise ValueError(f"unsupported hash algorithm: {algo}")
+        return hashlib.new(family, digest_size=size)
+    if name.startswith("shake_") or name not in hashlib.algorithms_available:
+        raise ValueError(f"unsupported hash algorithm: {algo}")
+    return hashlib.new(name)
+
+
+# Buffers in flight per pipelined copy: one being read/hashed, one being
+# written, one spare so neither side waits on a buffer hand-back.
+COPY_PIPELINE_BUFFERS = 3
+
+_buffers = threading.local()
+
+
+def _copy_buffers(chunk_size: int, count: int) -> list[bytearray]:
+    """Per-thread chunk buffers, allocated once and reused for every copy."""
+    pool = getattr(_buffers, "pool", None)
+    if pool is None or len(pool[0]) != chunk_size or len(pool) < count:
+        pool = [bytearray(chunk_size) for _ in range(count)]
+        _buffers.pool = pool
+    return pool[:count]
+
+
+def _write_all(fdst, view: memoryview) -> None:
+    # Unbuffered FileIO.write may write less than asked.
+    while view:
+        view = view[fdst.write(view):]
+
+
+def _copy_inline(fsrc, fdst, h, buf: bytearray) -> None:
+    view = memoryview(buf)
+    while True:
+        n = fsrc.readinto(buf)
+        if not n:
+            break
+        _write_all(fdst, view[:n])
+        h.update(view[:n])
+
+
+def _copy_overlapped(fsrc, fdst, h, bufs: list[bytearray]) -> None:
+    """Read+hash on a helper thread while this thread writes the previous chunk.
+
+    hashlib and file I/O drop the GIL for large buffers, so reading the FAT
+    snapshot and writing the mirror really run at the same time. Chunks are
+    hashed in read order, so the digest is the same as the inline loop's.
+    """
+    free: queue.Queue = queue.Queue()
+    filled: queue.Queue = queue.Queue()
+    for buf in bufs:
+        free.put(buf)
+    stop = threading.Event()
+
+    def reader() -> None:
+        try:
+            while not stop.is_set():
+                buf = free.get()
+                if buf is None:
+                    break
+                n = fsrc.readinto(buf)
+                if not n:
+                    filled.put((None, 0))
+                    return
+                h.update(memoryview(buf)[:n])
+                filled.put((buf, n))
+        except BaseException as exc:
+            filled.put((exc, 0))
+
+    thread = threading.Thread(target=reader, name="copy-reader", daemon=True)
+    thread.start()
+    try:
         while True:
-            chunk = fsrc.read(chunk_size)
-            if not chunk:
+            buf, n = filled.get()
+            if buf is None:
                 break
-            fdst.write(chunk)
-            h.update(chunk)
-        fdst.flush()
-        os.fsync(fdst.fileno())
-    digest = h.hexdigest()
+            if isinstance(buf, BaseException):
+                raise buf
+            _write_all(fdst, memoryview(buf)[:n])
+            free.put(buf)
+    finally:
+        stop.set()
+        free.put(None)
+        thread.join()
+
+
+def copy_to_temp(
+    src: Path,
+    dest_dir: Path,
+    name: str,
+    chunk_size: int,
+    hash_algo: str = DEFAULT_HASH_ALGO,
+    fsync: bool = True,
+    reader=None,
+    partial=None,
+) -> tuple[Path, str]:
+    """Copy `src` into a hidden temp file in `dest_dir`; returns (temp, digest).
+
+    With fsync=False the caller owns durability (see syncfs()) and must not
+    rename the temp into place before the data is flushed. `reader` replaces
+    opening `src`: any raw stream with readinto() and a `size` attribute
+    (fat.ExtentReader). The temp is removed if the copy fails.
+
+    With a `partial` (resume.PartialCopy) the temp is its part file instead:
+    the verified prefix left by an earlier attempt is hashed, not re-read
+    from `src` (only its head and tail are compared with it, and the copy
+    starts over if they differ), the copy continues after it, and a failed
+    copy keeps the part file for the next attempt. The caller drops its
+    registry entry (PartialCopies.finish) only once the part is renamed into
+    place.
+    """
+    h = new_hasher(hash_algo)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    done = 0
+    if partial is not None:
+        temp = partial.temp
+        h, done = partial.resume(h, chunk_size)
+    else:
+        temp = dest_dir / f".{name}.{os.getpid()}.{int(time.time())}.tmp"
+    try:
+        with (
+            reader if reader is not None else open(src, "rb", buffering=0)
+        ) as fsrc, open(temp, "r+b" if done else "wb", buffering=0) as fdst:
+            size = reader.size if reader is not None else os.fstat(fsrc.fileno()).st_size
+            if done and not partial.same_source(fsrc, done, chunk_size):
+                partial.restart()
+                fdst.truncate(0)
+                fsrc.seek(0)
+                h, done = new_hasher(hash_algo), 0
+            if done:
+                fsrc.seek(done)
+                fdst.seek(done)
+            out = partial.track(fdst) if partial is not None else fdst
+            if size - done >= 2 * chunk_size:
+                bufs = _copy_buffers(chunk_size, COPY_PIPELINE_BUFFERS)
+                _copy_overlapped(fsrc, out, h, bufs)
+            else:
+                _copy_inline(fsrc, out, h, _copy_buffers(chunk_size, 1)[0])
+            if fsync:
+                os.fsync(fdst.fileno())
+    except BaseException:
+        if partial is None:
+            temp.unlink(missing_ok=True)
+        raise
+    return temp, h.hexdigest()
+
+
+def dir_digest(files: list[FileRecord]) -> str:
+    """Digest of one directory's own files (names, sizes, mtimes), order-free."""
+    h = hashlib.sha256()
+    for rec in sorted(files):
+        h.update(f"{rec.rel}\t{rec.size}\t{rec.mtime}\n".encode())
+    return h.hexdigest()
+
+
+def atomic_copy(
+    src: Path,
+    dest_dir: Path,
+    final_name: str,
+    chunk_size: int,
+    hash_algo: str = DEFAULT_HASH_ALGO,
+) -> tuple[Path, str]:
+    temp, digest = copy_to_temp(src, dest_dir, final_name, chunk_size, hash_algo)
     final = dest_dir / final_name
     os.rename(temp, final)
     return final, digest
+
+
+_libc = None
+
+
+def syncfs(path: Path) -> bool:
+    """Flush the whole filesystem holding `path` with one syncfs(2) call.
+
+    Returns False where syncfs is unavailable (no glibc symbol, or the call
+    fails), so the caller can fall back to fsyncing its files one by one.
+    """
+    global _libc
+    try:
+        if _libc is None:
+            _libc = ctypes.CDLL(None, use_errno=True)
+        fn = _libc.syncfs
+    except (OSError, AttributeError):
+        return False
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        return fn(fd) == 0
+    finally:
+        os.close(fd)
+
+
+def fsync_path(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fdatasync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,123 @@
+"""Partition offset of the USB LVs, cached by partition-table identity.
+
+Every cycle needs the byte offset of the FAT partition inside the active LV
+to mount the snapshot with loop,offset. sfdisk/lsblk answer it with two
+spawns per cycle for a value that only changes when the host repartitions
+the drive. The first sectors of the LV (MBR, and for GPT the header and
+entry array) are read and parsed here instead, and the result is kept in a
+small JSON file keyed by LV path and a digest of those sectors, so a new
+partition table is noticed without trusting a stale offset.
+"""
+
+import hashlib
+import json
+import os
+import struct
+from collections.abc import Callable
+from pathlib import Path
+
+GEOMETRY_VERSION = 1
+SECTOR = 512
+# Protective MBR, GPT header and a 128 x 128-byte entry array.
+PTABLE_BYTES = 34 * SECTOR
+
+
+def read_ptable(dev: str) -> bytes:
+    fd = os.open(dev, os.O_RDONLY)
+    try:
+        return os.pread(fd, PTABLE_BYTES, 0)
+    finally:
+        os.close(fd)
+
+
+def _looks_like_fat(head: bytes) -> bool:
+    return head[510:512] == b"\x55\xaa" and (head[54:57] == b"FAT" or head[82:87] == b"FAT32")
+
+
+def parse_partition_offset(head: bytes) -> int | None:
+    """Byte offset of the first partition described by `head`.
+
+    None means the LV holds a filesystem without a partition table (mount at
+    offset 0). Raises ValueError for a layout this parser does not know; the
+    caller then asks sfdisk.
+    """
+    if len(head) < SECTOR or head[510:512] != b"\x55\xaa":
+        raise ValueError("no boot signature")
+    if _looks_like_fat(head):
+        return None
+    for i in range(4):
+        entry = head[446 + 16 * i:446 + 16 * (i + 1)]
+        ptype = entry[4]
+        if not ptype:
+            continue
+        if ptype == 0xEE:
+            return _gpt_offset(head)
+        (start,) = struct.unpack_from("<I", entry, 8)
+        if not start:
+            raise ValueError("partition starts at sector 0")
+        return start * SECTOR
+    raise ValueError("empty partition table")
+
+
+def _gpt_offset(head: bytes) -> int:
+    if head[SECTOR:SECTOR + 8] != b"EFI PART":
+        raise ValueError("protective MBR without GPT header")
+    entries_lba, count, entry_size = struct.unpack_from("<QII", head, SECTOR + 72)
+    base = entries_lba * SECTOR
+    for i in range(count):
+        pos = base + i * entry_size
+        if pos + entry_size > len(head):
+            break
+        entry = head[pos:pos + entry_size]
+        if entry[:16] == bytes(16):
+            continue
+        (first_lba,) = struct.unpack_from("<Q", entry, 32)
+        return first_lba * SECTOR
+    raise ValueError("no GPT partition in the first sectors")
+
+
+class GeometryCache:
+    """{dev: {"ptable": sha256 of the first sectors, "offset": int | None}}."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.devices: dict[str, dict] = {}
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            data = {}
+        if isinstance(data, dict) and data.get("version") == GEOMETRY_VERSION:
+            devices = data.get("devices", {})
+            if isinstance(devices, dict):
+                self.devices = {str(k): v for k, v in devices.items() if isinstance(v, dict)}
+
+    def offset(self, dev: str, probe: Callable[[str], int | None]) -> int | None:
+        """Partition offset of `dev`; `probe` (sfdisk/lsblk) only on a miss.
+
+        A device that cannot be read is probed every time and not cached.
+        """
+        try:
+            head = read_ptable(dev)
+        except OSError:
+            return probe(dev)
+        ptable = hashlib.sha256(head).hexdigest()
+        known = self.devices.get(dev)
+        if known and known.get("ptable") == ptable:
+            return known.get("offset")
+        try:
+            offset = parse_partition_offset(head)
+        except ValueError:
+            offset = probe(dev)
+            if offset is None:
+                # Probe failed too; None would read as "no partition table".
+                return None
+        self.devices[dev] = {"ptable": ptable, "offset": offset}
+        self.save()
+        return offset
+
+    def save(self) -> None:
+        payload = {"version": GEOMETRY_VERSION, "devices": self.devices}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload, sort_keys=True))
+        os.replace(tmp, self.path)
@@ -0,0 +1,76 @@
+"""Block-layer write counters of the active USB LV.
+
+/sys/block/dm-N/stat counts sectors the host wrote through the gadget. The
+activity scheduler uses it to time cycles; the sync uses it to prove the LV
+idle between two snapshots. Counters reset on reboot and dm-N numbers are
+reassigned, so a saved sample only compares equal within one boot_id and
+one LV/dm pair.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+# /sys/block/<dev>/stat fields: 6 sectors written, 8 I/Os in flight.
+STAT_WRITE_SECTORS = 6
+STAT_IN_FLIGHT = 8
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+# Device path of the LV the gadget currently exports (usb-gadget.sh writes it).
+ACTIVE_FILE = "/run/vision-usb-active"
+
+
+class WriteSample(NamedTuple):
+    boot_id: str
+    lv: str
+    dev: str
+    written: int
+
+
+def stat_path(dev: str) -> Path:
+    """/sys/block/dm-N/stat behind an LV path like /dev/vg0/usb_0."""
+    return Path("/sys/block") / os.path.basename(os.path.realpath(dev)) / "stat"
+
+
+def read_stat(path: Path) -> tuple[int, int]:
+    """(sectors written, I/Os in flight)."""
+    fields = path.read_text().split()
+    return int(fields[STAT_WRITE_SECTORS]), int(fields[STAT_IN_FLIGHT])
+
+
+def written_sectors(path: Path) -> int:
+    return read_stat(path)[0]
+
+
+def sample(lv: str) -> WriteSample | None:
+    """Counter of `lv` now, or None if it is unreadable or I/O is in flight."""
+    try:
+        boot_id = Path(BOOT_ID_FILE).read_text().strip()
+        path = stat_path(lv)
+        written, in_flight = read_stat(path)
+    except (OSError, ValueError, IndexError):
+        return None
+    if in_flight:
+        return None
+    return WriteSample(boot_id, lv, path.parent.name, written)
+
+
+def load_sample(path: Path) -> WriteSample | None:
+    try:
+        data = json.loads(path.read_text())
+        return WriteSample(
+            str(data["boot_id"]), str(data["lv"]), str(data["dev"]), int(data["written"])
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_sample(path: Path, current: WriteSample | None) -> None:
+    """Persist the sample of the snapshot just synced; None forgets it."""
+    if current is None:
+        path.unlink(missing_ok=True)
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(current._asdict()))
+    os.replace(tmp, path)
@@ -0,0 +1,28 @@
+"""subprocess.run with a per-cycle count of what the sync spawned.
+
+The snapshot pipeline shells out to LVM, mount and partition tools; on the
+fast timer those spawns are a large part of a cycle that finds nothing to
+do. Every call goes through run() so the cycle summary can say how many
+there were and which.
+"""
+
+import os
+import subprocess
+from collections import Counter
+
+spawned: Counter = Counter()
+
+
+def run(args: list[str], **kwargs) -> subprocess.CompletedProcess:
+    spawned[os.path.basename(args[0])] += 1
+    return subprocess.run(args, **kwargs)
+
+
+def reset() -> None:
+    spawned.clear()
+
+
+def summary() -> str:
+    """`total=N tool=n ...`, most frequent first."""
+    detail = " ".join(f"{name}={n}" for name, n in spawned.most_common())
+    return f"total={sum(spawned.values())}" + (f" {detail}" if detail else "")
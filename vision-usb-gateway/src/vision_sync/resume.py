@@ -0,0 +1,355 @@
+"""Resumable copies of large files across cycles.
+
+A file of at least SYNC_RESUME_MIN_MB is copied into a fixed temp name,
+`.<name>.<size>-<mtime>.part`, instead of the per-attempt pid/time temp.
+Every SYNC_RESUME_SEGMENT_MB the part file is fdatasync'd and the segment's
+digest is recorded in SYNC_RESUME_FILE (a JSON registry in the state dir,
+keyed by the part path). A later attempt on the same source identity
+re-reads the part file, keeps the prefix whose segment digests still match
+(hashing it into the file digest on the way), truncates the rest and
+continues from there; only that suffix is read from the snapshot.
+
+The registry is also how part files are cleaned up: a part whose source
+shows up with another size/mtime, or that was not touched for
+SYNC_RESUME_TTL_DAYS (source deleted, LV rotated out), is removed together
+with its entry. An entry is only dropped once its part is renamed into
+place, so a cycle killed between a finished copy and its (batched) rename
+continues from the complete part. Hidden temps no entry tracks (per-attempt
+`.tmp` files of such a cycle) are swept from raw/ once past the same TTL.
+
+Growing files (SYNC_PROGRESSIVE_GLOBS) use the same machinery with a
+visible `<name>.partial` that is not tied to one size/mtime: each cycle
+appends what the host wrote since the last one (PartialCopy.extend) and
+records the digest of the trailing, not yet full segment too. Once the
+file is stable the normal copy resumes from that partial, so only the
+last delta is read from the snapshot.
+
+The recorded digests only prove the part file is intact, not that the
+source still holds the same bytes. Before a prefix is continued, its head
+and its last bytes are compared with the source (PartialCopy.same_source)
+and the copy starts over if either differs: that catches a truncated or
+rewritten file and a writer patching its header in place (AVI/MP4 index
+sizes). A rewrite in the middle of the prefix is not seen, so only
+append-only files belong in SYNC_PROGRESSIVE_GLOBS.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+RESUME_VERSION = 1
+# The untracked-temp sweep walks all of raw/, so it runs at most this often.
+SWEEP_INTERVAL_SEC = 86400
+# How much of a resumed prefix is compared with the source, at each end.
+HEAD_CHECK_BYTES = 1 << 20
+TAIL_CHECK_BYTES = 64 * 1024
+
+
+def _segment_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+class PartialCopies:
+    def __init__(self, path: Path, min_bytes: int, segment_bytes: int, ttl_sec: float) -> None:
+        self.path = path
+        self.min_bytes = min_bytes
+        self.segment_bytes = max(1 << 20, segment_bytes)
+        self.ttl_sec = ttl_sec
+        self.lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+        try:
+            data = json.loads(path.read_text())
+            if data.get("version") == RESUME_VERSION and isinstance(data.get("parts"), dict):
+                self.entries = data["parts"]
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def _save(self) -> None:
+        # Caller holds self.lock.
+        if not self.entries:
+            self.path.unlink(missing_ok=True)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"version": RESUME_VERSION, "parts": self.entries}))
+        os.replace(tmp, self.path)
+
+    def _drop(self, key: str) -> None:
+        Path(key).unlink(missing_ok=True)
+        self.entries.pop(key, None)
+
+    def expire(self, now: float | None = None, root: Path | None = None) -> int:
+        """Remove parts idle past the TTL and entries whose part file is gone.
+
+        With `root` (the mirror's raw/), hidden `.part`/`.tmp` files below
+        it that no entry tracks and that were not written for the TTL go
+        too; that walk runs at most once per SWEEP_INTERVAL_SEC.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            stale = [
+                key for key, entry in self.entries.items()
+                if now - float(entry.get("updated", 0)) > self.ttl_sec or not Path(key).exists()
+            ]
+            for key in stale:
+                self._drop(key)
+            if stale:
+                self._save()
+            swept = self._sweep(root, now) if root is not None else 0
+        return len(stale) + swept
+
+    def _sweep(self, root: Path, now: float) -> int:
+        # Caller holds self.lock.
+        stamp = self.path.with_name(self.path.name + ".swept")
+        try:
+            if now - stamp.stat().st_mtime < SWEEP_INTERVAL_SEC:
+                return 0
+        except FileNotFoundError:
+            pass
+        removed = 0
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                if not name.startswith(".") or not name.endswith((".part", ".tmp")):
+                    continue
+                path = os.path.join(dirpath, name)
+                if path in self.entries:
+                    continue
+                try:
+                    if now - os.lstat(path).st_mtime > self.ttl_sec:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        stamp.parent.mkdir(parents=True, exist_ok=True)
+        stamp.touch()
+        os.utime(stamp, (now, now))
+        return removed
+
+    def get(
+        self,
+        dest_dir: Path,
+        name: str,
+        rel: str,
+        size: int,
+        mtime: int,
+        algo: str,
+        growing: bool = False,
+    ):
+        """The PartialCopy for this file, or None if it is below the size floor.
+
+        A `growing` file always gets one, under a name that survives appends.
+        """
+        if growing:
+            temp = dest_dir / f"{name}.partial"
+        elif self.min_bytes <= 0 or size < self.min_bytes:
+            return None
+        else:
+            temp = dest_dir / f".{name}.{size}-{mtime}.part"
+        key = str(temp)
+        with self.lock:
+            # Same source path, other identity: that part can never finish.
+            superseded = [
+                k for k, e in self.entries.items() if e.get("rel") == rel and k != key
+            ]
+            for k in superseded:
+                self._drop(k)
+            entry = self.entries.get(key)
+            if entry is not None and (
+                entry.get("algo") != algo or int(entry.get("segment", 0)) != self.segment_bytes
+            ):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                entry = {
+                    "rel": rel, "size": size, "mtime": mtime, "algo": algo,
+                    "segment": self.segment_bytes, "digests": [], "updated": time.time(),
+                }
+                self.entries[key] = entry
+            self._save()
+        return PartialCopy(self, temp, list(entry["digests"]), entry.get("tail"))
+
+    def checkpoint(
+        self, temp: Path, digests: list[str], tail: tuple[int, str] | None = None
+    ) -> None:
+        with self.lock:
+            entry = self.entries.get(str(temp))
+            if entry is None:
+                return
+            entry["digests"] = list(digests)
+            if tail is None:
+                entry.pop("tail", None)
+            else:
+                entry["tail"] = list(tail)
+            entry["updated"] = time.time()
+            self._save()
+
+    def finish(self, temp: Path) -> None:
+        with self.lock:
+            if self.entries.pop(str(temp), None) is not None:
+                self._save()
+
+
+class PartialCopy:
+    """One resumable copy: its part file and its verified segment digests."""
+
+    def __init__(
+        self,
+        registry: PartialCopies,
+        temp: Path,
+        digests: list[str],
+        tail: list | None = None,
+    ) -> None:
+        self.registry = registry
+        self.temp = temp
+        self.digests = digests
+        self.tail = (int(tail[0]), str(tail[1])) if tail else None
+        # Hash state of the segment the next write continues (a verified tail).
+        self.seg = _segment_hasher()
+        self.seg_len = 0
+
+    def resume(self, h, chunk_size: int):
+        """Verify the part file's prefix; returns (h, length of the prefix).
+
+        The prefix is fed to `h` (if given) and the part file truncated to
+        it, or removed if nothing checks out.
+        """
+        segment = self.registry.segment_bytes
+        expected = [(segment, d) for d in self.digests]
+        if self.tail is not None:
+            expected.append(self.tail)
+        done = 0
+        verified: list[str] = []
+        self.seg, self.seg_len = _segment_hasher(), 0
+        try:
+            with open(self.temp, "rb", buffering=0) as f:
+                buf = bytearray(min(chunk_size, segment))
+                view = memoryview(buf)
+                for length, digest in expected:
+                    seg = _segment_hasher()
+                    trial = h.copy() if h is not None else None
+                    left = length
+                    while left:
+                        n = f.readinto(view[:min(len(buf), left)])
+                        if not n:
+                            break
+                        seg.update(view[:n])
+                        if trial is not None:
+                            trial.update(view[:n])
+                        left -= n
+                    if left or seg.hexdigest() != digest:
+                        break
+                    h = trial
+                    done += length
+                    if length == segment:
+                        verified.append(digest)
+                    else:
+                        self.seg, self.seg_len = seg, length
+        except FileNotFoundError:
+            pass
+        self.digests = verified
+        self.tail = None
+        if done:
+            os.truncate(self.temp, done)
+        else:
+            self.temp.unlink(missing_ok=True)
+        return h, done
+
+    def extend(self, fsrc, chunk_size: int) -> int:
+        """Append what `fsrc` has past the verified prefix; returns bytes added.
+
+        A growing file is expected to only be appended to: if the head or the
+        bytes just before the prefix end no longer match the source, or the
+        source got shorter, the partial starts over.
+        """
+        _, done = self.resume(None, chunk_size)
+        if done and not self.same_source(fsrc, done, chunk_size):
+            self.restart()
+            done = 0
+        fsrc.seek(done)
+        added = 0
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        with open(self.temp, "r+b" if done else "wb", buffering=0) as fdst:
+            fdst.seek(done)
+            out = self.track(fdst)
+            while True:
+                n = fsrc.readinto(buf)
+                if not n:
+                    break
+                chunk = view[:n]
+                while chunk:
+                    chunk = chunk[out.write(chunk):]
+                added += n
+            os.fdatasync(fdst.fileno())
+            tail = (out.seg_len, out.seg.hexdigest()) if out.seg_len else None
+        self.registry.checkpoint(self.temp, self.digests, tail)
+        return added
+
+    def same_source(self, fsrc, done: int, chunk_size: int) -> bool:
+        """Whether the prefix's head and last bytes still match `fsrc`."""
+        tail = min(done, chunk_size, TAIL_CHECK_BYTES)
+        with open(self.temp, "rb") as f:
+            return _same_range(fsrc, f, 0, min(done, HEAD_CHECK_BYTES)) and _same_range(
+                fsrc, f, done - tail, tail
+            )
+
+    def restart(self) -> None:
+        """Forget the prefix; the caller rewrites the part file from the start."""
+        self.digests, self.tail = [], None
+        self.seg, self.seg_len = _segment_hasher(), 0
+        self.registry.checkpoint(self.temp, [])
+
+    def track(self, fdst) -> "SegmentWriter":
+        return SegmentWriter(self, fdst)
+
+    def checkpoint(self, fd: int, digest: str) -> None:
+        os.fdatasync(fd)
+        self.digests.append(digest)
+        self.registry.checkpoint(self.temp, self.digests)
+
+    def finish(self) -> None:
+        self.registry.finish(self.temp)
+
+
+def _same_range(fsrc, f, start: int, length: int) -> bool:
+    theirs = bytearray(length)
+    fsrc.seek(start)
+    got = 0
+    while got < length:
+        n = fsrc.readinto(memoryview(theirs)[got:])
+        if not n:
+            return False
+        got += n
+    f.seek(start)
+    return f.read(length) == theirs
+
+
+class SegmentWriter:
+    """Write-through wrapper that checkpoints the part file every segment."""
+
+    def __init__(self, partial: PartialCopy, raw) -> None:
+        self.partial = partial
+        self.raw = raw
+        self.segment = partial.registry.segment_bytes
+        self.seg = partial.seg
+        self.seg_len = partial.seg_len
+
+    def write(self, view) -> int:
+        n = self.raw.write(view)
+        mv = memoryview(view)[:n]
+        while mv:
+            take = min(len(mv), self.segment - self.seg_len)
+            self.seg.update(mv[:take])
+            self.seg_len += take
+            mv = mv[take:]
+            if self.seg_len == self.segment:
+                self.partial.checkpoint(self.raw.fileno(), self.seg.hexdigest())
+                self.seg = _segment_hasher()
+                self.seg_len = 0
+        return n
+
+    def fileno(self) -> int:
+        return self.raw.fileno()
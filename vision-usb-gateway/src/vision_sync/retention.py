@@ -0,0 +1,654 @@
+"""Mirror retention: bring the mirror from RETENTION_HI back to RETENTION_LO.
+
+mirror-retention.sh gates on RETENTION_HI and runs `python3 -m
+vision_sync.retention` with its settings in the environment.
+
+Space is freed by plan, not by measurement: the bytes to free to reach
+RETENTION_LO are computed from one disk_usage() call, and the oldest
+synced_files rows outside the operator's protected folders are taken until
+their recorded sizes (one per distinct raw file) cover that. Their raw and
+bydate links are unlinked (RETENTION_DELETE_THREADS at a time) and their
+paths blanked in one transaction per RETENTION_BATCH rows. Recorded sizes
+can overstate what a pass frees (content shared with newer rows, files
+already gone, block rounding), so usage is measured again after each pass
+and the remainder planned the same way.
+
+If a pass frees nothing measurable, or no DB row is left to plan with, the
+original loop takes over: delete one row (or, for data the DB does not
+track, the oldest file under raw/ and INGEST_DIR/data, see UntrackedFiles),
+measure, repeat.
+
+Below RETENTION_HI nothing is deleted unless RETENTION_PREDICT is set; then
+IdleRetention frees small batches ahead of a forecast HI crossing, in quiet
+periods only.
+"""
+
+import bisect
+import contextlib
+import fcntl
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from .iostat import ACTIVE_FILE, read_stat, stat_path
+
+# Seconds the active LV's write counter is watched before a pre-free batch.
+WRITE_SAMPLE_SEC = 5
+
+
+@dataclass
+class RetentionSettings:
+    mirror: Path
+    hi: int
+    lo: int
+    dry_run: bool
+    db_maint_interval_sec: int
+    file_state_prune_days: int
+    row_ttl_days: int
+    ingest_dir: Path
+    batch: int
+    delete_threads: int
+    predict: bool = False
+    predict_window_h: float = 24
+    predict_horizon_h: float = 24
+    idle_quiet_min: float = 10
+    idle_batch_mb: int = 512
+    idle_profile_days: int = 7
+
+
+def settings_from_env(env=os.environ) -> RetentionSettings:
+    mirror = Path(env.get("MIRROR_MOUNT", "/srv/vision_mirror"))
+    return RetentionSettings(
+        mirror=mirror,
+        hi=int(env.get("RETENTION_HI", "90")),
+        lo=int(env.get("RETENTION_LO", "85")),
+        dry_run=env.get("DRY_RUN", "false") == "true",
+        db_maint_interval_sec=int(env.get("DB_MAINT_INTERVAL_SEC", "86400")),
+        file_state_prune_days=int(env.get("FILE_STATE_PRUNE_DAYS", "30")),
+        row_ttl_days=int(env.get("RETENTION_ROW_TTL_DAYS", "90")),
+        ingest_dir=Path(env.get("INGEST_DIR", str(mirror / "ingest"))),
+        batch=max(1, int(env.get("RETENTION_BATCH", "500"))),
+        delete_threads=max(1, int(env.get("RETENTION_DELETE_THREADS", "4"))),
+        predict=env.get("RETENTION_PREDICT", "false") == "true",
+        predict_window_h=float(env.get("RETENTION_PREDICT_WINDOW_H", "24")),
+        predict_horizon_h=float(env.get("RETENTION_PREDICT_HORIZON_H", "24")),
+        idle_quiet_min=float(env.get("RETENTION_IDLE_QUIET_MIN", "10")),
+        idle_batch_mb=int(env.get("RETENTION_IDLE_BATCH_MB", "512")),
+        idle_profile_days=int(env.get("RETENTION_IDLE_PROFILE_DAYS", "7")),
+    )
+
+
+def load_protected(mirror: Path) -> list[Path]:
+    """Absolute, resolved roots that must never be deleted.
+
+    Folders an operator marked keep-forever, chosen in the WebUI. The list
+    lives on the NVMe so it survives an OS reflash. Fail closed: if it cannot
+    be read, protecting nothing is the wrong answer — but so is deleting
+    everything on a parse error. Raise instead, so the run aborts loudly and
+    a broken file cannot silently un-protect an operator's data.
+    """
+    protected_file = mirror / ".state" / "retention-protected.json"
+    if not protected_file.exists():
+        return []
+    raw = json.loads(protected_file.read_text(encoding="utf-8"))
+    roots = []
+    base = mirror.resolve()
+    for rel in raw.get("paths", []):
+        p = (base / str(rel).lstrip("/")).resolve()
+        if p == base or base not in p.parents:
+            continue  # never let a bad entry protect (or escape) the whole mirror
+        roots.append(p)
+    return roots
+
+
+class ProtectedMatcher:
+    """Protected roots compiled once, matched against paths without resolve().
+
+    Roots are kept as sorted "path/" strings, reduced to the outermost ones
+    (a root inside another adds nothing). A path is protected when the last
+    root sorting at or before "path/" is a prefix of it: with no root nested
+    in another, nothing can sort between a path and the root containing it,
+    so one bisect answers. Paths must be canonical (built under the resolved
+    mirror, as DB rows and the retention walk are), since no lookup resolves.
+    """
+
+    def __init__(self, roots: Iterable[Path]) -> None:
+        self.keys: list[str] = []
+        for key in sorted({str(r).rstrip("/") + "/" for r in roots}):
+            if self.keys and key.startswith(self.keys[-1]):
+                continue
+            self.keys.append(key)
+
+    @property
+    def roots(self) -> list[Path]:
+        return [Path(key) for key in self.keys]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, path) -> bool:
+        key = os.fspath(path) + "/"
+        i = bisect.bisect_right(self.keys, key) - 1
+        return i >= 0 and key.startswith(self.keys[i])
+
+
+def remove_empty_ancestors(path: Path, stop: Path) -> None:
+    d = path.parent
+    for _ in range(8):
+        if d == stop:
+            break
+        try:
+            d.rmdir()
+        except OSError:
+            break
+        d = d.parent
+
+
+def _unlink(path: Path) -> None:
+    with contextlib.suppress(OSError):
+        path.unlink(missing_ok=True)
+
+
+def _walk(root: Path) -> Iterator[tuple[str, os.stat_result]]:
+    """Regular files under `root` with their lstat, one scandir per directory.
+
+    The sync's work in flight is left out: hidden entries (`.part`/`.tmp`
+    copy temps, `.<name>.unit` staging folders) and growing `*.partial`
+    copies. The sync removes those itself once they are stale.
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.name.startswith(".") or entry.name.endswith(".partial"):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+
+class UntrackedFiles:
+    """Oldest-first deletion candidates for the fallback, walked once per run.
+
+    The fallback used to rebuild the bydate inode map and sort every file
+    under raw/ and INGEST_DIR/data for each single file it deleted, which is
+    quadratic under pressure. Here both walks happen on first use; each
+    deletion then pops the heap. Entries are checked against the live file
+    when popped, so files that disappeared meanwhile are skipped.
+    """
+
+    def __init__(self, roots: list[Path], bydate_root: Path) -> None:
+        self.links: dict[tuple[int, int], list[Path]] = {}
+        for path, st in _walk(bydate_root):
+            self.links.setdefault((st.st_dev, st.st_ino), []).append(Path(path))
+        self.roots = roots
+        self.heap: list[tuple[float, str, int, int, int]] = [
+            (st.st_mtime, path, st.st_dev, st.st_ino, i)
+            for i, root in enumerate(roots)
+            for path, st in _walk(root)
+        ]
+        heapq.heapify(self.heap)
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def pop(self) -> tuple[Path, tuple[int, int], Path] | None:
+        if not self.heap:
+            return None
+        _, path, dev, ino, i = heapq.heappop(self.heap)
+        return Path(path), (dev, ino), self.roots[i]
+
+
+class Retention:
+    def __init__(self, settings: RetentionSettings, conn: sqlite3.Connection) -> None:
+        self.s = settings
+        # Resolved once: every candidate is built under it, so protection
+        # checks compare strings instead of resolving each path.
+        self.mirror = settings.mirror.resolve()
+        self.conn = conn
+        self.conn.row_factory = sqlite3.Row
+        self.protected = load_protected(self.mirror)
+        self.matcher = ProtectedMatcher(self.protected)
+        self.now = int(time.time())
+        self.planned_rows = 0
+        self.untracked: UntrackedFiles | None = None
+
+    def is_protected(self, path: Path) -> bool:
+        return path in self.matcher
+
+    def mirror_path(self, stored: str) -> Path:
+        # synced_files keeps paths relative to MIRROR_MOUNT; rows written before
+        # schema v2 (and hand-made DBs) hold absolute ones, which join unchanged.
+        return self.mirror / stored
+
+    def row_paths(self, row) -> list[Path]:
+        return [self.mirror_path(p) for p in (row["bydate_path"], row["raw_path"]) if p]
+
+    def usage(self) -> tuple[int, int]:
+        total, used, _ = shutil.disk_usage(self.mirror)
+        return total, used
+
+    def usage_pct(self) -> int:
+        total, used = self.usage()
+        return int(used * 100 / total)
+
+    def bytes_to_free(self) -> int:
+        """Bytes above RETENTION_LO; at least 1 while at or above RETENTION_HI."""
+        total, used = self.usage()
+        need = used - total * self.s.lo // 100
+        if need <= 0 and int(used * 100 / total) >= self.s.hi:
+            # HI at or below LO: free something anyway, like the old loop did.
+            need = 1
+        return max(0, need)
+
+    # -- DB-driven bulk deletion ---------------------------------------------
+
+    def plan(self, need: int) -> list[sqlite3.Row]:
+        """Oldest unprotected rows whose recorded sizes cover `need` bytes."""
+        picked: list[sqlite3.Row] = []
+        raws: set[str] = set()
+        covered = 0
+        # SQL cannot know about the protected roots: walk oldest-first and
+        # skip them, so a protected file at the head never stalls the run.
+        for row in self.conn.execute(
+            "SELECT id, raw_path, bydate_path, size FROM synced_files "
+            "WHERE raw_path != '' OR bydate_path != '' "
+            "ORDER BY synced_at ASC, id ASC"
+        ):
+            if any(self.is_protected(p) for p in self.row_paths(row)):
+                continue
+            picked.append(row)
+            # raw/ and bydate/ are hardlinks; a raw file several rows reuse
+            # (same content) frees its bytes once.
+            key = row["raw_path"] or row["bydate_path"]
+            if key not in raws:
+                raws.add(key)
+                covered += int(row["size"] or 0)
+            if covered >= need:
+                break
+        return picked
+
+    def delete_rows(self, rows: list[sqlite3.Row]) -> None:
+        pool = ThreadPoolExecutor(self.s.delete_threads) if self.s.delete_threads > 1 else None
+        bydate_root = self.mirror / "bydate"
+        try:
+            for start in range(0, len(rows), self.s.batch):
+                batch = rows[start:start + self.s.batch]
+                paths = [p for row in batch for p in self.row_paths(row)]
+                if pool is not None:
+                    list(pool.map(_unlink, paths))
+                else:
+                    for p in paths:
+                        _unlink(p)
+                # Keep the identity rows (blank their paths) so the same files
+                # still on the active USB LV are not re-synced into the mirror;
+                # age-prune clears them later. This is what stops the
+                # retention<->sync re-copy churn.
+                self.conn.executemany(
+                    "UPDATE synced_files SET raw_path='', bydate_path='' WHERE id=?",
+                    [(row["id"],) for row in batch],
+                )
+                self.conn.commit()
+                bydates = [self.mirror_path(r["bydate_path"]) for r in batch if r["bydate_path"]]
+                links = {link.parent: link for link in bydates}
+                for link in links.values():
+                    remove_empty_ancestors(link, bydate_root)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def free_planned(self) -> None:
+        """Plan-and-delete passes until RETENTION_LO or no progress."""
+        while True:
+            need = self.bytes_to_free()
+            if need <= 0:
+                return
+            rows = self.plan(need)
+            if not rows:
+                return
+            if self.s.dry_run:
+                self.planned_rows = len(rows)
+                for row in rows:
+                    raw, bydate = (
+                        self.mirror_path(row[k]) if row[k] else None
+                        for k in ("raw_path", "bydate_path")
+                    )
+                    print(f"DRY delete: {raw} and {bydate}")
+                return
+            _, before = self.usage()
+            self.delete_rows(rows)
+            self.planned_rows += len(rows)
+            _, after = self.usage()
+            if self.usage_pct() <= self.s.lo or after >= before:
+                # Done, or the DB says we deleted but usage didn't move.
+                return
+
+    # -- Measured one-at-a-time fallback -------------------------------------
+
+    def file_fallback_delete_one(self) -> bool:
+        if self.untracked is None:
+            # FTP/SFTP ingest data lives here and is not tracked in the DB.
+            ingest_data = self.s.ingest_dir.resolve() / "data"
+            roots = [r for r in (self.mirror / "raw", ingest_data) if r.exists()]
+            self.untracked = UntrackedFiles(roots, self.mirror / "bydate")
+        bydate_root = self.mirror / "bydate"
+        while True:
+            cand = self.untracked.pop()
+            if cand is None:
+                return False
+            path, inode, root = cand
+            links = self.untracked.links.get(inode, [])
+            # raw/ and bydate/ are the same inodes (hardlinks), so protection
+            # is about the data, not a path: an image is protected if EITHER
+            # its raw file or ANY of its bydate links is protected. Freeing
+            # space means deleting every link, so if one link is kept none
+            # may go — checking only the raw path would let an unprotected
+            # raw file drag a protected bydate link to deletion with it.
+            if self.is_protected(path) or any(self.is_protected(link) for link in links):
+                continue
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue  # deleted since the walk (by the planned pass, say)
+            if (st.st_dev, st.st_ino) != inode:
+                continue
+            if self.s.dry_run:
+                print(f"DRY fallback delete: {path}")
+                return True
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                continue
+            for link in links:
+                _unlink(link)
+                remove_empty_ancestors(link, bydate_root)
+            remove_empty_ancestors(path, root)
+            return True
+
+    def next_row(self) -> sqlite3.Row | None:
+        for cand in self.conn.execute(
+            "SELECT id, raw_path, bydate_path FROM synced_files "
+            "WHERE raw_path != '' OR bydate_path != '' "
+            "ORDER BY synced_at ASC LIMIT 200"
+        ):
+            if any(self.is_protected(p) for p in self.row_paths(cand)):
+                continue
+            return cand
+        return None
+
+    def free_measured(self) -> None:
+        progress_failures = 0
+        while self.usage_pct() >= self.s.hi:
+            before = self.usage_pct()
+            row = self.next_row()
+            if row is None:
+                if not self.file_fallback_delete_one() or self.s.dry_run:
+                    break
+                progress_failures = 0
+                if self.usage_pct() <= self.s.lo:
+                    break
+                continue
+
+            if self.s.dry_run:
+                raw, bydate = (
+                    self.mirror_path(row[k]) if row[k] else None
+                    for k in ("raw_path", "bydate_path")
+                )
+                print(f"DRY delete: {raw} and {bydate}")
+                return
+            self.delete_rows([row])
+
+            if self.usage_pct() <= self.s.lo:
+                break
+            after = self.usage_pct()
+            if after >= before:
+                progress_failures += 1
+            else:
+                progress_failures = 0
+            # DB says we deleted, but usage didn't move; use file fallback.
+            if progress_failures >= 3:
+                if self.file_fallback_delete_one():
+                    progress_failures = 0
+                else:
+                    break
+
+    # -- DB upkeep -------------------------------------------------------------
+
+    def prune_rows(self) -> None:
+        # Rows are intentionally kept even after their mirror copy is reclaimed,
+        # so a file still on the active USB LV is not re-copied (is_already_synced
+        # stays true). A row older than RETENTION_ROW_TTL_DAYS has surely rotated
+        # away, so dropping it is safe; this only bounds the DB.
+        row_ttl = max(1, self.s.row_ttl_days) * 86400
+        self.conn.execute("DELETE FROM synced_files WHERE synced_at < ?", (self.now - row_ttl,))
+        self.conn.commit()
+        ttl = max(1, self.s.file_state_prune_days) * 86400
+        self.conn.execute("DELETE FROM file_state WHERE last_seen < ?", (self.now - ttl,))
+        self.conn.commit()
+
+    def prune_interned(self) -> None:
+        """Drop interned source dirs/names no row refers to any more (schema v2).
+
+        A sync cycle caches interned ids, so this only runs while the cycle lock
+        is free; a busy lock just postpones it to the next maintenance run.
+        """
+        tables = {
+            r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        if "src_names" not in tables:
+            return
+        with open(self.mirror / ".state" / "usb_sync.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+            self.conn.execute(
+                "DELETE FROM src_names WHERE id NOT IN"
+                " (SELECT name_id FROM file_state UNION SELECT name_id FROM synced_files)"
+            )
+            self.conn.execute(
+                "DELETE FROM src_dirs WHERE id NOT IN"
+                " (SELECT dir_id FROM file_state UNION SELECT dir_id FROM synced_files)"
+            )
+            self.conn.commit()
+
+    def maintenance(self) -> None:
+        maint_state = self.mirror / ".state" / "retention.state.json"
+        try:
+            state = json.loads(maint_state.read_text(encoding="utf-8"))
+        except Exception:
+            state = {}
+        last_vacuum_ts = int(state.get("last_vacuum_ts", 0) or 0)
+        if self.now - last_vacuum_ts < self.s.db_maint_interval_sec:
+            return
+        try:
+            self.prune_interned()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.execute("VACUUM")
+            maint_state.write_text(json.dumps({"last_vacuum_ts": self.now}), encoding="utf-8")
+        except Exception:
+            pass
+
+    def report(self) -> None:
+        # Protection holds: protected data is never deleted to make room. But
+        # retention giving up quietly is how the mirror fills, the sync's
+        # free-space guard trips, and the AOI's images stop being captured while
+        # everything still looks green. Say so loudly enough that it is noticed
+        # before that happens.
+        health = self.mirror / ".state" / "retention-blocked.json"
+        final = self.usage_pct()
+        if final >= self.s.hi and self.protected:
+            try:
+                health.parent.mkdir(parents=True, exist_ok=True)
+                health.write_text(
+                    json.dumps({
+                        "usage": final, "target": self.s.lo,
+                        "protected": len(self.protected), "ts": self.now,
+                    }),
+                    encoding="utf-8",
+                )
+            except OSError:
+                pass
+            print(
+                f"CRITICAL: mirror at {final}% and retention cannot reach {self.s.lo}% — "
+                f"{len(self.protected)} protected folder(s) are keeping the rest. Free space or "
+                f"unprotect something: when the mirror fills, the sync stops capturing.",
+                flush=True,
+            )
+        else:
+            with contextlib.suppress(OSError):
+                health.unlink(missing_ok=True)
+
+    def run(self) -> None:
+        if not self.s.dry_run:
+            self.prune_rows()
+        self.free_planned()
+        pct = self.usage_pct()
+        if pct >= self.s.hi and pct > self.s.lo and not (self.s.dry_run and self.planned_rows):
+            self.free_measured()
+        if self.planned_rows and not self.s.dry_run:
+            print(f"retention: {self.planned_rows} row(s) deleted by plan, usage {pct}%")
+        self.report()
+        if not self.s.dry_run and self.s.db_maint_interval_sec > 0:
+            self.maintenance()
+
+
+class IdleRetention:
+    """Pre-free toward RETENTION_LO before the mirror reaches RETENTION_HI.
+
+    With RETENTION_PREDICT, a run below RETENTION_HI (but above LO) forecasts
+    when HI will be crossed from the bytes synced over the last
+    RETENTION_PREDICT_WINDOW_H hours. If that is within
+    RETENTION_PREDICT_HORIZON_H and capture is quiet, it frees at most
+    RETENTION_IDLE_BATCH_MB (never below LO) through the same planner, with
+    one unlink thread, while holding the sync cycle lock: a cycle starting
+    meanwhile waits for the batch instead of competing with it. The 15-minute
+    timer spreads these batches over the quiet hours, so the full
+    HI-to-LO burst no longer lands in the middle of a busy shift.
+
+    Quiet means all of: no sync cycle running, nothing synced for
+    RETENTION_IDLE_QUIET_MIN, the host not writing to the active USB LV
+    over a short sample, and the current hour of day below the average
+    hourly synced volume of the last RETENTION_IDLE_PROFILE_DAYS.
+    """
+
+    def __init__(self, retention: Retention, active_file: str = ACTIVE_FILE, sleep=time.sleep):
+        self.r = retention
+        self.s = retention.s
+        self.active_file = active_file
+        self.sleep = sleep
+
+    def fill_rate(self) -> float:
+        """Bytes per second synced into the mirror over the forecast window."""
+        window = max(1.0, self.s.predict_window_h * 3600)
+        row = self.r.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM synced_files WHERE synced_at >= ?",
+            (self.r.now - window,),
+        ).fetchone()
+        return float(row[0]) / window
+
+    def peak_hour(self) -> bool:
+        """The current hour of day carries more than its share of recent syncs."""
+        rows = self.r.conn.execute(
+            "SELECT CAST(strftime('%H', synced_at, 'unixepoch', 'localtime') AS INTEGER),"
+            " SUM(size) FROM synced_files WHERE synced_at >= ? GROUP BY 1",
+            (self.r.now - self.s.idle_profile_days * 86400,),
+        ).fetchall()
+        by_hour = {int(hour): int(size or 0) for hour, size in rows}
+        total = sum(by_hour.values())
+        return total > 0 and by_hour.get(time.localtime(self.r.now).tm_hour, 0) > total / 24
+
+    def host_writing(self) -> bool:
+        try:
+            path = stat_path(Path(self.active_file).read_text().strip())
+            written, in_flight = read_stat(path)
+            if in_flight:
+                return True
+            self.sleep(WRITE_SAMPLE_SEC)
+            return read_stat(path) != (written, 0)
+        except (OSError, ValueError, IndexError):
+            return False  # no active LV to watch (rotation, gadget down)
+
+    def busy(self) -> str | None:
+        last = self.r.conn.execute("SELECT MAX(synced_at) FROM synced_files").fetchone()[0]
+        if last is not None and self.r.now - int(last) < self.s.idle_quiet_min * 60:
+            return "recent syncs"
+        if self.peak_hour():
+            return "peak hour"
+        if self.host_writing():
+            return "host writing"
+        return None
+
+    def run(self) -> int:
+        """Free one batch if HI is near and capture is quiet; rows deleted."""
+        total, used = self.r.usage()
+        excess = used - total * self.s.lo // 100
+        if excess <= 0:
+            return 0
+        rate = self.fill_rate()
+        if rate <= 0:
+            return 0
+        eta_h = (total * self.s.hi // 100 - used) / rate / 3600
+        if eta_h > self.s.predict_horizon_h:
+            return 0
+        reason = self.busy()
+        if reason:
+            print(f"retention: HI forecast in {eta_h:.1f}h, pre-free deferred ({reason})")
+            return 0
+        with open(self.r.mirror / ".state" / "usb_sync.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                print(f"retention: HI forecast in {eta_h:.1f}h, pre-free deferred (sync running)")
+                return 0
+            rows = self.r.plan(min(excess, self.s.idle_batch_mb * 1024 * 1024))
+            if self.s.dry_run:
+                for row in rows:
+                    print(f"DRY pre-free: {self.r.row_paths(row)}")
+                return 0
+            self.r.delete_rows(rows)
+        print(
+            f"retention: HI forecast in {eta_h:.1f}h, pre-freed {len(rows)} row(s), "
+            f"usage {self.r.usage_pct()}%"
+        )
+        return len(rows)
+
+
+def main() -> None:
+    settings = settings_from_env()
+    state_db = settings.mirror / ".state" / "vision.db"
+    if not state_db.exists():
+        raise SystemExit("state DB not found")
+    conn = sqlite3.connect(str(state_db))
+    try:
+        retention = Retention(settings, conn)
+        if retention.usage_pct() >= settings.hi or not settings.predict:
+            retention.run()
+            return
+        # Below HI: small single-threaded batches, and DB upkeep, in quiet time.
+        retention.s = replace(settings, delete_threads=1)
+        idle = IdleRetention(retention)
+        if idle.run() and not settings.dry_run:
+            retention.prune_rows()
+            if settings.db_maint_interval_sec > 0:
+                retention.maintenance()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,46 @@
 import argparse
+import contextlib
+import fcntl
+import fnmatch
+import hashlib
+import heapq
 import json
 import os
 import shutil
+import signal
 import subprocess
+import threading
 import time
-from collections.abc import Iterator
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from datetime import datetime
 from pathlib import Path
 
+from . import iostat, proc
 from .config import get_config
-from .db import init_db, is_already_synced, mark_synced, update_state
-from .fsops import SKIP_DIRS, atomic_copy, compute_manifest, iter_files, safe_join
-
-ACTIVE_FILE = "/run/vision-usb-active"
+from .db import BatchState, DirectState, init_db
+from .delta import DeltaPlan, DeltaState, pending_dirs, thin_delta_ranges
+from .fat import FatError, FatVolume
+from .fsops import (
+    DEFAULT_HASH_ALGO,
+    FileRecord,
+    MountTree,
+    compute_manifest,
+    copy_to_temp,
+    dir_digest,
+    fsync_path,
+    new_hasher,
+    safe_join,
+    syncfs,
+)
+from .geometry import GeometryCache
+from .iostat import ACTIVE_FILE
+from .resume import PartialCopies
+
+# Written into a unit's staging folder before it is published; lists the rows
+# that rename still owes, until they are committed (CopyPipeline.copy_unit).
+UNIT_PENDING_FILE = ".unit-pending.json"
 USB_USAGE_FILE = "/run/vision-usb-usage.json"
 SYNC_INDEX_VERSION = 1
 
@@ -52,7 +80,9 @@ def save_dir_index(path: Path, state: dict) -> None:
         return
 
 
-def scan_dirs_by_depth(root: Path, depth: int) -> tuple[list[tuple[str, int]], list[str]]:
+def scan_dirs_by_depth(
+    root: Path, depth: int, tree=None
+) -> tuple[list[tuple[str, int]], list[str]]:
     """Split the directories exactly at `depth` from those above it.
 
     Returns (dirs_at_depth, dirs_above_depth). The first list drives recursive
@@ -63,28 +93,22 @@ def scan_dirs_by_depth(root: Path, depth: int) -> tuple[list[tuple[str, int]], l
     above: list[str] = []
     if depth <= 0:
         return at_depth, above
-    try:
-        for dirpath, dirnames, _ in os.walk(root, topdown=True):
-            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
-            current = Path(dirpath)
-            rel = current.relative_to(root)
-            rel_depth = len(rel.parts)
-            if rel_depth == depth:
-                if rel_depth > 0:
-                    try:
-                        st = current.stat()
-                    except FileNotFoundError:
-                        continue
-                    at_depth.append((rel.as_posix(), int(st.st_mtime)))
-                dirnames[:] = []
-                continue
-            if rel_depth > depth:
-                dirnames[:] = []
-                continue
-            if rel_depth > 0:
-                above.append(rel.as_posix())
-    except FileNotFoundError:
-        return [], []
+    if tree is None:
+        tree = MountTree(root)
+
+    # Directories only: the dirent type says which entries are directories, so
+    # the only stat is the mtime of each directory exactly at `depth`.
+    def walk(rel: str, level: int) -> None:
+        last = level + 1 == depth
+        for name, mtime in tree.subdirs(rel, with_mtime=last):
+            child = f"{rel}/{name}" if rel else name
+            if last:
+                at_depth.append((child, mtime))
+            else:
+                above.append(child)
+                walk(child, level + 1)
+
+    walk("", 0)
     at_depth.sort(key=lambda x: (x[1], x[0]), reverse=True)
     above.sort()
     return at_depth, above
@@ -94,29 +118,12 @@ def scan_dirs_at_depth(root: Path, depth: int) -> list[tuple[str, int]]:
     return scan_dirs_by_depth(root, depth)[0]
 
 
-def iter_root_files(root: Path) -> Iterator[tuple[Path, os.stat_result]]:
-    try:
-        for entry in os.scandir(root):
-            if not entry.is_file(follow_symlinks=False):
-                continue
-            p = Path(entry.path)
-            try:
-                st = p.stat()
-            except FileNotFoundError:
-                continue
-            if not p.is_file():
-                continue
-            yield p, st
-    except FileNotFoundError:
-        return
-
-
-def select_scan_roots(cfg, mount_root: Path) -> tuple[list[Path], dict]:
+def select_scan_roots(cfg, mount_root: Path, tree=None) -> tuple[list[Path], dict]:
     scan_depth = max(1, int(getattr(cfg, "sync_scan_depth", 1)))
-    dirs, shallow = scan_dirs_by_depth(mount_root, scan_depth)
+    dirs, shallow = scan_dirs_by_depth(mount_root, scan_depth, tree)
     if not dirs and scan_depth > 1:
         # Safety fallback for shallower layouts.
-        dirs, shallow = scan_dirs_by_depth(mount_root, 1)
+        dirs, shallow = scan_dirs_by_depth(mount_root, 1, tree)
         scan_depth = 1
     dir_names = [name for name, _ in dirs]
     hot_n = max(0, int(getattr(cfg, "sync_hot_dirs", 1)))
@@ -168,7 +175,7 @@ def _find_tool(name: str, search_paths: tuple[str, ...] = ("/sbin", "/usr/sbin")
 
 
 def run_best_effort(args: list[str]) -> None:
-    subprocess.run(args, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    proc.run(args, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
 def read_active() -> str:
@@ -177,29 +184,57 @@ def read_active() -> str:
     return Path(ACTIVE_FILE).read_text().strip()
 
 
+def _lv_nodes(vg: str, snap_name: str) -> tuple[str, str]:
+    return f"/dev/{vg}/{snap_name}", f"/dev/mapper/{vg}-{snap_name}"
+
+
+def _has_partition_mappings(vg: str, snap_name: str) -> bool:
+    """True if kpartx/partx left partition nodes on the snapshot.
+
+    Only the resolve_mount_device fallback creates them; a snapshot mounted
+    with loop,offset has none, and then there is nothing to tear down.
+    """
+    base = f"/dev/mapper/{vg}-{snap_name}"
+    return any(os.path.exists(f"{base}{suffix}") for suffix in ("1", "p1"))
+
+
 def _cleanup_lv_mappings(snap_path: str, vg: str, snap_name: str) -> None:
-    kpartx = _find_tool("kpartx")
-    if kpartx:
-        run_best_effort([kpartx, "-d", snap_path])
-    partx = _find_tool("partx")
-    if partx:
-        run_best_effort([partx, "-d", snap_path])
     dmsetup = _find_tool("dmsetup")
+    if _has_partition_mappings(vg, snap_name):
+        kpartx = _find_tool("kpartx")
+        if kpartx:
+            run_best_effort([kpartx, "-d", snap_path])
+        partx = _find_tool("partx")
+        if partx:
+            run_best_effort([partx, "-d", snap_path])
+        if dmsetup:
+            run_best_effort([dmsetup, "remove", "-f", f"{vg}-{snap_name}1"])
+    # Always: a leaked or busy mapping of the snapshot itself makes lvremove
+    # fail, and lv_snapshot's retry depends on it being force-cleared here.
     if dmsetup:
-        run_best_effort([dmsetup, "remove", "-f", f"{vg}-{snap_name}1"])
         run_best_effort([dmsetup, "remove", "-f", f"{vg}-{snap_name}"])
 
 
 def lv_snapshot(active_dev: str, vg: str, snap_name: str) -> str:
-    snap_path = f"/dev/{vg}/{snap_name}"
-    _cleanup_lv_mappings(snap_path, vg, snap_name)
-    run_best_effort(["lvremove", "-y", snap_path])
-    subprocess.run(["lvcreate", "-s", "-n", snap_name, active_dev], check=True)
-    # Ensure the snapshot is activatable and active so a device node appears.
-    # Different LVM versions expose different flags, so try both.
-    run_best_effort(["lvchange", "--setactivationskip", "n", snap_path])
-    run_best_effort(["lvchange", "-K", "n", snap_path])
-    run_best_effort(["lvchange", "-ay", snap_path])
+    snap_path, mapper_path = _lv_nodes(vg, snap_name)
+    if os.path.exists(snap_path) or os.path.exists(mapper_path):
+        _cleanup_lv_mappings(snap_path, vg, snap_name)
+        run_best_effort(["lvremove", "-y", snap_path])
+    cmd = ["lvcreate", "-s", "-n", snap_name, active_dev]
+    if proc.run(cmd, check=False).returncode != 0:
+        # A stale snapshot left inactive (no device node) still holds the name.
+        _cleanup_lv_mappings(snap_path, vg, snap_name)
+        run_best_effort(["lvremove", "-y", snap_path])
+        proc.run(cmd, check=True)
+    # Thin snapshots are created with activation skip; -K activates anyway.
+    if not (os.path.exists(snap_path) or os.path.exists(mapper_path)):
+        run_best_effort(["lvchange", "-ay", "-K", snap_path])
+    if not (os.path.exists(snap_path) or os.path.exists(mapper_path)):
+        # Ensure the snapshot is activatable and active so a device node appears.
+        # Different LVM versions expose different flags, so try both.
+        run_best_effort(["lvchange", "--setactivationskip", "n", snap_path])
+        run_best_effort(["lvchange", "-K", "n", snap_path])
+        run_best_effort(["lvchange", "-ay", snap_path])
     return wait_for_dev(snap_path, vg, snap_name)
 
 
@@ -215,10 +250,9 @@ def _mount_device(
     mount_point.mkdir(parents=True, exist_ok=True)
     common = "utf8,shortname=mixed,nodev,nosuid,noexec"
     base_opts = f"ro,{common}" if readonly else common
-    mount_dev = resolve_mount_device(dev)
     if offset_override is not None:
         offset_opts = f"{base_opts},loop,offset={offset_override}"
-        result = subprocess.run(
+        result = proc.run(
             ["mount", "-t", "vfat", "-o", offset_opts, dev, str(mount_point)],
             check=False,
         )
@@ -231,13 +265,16 @@ def _mount_device(
                 alt = None
             if alt and alt != offset_override:
                 offset_opts = f"{base_opts},loop,offset={alt}"
-                result = subprocess.run(
+                result = proc.run(
                     ["mount", "-t", "vfat", "-o", offset_opts, dev, str(mount_point)],
                     check=False,
                 )
                 if result.returncode == 0:
                     return
-    result = subprocess.run(
+    # Only now map partitions (partx/kpartx/udev settle): a known offset
+    # mounts the LV directly above.
+    mount_dev = resolve_mount_device(dev)
+    result = proc.run(
         ["mount", "-t", "vfat", "-o", base_opts, mount_dev, str(mount_point)],
         check=False,
     )
@@ -252,7 +289,7 @@ def _mount_device(
     if offset is None:
         raise subprocess.CalledProcessError(result.returncode, result.args)
     offset_opts = f"{base_opts},loop,offset={offset}"
-    subprocess.run(["mount", "-t", "vfat", "-o", offset_opts, dev, str(mount_point)], check=True)
+    proc.run(["mount", "-t", "vfat", "-o", offset_opts, dev, str(mount_point)], check=True)
 
 
 def mount_ro(dev: str, mount_point: Path, offset_override: int | None = None) -> None:
@@ -261,7 +298,7 @@ def mount_ro(dev: str, mount_point: Path, offset_override: int | None = None) ->
 
 def record_snapshot_usage(mount_point: Path, active_dev: str) -> None:
     try:
-        result = subprocess.run(
+        result = proc.run(
             ["df", "-h", "--output=size,used,pcent", str(mount_point)],
             text=True,
             capture_output=True,
@@ -290,11 +327,14 @@ def record_snapshot_usage(mount_point: Path, active_dev: str) -> None:
 
 def wait_for_dev(snap_path: str, vg: str, snap_name: str) -> str:
     mapper_path = f"/dev/mapper/{vg}-{snap_name}"
+    for path in (snap_path, mapper_path):
+        if os.path.exists(path):
+            return path
 
     # Give udev a moment to create nodes after lvcreate.
     udevadm = _find_tool("udevadm")
     if udevadm:
-        subprocess.run([udevadm, "settle"], check=False)
+        proc.run([udevadm, "settle"], check=False)
 
     for _ in range(50):  # ~5s total
         if os.path.exists(snap_path):
@@ -306,7 +346,7 @@ def wait_for_dev(snap_path: str, vg: str, snap_name: str) -> str:
     # Last attempt to create nodes directly.
     dmsetup = _find_tool("dmsetup")
     if dmsetup:
-        subprocess.run([dmsetup, "mknodes"], check=False)
+        proc.run([dmsetup, "mknodes"], check=False)
         if os.path.exists(snap_path):
             return snap_path
         if os.path.exists(mapper_path):
@@ -316,7 +356,7 @@ def wait_for_dev(snap_path: str, vg: str, snap_name: str) -> str:
 
 
 def umount(mount_point: Path) -> None:
-    subprocess.run(["umount", str(mount_point)], check=False)
+    proc.run(["umount", str(mount_point)], check=False)
 
 def persist_enabled(cfg) -> bool:
     return bool(cfg.usb_persist_dir) and cfg.usb_persist_dir != "none"
@@ -376,7 +416,7 @@ def sync_dir(src: Path, dst: Path) -> None:
     dst.mkdir(parents=True, exist_ok=True)
     rsync = shutil.which("rsync")
     if rsync:
-        subprocess.run(
+        proc.run(
             [
                 rsync, "-rlt", "--delete", "--no-owner",
                 "--no-group", "--no-perms", f"{src}/", f"{dst}/",
@@ -396,7 +436,7 @@ def mount_rw(dev: str, mount_point: Path, offset_override: int | None = None) ->
 def get_partition_offset(dev: str) -> int | None:
     try:
         sfdisk = _find_tool("sfdisk") or "sfdisk"
-        result = subprocess.run(
+        result = proc.run(
             [sfdisk, "-d", dev],
             text=True,
             capture_output=True,
@@ -412,7 +452,7 @@ def get_partition_offset(dev: str) -> int | None:
                             start = int(part.split("=", 1)[1])
                             return start * 512
         # Fall back to lsblk START column (in sectors) if sfdisk output isn't usable.
-        lsblk_res = subprocess.run(
+        lsblk_res = proc.run(
             ["lsblk", "-n", "-o", "START", "-r", dev],
             text=True,
             capture_output=True,
@@ -431,12 +471,12 @@ def get_partition_offset(dev: str) -> int | None:
 def resolve_mount_device(dev: str) -> str:
     partx = _find_tool("partx")
     if partx:
-        subprocess.run([partx, "-a", dev], check=False)
+        proc.run([partx, "-a", dev], check=False)
     kpartx = _find_tool("kpartx")
     if kpartx:
-        subprocess.run([kpartx, "-a", dev], check=False)
+        proc.run([kpartx, "-a", dev], check=False)
         # Try to read the mapping name from kpartx output (e.g. vg0-usb_sync_snap1).
-        kp = subprocess.run([kpartx, "-l", dev], text=True, capture_output=True, check=False)
+        kp = proc.run([kpartx, "-l", dev], text=True, capture_output=True, check=False)
         for line in kp.stdout.splitlines():
             name = line.split()[0].strip() if line.split() else ""
             if name:
@@ -445,7 +485,7 @@ def resolve_mount_device(dev: str) -> str:
                     return mapper
     udevadm = _find_tool("udevadm")
     if udevadm:
-        subprocess.run([udevadm, "settle"], check=False)
+        proc.run([udevadm, "settle"], check=False)
     base = os.path.basename(dev)
     mapper_name = base
     if "/dev/" in dev and dev.count("/") >= 2:
@@ -467,7 +507,7 @@ def resolve_mount_device(dev: str) -> str:
     for cand in candidates:
         if os.path.exists(cand):
             return cand
-    result = subprocess.run(
+    result = proc.run(
         ["lsblk", "-n", "-o", "NAME,TYPE", "-r", dev],
         text=True,
         capture_output=True,
@@ -512,82 +552,729 @@ def maybe_sync_persist(cfg, mount_root: Path, active_dev: str) -> None:
     write_manifest_state(manifest_path, new_digest, 0, "active")
 
 
-def maybe_compute_sync_manifest(cfg, mount_root: Path) -> tuple[str, int, bool, str] | None:
-    if not getattr(cfg, "sync_change_detect", False):
+class DirManifest:
+    """Per-directory manifest for SYNC_CHANGE_DETECT, kept in the state dir.
+
+    Each directory stores the digest and entry count of its own files plus how
+    many consecutive runs saw exactly that. Once a directory has been seen
+    unchanged for more runs than the stability gate needs, every file in it
+    has already been judged stable and copied (or skipped), so the sync stops
+    processing it until its digest or count moves. The top-level digest is
+    derived from the stored directory digests, so it no longer costs a second
+    walk of the snapshot or a sorted list of every file in memory.
+    """
+
+    def __init__(self, path: Path, settle_runs: int) -> None:
+        self.path = path
+        self.settle_runs = max(1, int(settle_runs))
+        self.dirs: dict[str, list] = {}
+        self.seen: set[str] = set()
+        self.walked: list[tuple[str, bool]] = []
+        try:
+            raw = json.loads(path.read_text())
+            if raw.get("version") == SYNC_INDEX_VERSION and isinstance(raw.get("dirs"), dict):
+                self.dirs = raw["dirs"]
+        except (OSError, ValueError, AttributeError):
+            self.dirs = {}
+
+    def observe(self, rel: str, files: list[FileRecord]) -> bool:
+        """Record this run's view of `rel`; True if its files can be skipped."""
+        digest = dir_digest(files)
+        prev = self.dirs.get(rel)
+        runs = 1
+        if prev and prev[0] == digest and prev[1] == len(files):
+            runs = int(prev[2]) + 1
+        self.dirs[rel] = [digest, len(files), min(runs, self.settle_runs + 1)]
+        self.seen.add(rel)
+        return runs > self.settle_runs
+
+    def walked_root(self, rel: str, recursive: bool) -> None:
+        self.walked.append((rel, recursive))
+
+    def _prune(self) -> None:
+        # A fully walked subtree is authoritative: drop directories under it
+        # that no longer exist. Entries outside this run's walk are kept.
+        for root, recursive in self.walked:
+            prefix = f"{root}/" if root else ""
+            for rel in list(self.dirs):
+                if rel in self.seen:
+                    continue
+                if rel == root or (recursive and rel.startswith(prefix)):
+                    del self.dirs[rel]
+
+    def root_digest(self) -> str:
+        h = hashlib.sha256()
+        for rel in sorted(self.dirs):
+            digest, count, _ = self.dirs[rel]
+            h.update(f"{rel}\t{digest}\t{count}\n".encode())
+        return h.hexdigest()
+
+    def save(self) -> str:
+        self._prune()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"version": SYNC_INDEX_VERSION, "dirs": self.dirs}))
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            log(f"dir manifest save failed: {exc}")
+        return self.root_digest()
+
+
+def update_sync_manifest(cfg, digest: str) -> None:
+    """Keep usb_sync.manifest (digest/count/mode) current from the dir manifest."""
+    resume_scans = max(1, int(cfg.sync_change_resume_scans))
+    prev_digest, prev_count, prev_mode = read_manifest_state(cfg.sync_manifest_path)
+    if digest == prev_digest:
+        count = min(prev_count + 1, resume_scans)
+        mode = "active" if count >= resume_scans else prev_mode
+    else:
+        count, mode = 0, "suspend"
+    if prev_digest != digest or prev_count != count or prev_mode != mode:
+        write_manifest_state(cfg.sync_manifest_path, digest, count, mode)
+
+
+def _hash_algo(cfg) -> str:
+    return getattr(cfg, "sync_hash_algo", DEFAULT_HASH_ALGO)
+
+
+@dataclass(frozen=True)
+class CopyJob:
+    src: Path
+    rel: str
+    size: int
+    mtime: int
+    raw_subdir: Path
+    date_path: Path
+    # How the file passed the stability gate: scan, counter or offline.
+    stable_via: str = "scan"
+    # Matches SYNC_PROGRESSIVE_GLOBS: mirrored through a growing .partial.
+    progressive: bool = False
+
+
+def _copy_temp(
+    job: CopyJob,
+    cfg,
+    fsync: bool,
+    volume: FatVolume | None = None,
+    partials: PartialCopies | None = None,
+) -> tuple[Path, str]:
+    name = Path(job.rel).name
+    algo = _hash_algo(cfg)
+    partial = None
+    if partials is not None:
+        partial = partials.get(
+            job.raw_subdir, name, job.rel, job.size, job.mtime, algo, job.progressive
+        )
+    if volume is not None:
+        # Straight from the snapshot device; a file whose entry or chain does
+        # not check out (or goes short mid-read) is copied via the mount.
+        try:
+            reader = volume.open_file(job.rel, job.size, job.mtime)
+            return copy_to_temp(
+                job.src, job.raw_subdir, name, cfg.copy_chunk, algo, fsync, reader, partial
+            )
+        except (FatError, FileNotFoundError) as exc:
+            log(f"fat copy fallback to mount: {job.rel}: {exc}")
+    return copy_to_temp(
+        job.src, job.raw_subdir, name, cfg.copy_chunk, algo, fsync, partial=partial
+    )
+
+
+class DestPlanner:
+    """Per-cycle cache of mirror destinations, shared by the copy workers.
+
+    Validated raw folders (safe_join resolves every component), day folders
+    already created, and the names in each destination folder, listed once
+    on first use and updated as this cycle renames or links into it. Only
+    the sync writes into raw/ and bydate/, so the listing stays current for
+    the cycle; retention deleting a name only makes a collision name pick
+    a hash suffix it did not need.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.raw_subdirs: dict[tuple[Path, str], Path] = {}
+        self.made: set[Path] = set()
+        self.listings: dict[Path, set[str]] = {}
+
+    def raw_subdir(self, raw_dir: Path, parent: str) -> Path:
+        key = (raw_dir, parent)
+        path = self.raw_subdirs.get(key)
+        if path is None:
+            path = safe_join(raw_dir, Path(parent))
+            self.raw_subdirs[key] = path
+        return path
+
+    def _names(self, folder: Path) -> set[str]:
+        # Caller holds self.lock.
+        names = self.listings.get(folder)
+        if names is None:
+            try:
+                names = set(os.listdir(folder))
+            except (FileNotFoundError, NotADirectoryError):
+                names = set()
+            self.listings[folder] = names
+        return names
+
+    def exists(self, folder: Path, name: str) -> bool:
+        with self.lock:
+            return name in self._names(folder)
+
+    def add(self, folder: Path, name: str) -> None:
+        with self.lock:
+            self._names(folder).add(name)
+
+    def makedirs(self, folder: Path) -> None:
+        if folder in self.made:
+            return
+        folder.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            self.made.add(folder)
+
+
+def _finalize_copy(
+    job: CopyJob,
+    cfg,
+    temp: Path,
+    digest: str,
+    dest: DestPlanner,
+    partials: PartialCopies | None = None,
+) -> tuple[Path, Path]:
+    """Rename a finished temp into raw/ (collision-aware) and link it into bydate/.
+
+    A resumable temp keeps its `partials` entry up to here, so a cycle
+    killed before the rename continues from the complete part.
+    """
+    name = Path(job.rel).name
+    stem = Path(name).stem
+    suffix = Path(name).suffix
+    collision = dest.exists(job.raw_subdir, name)
+    if cfg.append_always:
+        collision = True
+
+    if collision:
+        hash_name = f"{stem}_{job.mtime}_{digest[:8]}{suffix}"
+        hash_path = job.raw_subdir / hash_name
+        if dest.exists(job.raw_subdir, hash_name):
+            temp.unlink(missing_ok=True)
+        else:
+            os.rename(temp, hash_path)
+            dest.add(job.raw_subdir, hash_name)
+        final_path = hash_path
+    else:
+        final_path = job.raw_subdir / name
+        os.rename(temp, final_path)
+        dest.add(job.raw_subdir, name)
+    if partials is not None:
+        partials.finish(temp)
+    return final_path, _link_bydate(job, final_path, dest)
+
+
+def _link_bydate(job: CopyJob, final_path: Path, dest: DestPlanner) -> Path:
+    dest.makedirs(job.date_path)
+    link_path = job.date_path / final_path.name
+    if not dest.exists(job.date_path, final_path.name):
+        # Two workers may link the same name into one day folder at once.
+        with contextlib.suppress(FileExistsError):
+            os.link(final_path, link_path)
+        dest.add(job.date_path, final_path.name)
+    return link_path
+
+
+def _grow_partial(
+    job: CopyJob, cfg, partials: PartialCopies, volume: FatVolume | None = None
+) -> int:
+    """Append what a not yet stable file gained to its .partial; returns bytes."""
+    name = Path(job.rel).name
+    partial = partials.get(
+        job.raw_subdir, name, job.rel, job.size, job.mtime, _hash_algo(cfg), growing=True
+    )
+    job.raw_subdir.mkdir(parents=True, exist_ok=True)
+    if volume is not None:
+        try:
+            with volume.open_file(job.rel, job.size, job.mtime) as reader:
+                return partial.extend(reader, cfg.copy_chunk)
+        except (FatError, FileNotFoundError) as exc:
+            log(f"fat copy fallback to mount: {job.rel}: {exc}")
+    with open(job.src, "rb", buffering=0) as fsrc:
+        return partial.extend(fsrc, cfg.copy_chunk)
+
+
+def _progressive_match(globs: list[str], rel: str) -> bool:
+    """SYNC_PROGRESSIVE_GLOBS: patterns with a / match the path, others the name."""
+    name = Path(rel).name.lower()
+    return any(
+        fnmatch.fnmatchcase(rel.lower() if "/" in g else name, g.lower()) for g in globs
+    )
+
+
+def _partial_copies(cfg) -> PartialCopies | None:
+    """SYNC_RESUME_MIN_MB registry; expires stale part and temp files once per cycle."""
+    min_mb = int(getattr(cfg, "sync_resume_min_mb", 0))
+    if min_mb <= 0 and not getattr(cfg, "sync_progressive_globs", []):
         return None
-    manifest_path = cfg.sync_manifest_path
-    new_digest = compute_manifest(mount_root)
-    old_digest, old_count, old_mode = read_manifest_state(manifest_path)
-    if new_digest == old_digest:
-        return new_digest, old_count + 1, True, old_mode
-    return new_digest, 0, False, "suspend"
+    partials = PartialCopies(
+        cfg.sync_resume_file,
+        max(0, min_mb) << 20,
+        int(getattr(cfg, "sync_resume_segment_mb", 64)) << 20,
+        float(getattr(cfg, "sync_resume_ttl_days", 3)) * 86400,
+    )
+    expired = partials.expire(root=(cfg.mirror_mount / "raw").resolve())
+    if expired:
+        log(f"sync resume: removed {expired} stale partial copies")
+    if partials.entries:
+        log(f"sync resume: {len(partials.entries)} partial copies to continue")
+    return partials
+
+
+def _copy_job(
+    job: CopyJob,
+    cfg,
+    durable: bool,
+    dest: DestPlanner,
+    volume: FatVolume | None = None,
+    partials: PartialCopies | None = None,
+) -> tuple:
+    """Copy one stable file; runs on a copy worker when SYNC_COPY_WORKERS>1.
+
+    Per-file durability (durable=True) fsyncs, renames and links right here
+    and returns (final, link, digest). Batch durability only writes the temp
+    and returns (temp, digest): CopyPipeline renames it after one syncfs.
+    The DB row is always written by CopyPipeline on the scanning thread.
+    """
+    temp, digest = _copy_temp(job, cfg, durable, volume, partials)
+    if not durable:
+        return temp, digest
+    final_path, link_path = _finalize_copy(job, cfg, temp, digest, dest, partials)
+    return final_path, link_path, digest
+
+
+class CopyPipeline:
+    """Runs copy jobs on a bounded worker pool and records them in order.
+
+    With one worker every job runs inline. Otherwise up to twice the worker
+    count may be in flight; results are always consumed in submission order,
+    so mark_synced rows land exactly as the serial loop would write them and a
+    row is never recorded before its file and bydate link exist.
+
+    SYNC_DURABILITY=batch skips the per-file fsync: finished temps are
+    collected, one syncfs flushes the whole batch, and only then are they
+    renamed into place and their rows committed. A crash before the syncfs
+    leaves only hidden temps and no DB rows, so no row ever points at
+    unflushed data.
+
+    Per-file durability commits a checkpoint every SYNC_CHECKPOINT_FILES
+    recorded copies or SYNC_CHECKPOINT_SEC seconds, so a cycle killed late
+    keeps the rows of what it already copied.
+    """
+
+    def __init__(
+        self, cfg, conn, state, counters: dict, now: int, volume: FatVolume | None = None
+    ) -> None:
+        self.cfg = cfg
+        self.volume = volume
+        self.conn = conn
+        self.state = state
+        self.counters = counters
+        self.now = now
+        workers = max(1, int(getattr(cfg, "sync_copy_workers", 1)))
+        self.max_inflight = workers * 2
+        self.executor = ThreadPoolExecutor(workers, "sync-copy") if workers > 1 else None
+        self.pending: deque[tuple[CopyJob, Future, tuple]] = deque()
+        self.inflight_names: set[tuple[Path, str]] = set()
+        self.durable = getattr(cfg, "sync_durability", "file") != "batch"
+        self.batch_files = max(1, int(getattr(cfg, "sync_durability_batch_files", 256)))
+        self.batch_bytes = max(1, int(getattr(cfg, "sync_durability_batch_mb", 512))) << 20
+        self.batch: list[tuple[CopyJob, Path, str]] = []
+        self.batch_size = 0
+        self.checkpoint_files = max(0, int(getattr(cfg, "sync_checkpoint_files", 500)))
+        self.checkpoint_sec = float(getattr(cfg, "sync_checkpoint_sec", 30))
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+        self.partials = _partial_copies(cfg)
+        self.dest = DestPlanner()
+        self.progressive_globs = list(getattr(cfg, "sync_progressive_globs", []))
+
+    def submit(self, job: CopyJob) -> None:
+        if self.executor is None:
+            self._complete(
+                job, _copy_job(job, self.cfg, self.durable, self.dest, self.volume, self.partials)
+            )
+            return
+        # The plain and the collision (_<mtime>) name a job may write; two jobs
+        # racing for one of them in the same folder would break the collision
+        # check, so wait for the earlier one first.
+        name = Path(job.rel).name
+        names = (
+            (job.raw_subdir, name),
+            (job.raw_subdir, f"{Path(name).stem}_{job.mtime}{Path(name).suffix}"),
+        )
+        while self.pending and (
+            len(self.pending) >= self.max_inflight
+            or any(n in self.inflight_names for n in names)
+        ):
+            self._complete_oldest()
+        self.inflight_names.update(names)
+        future = self.executor.submit(
+            _copy_job, job, self.cfg, self.durable, self.dest, self.volume, self.partials
+        )
+        self.pending.append((job, future, names))
+
+    def _complete_oldest(self) -> None:
+        job, future, names = self.pending.popleft()
+        self.inflight_names.difference_update(names)
+        self._complete(job, future.result())
+
+    def _complete(self, job: CopyJob, result: tuple) -> None:
+        if self.durable:
+            final_path, link_path, digest = result
+            self._record(job, final_path, link_path, digest)
+            return
+        temp, digest = result
+        self.batch.append((job, temp, digest))
+        self.batch_size += job.size
+        if len(self.batch) >= self.batch_files or self.batch_size >= self.batch_bytes:
+            self._flush_batch()
+
+    def _flush_batch(self) -> None:
+        if not self.batch:
+            return
+        # Every temp in the batch is complete (its copy returned), so a single
+        # syncfs covers them all.
+        if not syncfs(self.cfg.mirror_mount):
+            for _, temp, _ in self.batch:
+                fsync_path(temp)
+        for job, temp, digest in self.batch:
+            final_path, link_path = _finalize_copy(
+                job, self.cfg, temp, digest, self.dest, self.partials
+            )
+            self._record(job, final_path, link_path, digest)
+        self.batch.clear()
+        self.batch_size = 0
+        self.checkpoint()
+
+    def checkpoint(self) -> None:
+        self.state.flush()
+        self.conn.commit()
+        self.uncommitted = 0
+        self.last_commit = time.monotonic()
+
+    def _record(
+        self,
+        job: CopyJob,
+        final_path: Path,
+        link_path: Path,
+        digest: str,
+        checkpoint: bool = True,
+    ) -> None:
+        self.state.mark_synced(
+            job.rel, job.size, job.mtime, self._mirror_rel(final_path),
+            self._mirror_rel(link_path), self.now, digest, _hash_algo(self.cfg), job.stable_via,
+        )
+        self.uncommitted += 1
+        if checkpoint and self.durable and (
+            (self.checkpoint_files and self.uncommitted >= self.checkpoint_files)
+            or (self.checkpoint_sec > 0
+                and time.monotonic() - self.last_commit >= self.checkpoint_sec)
+        ):
+            self.checkpoint()
+        counters = self.counters
+        counters["synced"] += 1
+        if job.stable_via != "scan":
+            counters[f"synced_{job.stable_via}"] = counters.get(f"synced_{job.stable_via}", 0) + 1
+        log_every = counters.get("log_every", 0)
+        if log_every > 0 and counters["synced"] % log_every == 0:
+            log(f"sync progress: synced={counters['synced']} scanned={counters['scanned']}")
+
+    def _mirror_rel(self, path: Path) -> str:
+        # synced_files keeps mirror paths relative to MIRROR_MOUNT.
+        try:
+            return path.relative_to(self.cfg.mirror_mount).as_posix()
+        except ValueError:
+            return str(path)
+
+    def drain(self) -> None:
+        while self.pending:
+            self._complete_oldest()
+        self._flush_batch()
+
+    def salvage(self) -> None:
+        """After a failure: record every copy that still completes, skip the rest.
+
+        Jobs not started yet are cancelled; running ones are waited for. A
+        copy that is on disk but has no row would be copied again next run,
+        next to itself under a collision name.
+        """
+        for _, future, _ in self.pending:
+            future.cancel()
+        while self.pending:
+            job, future, names = self.pending.popleft()
+            self.inflight_names.difference_update(names)
+            if future.cancelled():
+                continue
+            try:
+                result = future.result()
+            except Exception:
+                continue
+            self._complete(job, result)
+        self._flush_batch()
+
+    def copy_unit(self, unit: str, jobs: list[CopyJob], target: Path) -> None:
+        """Copy the files of a SYNC_FOLDER_UNITS folder and publish them together.
+
+        A folder not yet in the mirror is built in a hidden staging folder
+        next to `target`, flushed with one syncfs and renamed into place; its
+        bydate links and rows follow, in one transaction. Files added to a
+        folder that is already published are copied into it as usual and
+        also committed together.
+
+        The staging folder carries UNIT_PENDING_FILE (each file's identity,
+        published path and digest) until the rows are committed. A cycle
+        killed between the rename and the commit leaves it in the published
+        folder, and the next one records those files from it instead of
+        copying them again next to themselves as collision names.
+        """
+        self.drain()
+        if target.exists():
+            for job in self._adopt_published(unit, jobs, target):
+                self.submit(job)
+            self.drain()
+            self.checkpoint()
+            return
+        staging = target.parent / f".{target.name}.unit"
+        # Leftover of a unit that was interrupted before its rename.
+        shutil.rmtree(staging, ignore_errors=True)
+        append_always = self.cfg.append_always
+
+        def stage(job: CopyJob) -> tuple[CopyJob, Path, str]:
+            staged = replace(
+                job, raw_subdir=staging / Path(job.rel).parent.relative_to(unit)
+            )
+            temp, digest = _copy_temp(staged, self.cfg, False, self.volume)
+            name = Path(job.rel).name
+            if append_always:
+                name = f"{Path(name).stem}_{job.mtime}_{digest[:8]}{Path(name).suffix}"
+            path = staged.raw_subdir / name
+            os.rename(temp, path)
+            return job, path, digest
+
+        if self.executor is not None:
+            staged = list(self.executor.map(stage, jobs))
+        else:
+            staged = [stage(job) for job in jobs]
+        pending = staging / UNIT_PENDING_FILE
+        pending.write_text(json.dumps([
+            [job.rel, job.size, job.mtime, path.relative_to(staging).as_posix(), digest]
+            for job, path, digest in staged
+        ]))
+        if not syncfs(self.cfg.mirror_mount):
+            for _, path, _ in staged:
+                fsync_path(path)
+            fsync_path(pending)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(staging, target)
+        for job, path, digest in staged:
+            final_path = target / path.relative_to(staging)
+            link_path = _link_bydate(job, final_path, self.dest)
+            self._record(job, final_path, link_path, digest, False)
+        self.checkpoint()
+        (target / UNIT_PENDING_FILE).unlink(missing_ok=True)
+        self.counters["units"] = self.counters.get("units", 0) + 1
+
+    def _adopt_published(self, unit: str, jobs: list[CopyJob], target: Path) -> list[CopyJob]:
+        """Record the files an interrupted unit already published; returns the rest.
+
+        A file is adopted only if UNIT_PENDING_FILE lists its identity and
+        its published copy is still there with that size.
+        """
+        pending = target / UNIT_PENDING_FILE
+        try:
+            entries = json.loads(pending.read_text())
+            published = {
+                (rel, int(size), int(mtime)): (str(path), str(digest))
+                for rel, size, mtime, path, digest in entries
+            }
+        except FileNotFoundError:
+            return jobs
+        except (OSError, ValueError, TypeError) as exc:
+            log(f"sync unit: ignoring unreadable {pending}: {exc}")
+            published = {}
+        rest = []
+        adopted = 0
+        for job in jobs:
+            found = published.get((job.rel, job.size, job.mtime))
+            try:
+                final_path = safe_join(target, Path(found[0])) if found else None
+                if final_path is None or final_path.stat().st_size != job.size:
+                    rest.append(job)
+                    continue
+            except (FileNotFoundError, ValueError):
+                rest.append(job)
+                continue
+            link_path = _link_bydate(job, final_path, self.dest)
+            self._record(job, final_path, link_path, found[1], False)
+            adopted += 1
+        self.checkpoint()
+        pending.unlink(missing_ok=True)
+        if adopted:
+            log(f"sync unit: {unit}: recorded {adopted} files published before an interruption")
+        return rest
+
+    def progressive(self, rel: str) -> bool:
+        return bool(self.progressive_globs) and _progressive_match(self.progressive_globs, rel)
+
+    def grow(self, job: CopyJob) -> None:
+        """Mirror the new tail of a growing file now; it is finalized once stable."""
+        try:
+            added = _grow_partial(job, self.cfg, self.partials, self.volume)
+        except OSError as exc:
+            log(f"progressive copy failed: {job.rel}: {exc}")
+            return
+        if added:
+            counters = self.counters
+            counters["grown_files"] = counters.get("grown_files", 0) + 1
+            counters["grown_bytes"] = counters.get("grown_bytes", 0) + added
+
+    def close(self) -> None:
+        if self.executor is not None:
+            for _, future, _ in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=True)
+            self.pending.clear()
+
 
 def _process_file(
-    path: Path,
-    st: os.stat_result,
+    rec: FileRecord,
     mount_root: Path,
     cfg,
-    conn,
+    state,
+    copier: CopyPipeline,
     raw_dir: Path,
     bydate_dir: Path,
     now: int,
     counters: dict,
     force_stable: bool = False,
+    forced_via: str = "offline",
 ) -> None:
     counters["scanned"] += 1
-    rel = path.relative_to(mount_root)
-    size = int(st.st_size)
-    mtime = int(st.st_mtime)
+    rel, size, mtime = rec
     if size >= cfg.max_file_size:
         counters["skipped_large"] += 1
         return
 
-    # Offline processing of a detached LV (offline-maint before wipe): the host
-    # is no longer writing, so every file is final. Bypass the stability gate so
-    # files written just before rotation are captured instead of being wiped.
-    stable = update_state(conn, str(rel), size, mtime, now)
-    if not force_stable and stable < cfg.stable_scans:
+    # Offline processing of a detached LV (offline-maint before wipe), or an
+    # active LV its write counters prove idle since the previous snapshot
+    # (forced_via="counter"): the host is not writing, so every file is
+    # final. Bypass the stability gate so files written just before rotation
+    # are captured instead of being wiped.
+    stable = state.update(rel, size, mtime, now)
+    progressive = copier.progressive(rel)
+    growing = False
+    if stable >= cfg.stable_scans:
+        stable_via = "scan"
+    elif force_stable:
+        stable_via = forced_via
+    elif progressive:
+        stable_via = ""
+        growing = True
+    else:
         return
 
-    if is_already_synced(conn, str(rel), size, mtime):
+    if state.is_synced(rel, size, mtime):
         return
 
-    dt = datetime.fromtimestamp(mtime if cfg.bydate_use_file_time else now)
-    date_path = bydate_dir / dt.strftime("%Y/%m/%d")
-
-    raw_subdir = safe_join(raw_dir, rel.parent)
-    name = rel.name
-    stem = Path(name).stem
-    suffix = Path(name).suffix
-    collision = (raw_subdir / name).exists()
-    if cfg.append_always:
-        collision = True
-    final_name = f"{stem}_{mtime}{suffix}" if collision else name
+    job = _make_job(
+        rec, mount_root, cfg, raw_dir, bydate_dir, now, stable_via, progressive, copier.dest
+    )
+    if growing:
+        copier.grow(job)
+    else:
+        copier.submit(job)
 
-    dest_path, digest = atomic_copy(path, raw_subdir, final_name, cfg.copy_chunk)
 
-    if collision:
-        hash_name = f"{Path(final_name).stem}_{digest[:8]}{suffix}"
-        hash_path = raw_subdir / hash_name
-        if hash_path.exists():
-            dest_path.unlink(missing_ok=True)
-            final_path = hash_path
-        else:
-            dest_path.rename(hash_path)
-            final_path = hash_path
+def _make_job(
+    rec: FileRecord,
+    mount_root: Path,
+    cfg,
+    raw_dir: Path,
+    bydate_dir: Path,
+    now: int,
+    stable_via: str,
+    progressive: bool = False,
+    dest: DestPlanner | None = None,
+) -> CopyJob:
+    rel, size, mtime = rec
+    dt = datetime.fromtimestamp(mtime if cfg.bydate_use_file_time else now)
+    date_path = bydate_dir / dt.strftime("%Y/%m/%d")
+    parent = rel.rpartition("/")[0]
+    if dest is not None:
+        raw_subdir = dest.raw_subdir(raw_dir, parent)
     else:
-        final_path = dest_path
+        raw_subdir = safe_join(raw_dir, Path(parent))
+    return CopyJob(
+        mount_root / rel, rel, size, mtime, raw_subdir, date_path, stable_via, progressive
+    )
+
 
-    date_path.mkdir(parents=True, exist_ok=True)
-    link_path = date_path / final_path.name
-    if not link_path.exists():
-        os.link(final_path, link_path)
+def _process_unit(
+    unit: str,
+    listing: list[tuple[str, list[FileRecord]]],
+    mount_root: Path,
+    cfg,
+    state,
+    copier: CopyPipeline,
+    raw_dir: Path,
+    bydate_dir: Path,
+    now: int,
+    counters: dict,
+    force_stable: bool = False,
+    forced_via: str = "offline",
+    manifest: DirManifest | None = None,
+) -> None:
+    """SYNC_FOLDER_UNITS: handle a fully listed folder at SYNC_SCAN_DEPTH.
 
-    mark_synced(conn, str(rel), size, mtime, str(final_path), str(link_path), now)
-    counters["synced"] += 1
-    log_every = counters.get("log_every", 0)
-    if log_every > 0 and counters["synced"] % log_every == 0:
-        log(f"sync progress: synced={counters['synced']} scanned={counters['scanned']}")
+    Every file still goes through the stability gate, but nothing is
+    copied until all of them pass it; then the unsynced ones are copied as
+    one unit (CopyPipeline.copy_unit). The dir manifest may only skip the
+    folder as a whole: a settled subfolder of a unit that is still waiting
+    has not been copied yet.
+    """
+    if manifest is not None:
+        settled = [manifest.observe(rel, files) for rel, files in listing]
+        if all(settled):
+            counters["scanned"] += sum(len(files) for _, files in listing)
+            counters["unchanged_dirs"] += len(listing)
+            for _, files in listing:
+                state.touch([rec.rel for rec in files], now)
+            return
+    jobs: list[CopyJob] = []
+    ready = True
+    for _, files in listing:
+        for rec in files:
+            counters["scanned"] += 1
+            rel, size, mtime = rec
+            if size >= cfg.max_file_size:
+                counters["skipped_large"] += 1
+                continue
+            stable = state.update(rel, size, mtime, now)
+            if stable >= cfg.stable_scans:
+                stable_via = "scan"
+            elif force_stable:
+                stable_via = forced_via
+            else:
+                ready = False
+                continue
+            if ready and not state.is_synced(rel, size, mtime):
+                jobs.append(_make_job(
+                    rec, mount_root, cfg, raw_dir, bydate_dir, now, stable_via, False,
+                    copier.dest,
+                ))
+    if not ready:
+        counters["units_waiting"] = counters.get("units_waiting", 0) + 1
+        return
+    if jobs:
+        copier.copy_unit(unit, jobs, safe_join(raw_dir, Path(unit)))
 
 
 def check_mirror_free_space(cfg) -> bool:
@@ -601,7 +1288,7 @@ def check_mirror_free_space(cfg) -> bool:
         if used_pct >= cfg.mirror_retention_trigger_pct:
             threshold = cfg.mirror_retention_trigger_pct
             log(f"mirror usage {used_pct}% >= {threshold}%, triggering retention")
-            subprocess.run(
+            proc.run(
                 ["/bin/systemctl", "start", "mirror-retention.service"],
                 check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
             )
@@ -610,9 +1297,236 @@ def check_mirror_free_space(cfg) -> bool:
     return True
 
 
-def stable_and_copy(cfg, mount_root: Path, conn, force_stable: bool = False) -> None:
+def open_fat_volume(
+    cfg, dev: str, offset: int | None, mount_root: Path, for_delta: bool = False
+) -> FatVolume | None:
+    """FatVolume on the snapshot device when SYNC_SCAN_SOURCE or SYNC_COPY_SOURCE
+    is fat, or when block delta detection (`for_delta`) needs it.
+
+    The FAT listing is checked against the mount at the snapshot root (names,
+    sizes, mtimes); any disagreement means the offset or timezone is wrong, so
+    None is returned and the run lists and copies through the mount instead.
+    """
+    if not for_delta and "fat" not in (
+        getattr(cfg, "sync_scan_source", "mount"), getattr(cfg, "sync_copy_source", "mount")
+    ):
+        return None
+    mount_tree = MountTree(mount_root)
+    tz_offset = int(getattr(cfg, "sync_fat_tz_offset_min", 0)) * 60
+    try:
+        volume = FatVolume(dev, offset or 0, tz_offset)
+    except (OSError, FatError) as exc:
+        log(f"fat reader unavailable, using mount: {exc}")
+        return None
+    try:
+        fat_files, fat_dirs = volume.scan_level("")
+    except FatError as exc:
+        log(f"fat reader unavailable, using mount: {exc}")
+        volume.close()
+        return None
+    mnt_files, mnt_dirs = mount_tree.scan_level("")
+    if sorted(fat_files) != sorted(mnt_files) or sorted(fat_dirs) != sorted(mnt_dirs):
+        log("fat reader disagrees with the mount at the snapshot root, using mount")
+        volume.close()
+        return None
+    volume.fallback = mount_tree
+    return volume
+
+
+def _under_any(rel: str, roots: list[str]) -> bool:
+    return any(rel == r or rel.startswith(f"{r}/") for r in roots)
+
+
+def _outermost(roots: list[str]) -> list[str]:
+    """Dedupe `roots`, dropping any that lies inside another one."""
+    out: list[str] = []
+    for rel in sorted(set(roots)):
+        if not _under_any(rel, out):
+            out.append(rel)
+    return out
+
+
+PRIO_HOT, PRIO_SHALLOW, PRIO_AUDIT = 0, 1, 2
+BACKLOG_VERSION = 1
+
+
+def _depth(rel: str) -> int:
+    return rel.count("/") + 1 if rel else 0
+
+
+def _merge_scan_units(
+    units: list[tuple[int, int, str, bool]],
+) -> list[tuple[int, int, str, bool]]:
+    """Dedupe (priority, rank, rel, recursive) units so no directory is listed twice.
+
+    A tree inside another tree, or a single level inside a tree, folds into
+    the enclosing tree, which keeps the best priority of what it absorbed.
+    """
+    trees = _outermost([rel for _, _, rel, recursive in units if recursive])
+    best: dict[tuple[str, bool], tuple[int, int]] = {}
+    for prio, rank, rel, _ in units:
+        enclosing = [t for t in trees if _under_any(rel, [t])]
+        key = (enclosing[0], True) if enclosing else (rel, False)
+        best[key] = min(best.get(key, (prio, rank)), (prio, rank))
+    return sorted((prio, rank, rel, rec) for (rel, rec), (prio, rank) in best.items())
+
+
+class CycleBudget:
+    """SYNC_CYCLE_BUDGET_SEC: wall-clock bound of one cycle and its carry-over.
+
+    The clock starts when the cycle does (snapshot and mount count). Queue
+    units a cycle did not reach are saved per source LV; after a rotation
+    the old LV's leftovers are dropped (offline-maint copies that LV in full).
+    """
+
+    def __init__(self, seconds: float, path: Path, source: str) -> None:
+        self.seconds = seconds
+        self.path = path
+        self.source = source
+        self.started = time.monotonic()
+        self.carried: list[tuple[int, int, str, bool]] = []
+        try:
+            data = json.loads(path.read_text())
+            if data.get("version") == BACKLOG_VERSION and data.get("source") == source:
+                self.carried = [
+                    (int(prio), int(rank), str(rel), bool(rec))
+                    for prio, rank, rel, rec in data.get("units", [])
+                ]
+        except (OSError, ValueError, TypeError, AttributeError):
+            self.carried = []
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.started >= self.seconds
+
+    def save(self, remaining: list[tuple[int, int, str, bool]]) -> None:
+        if not remaining:
+            self.path.unlink(missing_ok=True)
+            return
+        payload = {"version": BACKLOG_VERSION, "source": self.source, "units": remaining}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload))
+        os.replace(tmp, self.path)
+
+
+def _keep_prev_snapshot(cfg) -> None:
+    """Keep this cycle's snapshot as the next cycle's block delta base."""
+    vg = cfg.lvm_vg
+    lv_remove(cfg.sync_prev_snapshot_name, vg)
+    _cleanup_lv_mappings(f"/dev/{vg}/{cfg.snapshot_name}", vg, cfg.snapshot_name)
+    result = proc.run(
+        ["lvrename", vg, cfg.snapshot_name, cfg.sync_prev_snapshot_name], check=False
+    )
+    if result.returncode != 0:
+        # No base next cycle: thin_delta fails and that cycle scans in full.
+        log("block delta: could not keep snapshot as base")
+        lv_remove(cfg.snapshot_name, vg)
+
+
+def _stable_and_copy_snapshot(
+    cfg, dev: str, offset: int | None, conn, source: str | None = None, **kwargs
+) -> bool:
+    """stable_and_copy on the mounted snapshot, with the FAT reader if configured.
+
+    With SYNC_BLOCK_DELTA and a `source` LV, the cycle lists only what
+    changed since the kept previous snapshot, or scans in full (and rebuilds
+    the directory cluster index) when there is no usable base. Returns True
+    when this snapshot should be kept as the next base: never for a cycle
+    that listed nothing.
+    """
+    delta_on = source is not None and getattr(cfg, "sync_block_delta", False)
+    volume = open_fat_volume(cfg, dev, offset, cfg.snapshot_mount, for_delta=delta_on)
+    try:
+        use = volume is not None
+        delta_state = None
+        plan = None
+        if delta_on and use:
+            delta_state = DeltaState(cfg.sync_delta_state_file)
+            if delta_state.usable(source):
+                ranges = thin_delta_ranges(
+                    cfg.lvm_vg, cfg.sync_prev_snapshot_name, cfg.snapshot_name
+                )
+                if ranges is not None:
+                    pending = pending_dirs(conn, int(cfg.stable_scans), delta_state.cycle_start)
+                    plan = delta_state.plan(volume, ranges, pending)
+                    log(
+                        f"block delta: ranges={len(ranges)} dirs={len(plan.dirs)}"
+                        f" new_trees={len(plan.trees)}"
+                    )
+            if plan is None:
+                log("block delta: no usable base, full scan")
+        cycle_start = int(time.time())
+        listed = stable_and_copy(
+            cfg,
+            cfg.snapshot_mount,
+            conn,
+            tree=volume if use and cfg.sync_scan_source == "fat" else None,
+            copy_volume=volume if use and cfg.sync_copy_source == "fat" else None,
+            delta=plan,
+            **kwargs,
+        )
+        if delta_state is None or not listed:
+            # Nothing listed (mirror full): keep the previous base and its
+            # index, so the next delta also covers what changed this cycle.
+            return False
+        try:
+            if plan is None:
+                delta_state.rebuild(volume)
+            else:
+                delta_state.update(volume, plan)
+        except FatError as exc:
+            log(f"block delta: index not updated, next cycle scans in full: {exc}")
+            delta_state.invalidate()
+            return False
+        delta_state.save(source, cycle_start)
+        return True
+    finally:
+        if volume is not None:
+            volume.close()
+
+
+def stable_and_copy(
+    cfg,
+    mount_root: Path,
+    conn,
+    force_stable: bool = False,
+    manifest: DirManifest | None = None,
+    tree=None,
+    copy_volume: FatVolume | None = None,
+    delta: DeltaPlan | None = None,
+    state: BatchState | DirectState | None = None,
+    forced_via: str = "offline",
+    budget: CycleBudget | None = None,
+) -> bool:
+    """Scan the snapshot and copy stable files to the mirror.
+
+    `tree` lists the snapshot (fsops.MountTree over `mount_root` by default,
+    or a fat.FatVolume on the snapshot device). File data is read through
+    `mount_root` unless `copy_volume` is given, in which case each file's
+    cluster runs are read from the device (mount fallback per file).
+    With a block `delta` plan only its directories (one level) and new trees
+    are listed instead of the shallow levels and hot folders; the round-robin
+    cold audit still runs as a safety net. A `state` on `conn` (the daemon's
+    warm BatchState) is used instead of loading one for this run.
+    `force_stable` copies files before they are scan-stable; `forced_via`
+    ("offline" or "counter") is recorded as their synced_files.stable_via.
+
+    Directories are listed from a priority queue: hot trees (newest files
+    first), then the shallow levels, then the audit. With a `budget` the
+    queue stops between directories once it is spent; what is left is
+    saved and queued first-class by the next run.
+
+    With SYNC_FOLDER_UNITS each tree at SYNC_SCAN_DEPTH is a unit: its
+    files are judged and copied together once it is fully listed
+    (_process_unit).
+
+    Returns False if nothing was listed because the mirror is short of
+    free space.
+    """
+    # Fail the cycle up front on a bad SYNC_HASH_ALGO, not on the first copy.
+    new_hasher(_hash_algo(cfg))
     if not check_mirror_free_space(cfg):
-        return
+        return False
     raw_dir = cfg.mirror_mount / "raw"
     bydate_dir = cfg.mirror_mount / "bydate"
     now = int(time.time())
@@ -620,9 +1534,12 @@ def stable_and_copy(cfg, mount_root: Path, conn, force_stable: bool = False) ->
         "scanned": 0,
         "synced": 0,
         "skipped_large": 0,
+        "unchanged_dirs": 0,
         "log_every": max(0, int(getattr(cfg, "sync_log_every", 0))),
     }
-    selected_roots, scan_plan = select_scan_roots(cfg, mount_root)
+    if tree is None:
+        tree = MountTree(mount_root)
+    _, scan_plan = select_scan_roots(cfg, mount_root, tree)
     if scan_plan["selected"]:
         log(
             "sync plan: "
@@ -639,94 +1556,266 @@ def stable_and_copy(cfg, mount_root: Path, conn, force_stable: bool = False) ->
 
     # Files parked above SYNC_SCAN_DEPTH (snapshot root included) never appear
     # under a selected root, so scan those levels non-recursively every run.
-    shallow_roots = [mount_root] + [mount_root / name for name in scan_plan["shallow"]]
+    shallow_rels = [""] + scan_plan["shallow"]
+    tree_roots = scan_plan["selected"]
+    folder_units = getattr(cfg, "sync_folder_units", False)
+    if delta is not None:
+        # Each directory must be listed once per cycle: a second listing
+        # would count as a second stable scan.
+        tree_roots = _outermost(delta.trees + scan_plan["audit"])
+        shallow_rels = [d for d in delta.dirs if not _under_any(d, tree_roots)]
+        if folder_units:
+            # A changed folder inside a unit re-lists the whole unit.
+            inside = [d for d in shallow_rels if _depth(d) > scan_plan["depth"]]
+            tree_roots = _outermost(tree_roots + [
+                "/".join(d.split("/")[:scan_plan["depth"]]) for d in inside
+            ])
+            shallow_rels = [d for d in shallow_rels if not _under_any(d, tree_roots)]
+        log(f"sync delta: dirs={len(shallow_rels)} trees={len(tree_roots)}")
+
+    if state is None:
+        if getattr(cfg, "sync_state_batch", False):
+            state = BatchState(conn, max(1, int(cfg.stable_scans)))
+        else:
+            state = DirectState(conn)
 
-    try:
-        # Every level from the root down to SYNC_SCAN_DEPTH, non-recursive.
-        for shallow in shallow_roots:
-            for path, st in iter_root_files(shallow):
-                _process_file(
-                    path, st, mount_root, cfg, conn, raw_dir, bydate_dir, now,
-                    counters, force_stable,
-                )
+    copier = CopyPipeline(cfg, conn, state, counters, now, copy_volume)
 
-        for root in selected_roots:
-            if not root.exists():
-                continue
-            for path, st in iter_files(root):
-                _process_file(
-                    path, st, mount_root, cfg, conn, raw_dir, bydate_dir, now,
-                    counters, force_stable,
+    def process_dir(rel: str, files: list[FileRecord]) -> None:
+        if manifest is not None and manifest.observe(rel, files):
+            counters["scanned"] += len(files)
+            counters["unchanged_dirs"] += 1
+            # Not re-read, but still present: keep file_state from aging out.
+            state.touch([rec.rel for rec in files], now)
+            return
+        for rec in files:
+            _process_file(
+                rec, mount_root, cfg, state, copier, raw_dir, bydate_dir, now,
+                counters, force_stable, forced_via,
+            )
+
+    def is_unit(root: str, recursive: bool) -> bool:
+        return folder_units and recursive and _depth(root) == scan_plan["depth"]
+
+    unit_listing: dict[str, list[tuple[str, list[FileRecord]]]] = {}
+
+    # Hot (or, with a delta, new) trees first, then every level from the
+    # root down to SYNC_SCAN_DEPTH (non-recursive), then the cold audit.
+    hot = set(delta.trees if delta is not None else scan_plan["hot"])
+    units = [
+        (PRIO_HOT if name in hot else PRIO_AUDIT, rank, name, True)
+        for rank, name in enumerate(tree_roots)
+    ]
+    units += [(PRIO_SHALLOW, rank, rel, False) for rank, rel in enumerate(shallow_rels)]
+    if budget is not None and budget.carried:
+        log(f"sync budget: resuming {len(budget.carried)} carried dirs")
+        units += budget.carried
+    queue = [
+        (prio, rank, seq, rel, recursive, rel)
+        for seq, (prio, rank, rel, recursive) in enumerate(_merge_scan_units(units))
+    ]
+    heapq.heapify(queue)
+    outstanding = Counter(rel for *_, rel in queue)
+    seq = len(queue)
+    # The budget is honoured only once one queue root has been walked to
+    # the end: if snapshot, mount and planning alone use it up, a cycle
+    # that stopped before its first unit would carry everything, forever.
+    walked = 0
+    if budget is not None and queue and budget.expired():
+        log(
+            f"sync budget: WARNING setup alone used the {budget.seconds:g}s budget;"
+            " listing the first unit anyway, raise SYNC_CYCLE_BUDGET_SEC"
+        )
+
+    try:
+        while queue:
+            if budget is not None and walked and budget.expired():
+                break
+            prio, rank, _, rel, recursive, root = heapq.heappop(queue)
+            files, dirs = tree.scan_level(rel)
+            unit = is_unit(root, recursive)
+            if unit:
+                # Judged once the whole folder is listed.
+                unit_listing.setdefault(root, []).append((rel, files))
+            else:
+                if prio == PRIO_HOT:
+                    files = sorted(files, key=lambda rec: (-rec.mtime, rec.rel))
+                process_dir(rel, files)
+            if recursive:
+                prefix = f"{rel}/" if rel else ""
+                for name in dirs:
+                    seq += 1
+                    heapq.heappush(queue, (prio, rank, seq, prefix + name, True, root))
+                    outstanding[root] += 1
+            outstanding[root] -= 1
+            if not outstanding[root]:
+                walked += 1
+            if not outstanding[root] and unit:
+                _process_unit(
+                    root, unit_listing.pop(root), mount_root, cfg, state, copier, raw_dir,
+                    bydate_dir, now, counters, force_stable, forced_via, manifest,
                 )
+            if not outstanding[root] and manifest is not None:
+                # Only a root walked to the end may prune the manifest.
+                manifest.walked_root(root, recursive)
+        copier.drain()
+        state.flush()
         conn.commit()
-    except Exception:
-        conn.rollback()
+        if budget is not None:
+            # A unit cut short is listed again from its root.
+            remaining = _merge_scan_units([
+                (prio, rank, root if is_unit(root, rec) else rel, rec)
+                for prio, rank, _, rel, rec, root in queue
+            ])
+            if remaining:
+                log(
+                    f"sync budget: {budget.seconds:g}s used up,"
+                    f" carrying {len(remaining)} dirs to the next run"
+                )
+            budget.save(remaining)
+    except BaseException:
+        # Failed or interrupted (SIGTERM): keep the rows of everything
+        # already copied so the next run does not copy it again.
+        try:
+            copier.salvage()
+            state.flush()
+            conn.commit()
+            log(f"sync interrupted: kept synced={counters['synced']} scanned={counters['scanned']}")
+        except Exception as exc:
+            log(f"sync interrupted: final commit failed, rolling back: {exc}")
+            conn.rollback()
         raise
+    finally:
+        copier.close()
     log(
         f"sync summary: scanned={counters['scanned']}"
         f" synced={counters['synced']}"
         f" skipped_large={counters['skipped_large']}"
+        f" unchanged_dirs={counters['unchanged_dirs']}"
+        + "".join(
+            f" {key}={counters[key]}"
+            for key in (
+                "synced_counter", "synced_offline", "grown_files", "grown_bytes",
+                "units", "units_waiting",
+            )
+            if counters.get(key)
+        )
     )
+    return True
+
 
+def _partition_offset(cfg, dev: str) -> int | None:
+    path = getattr(cfg, "sync_geometry_file", None)
+    if path is None:
+        return get_partition_offset(dev)
+    return GeometryCache(Path(path)).offset(dev, get_partition_offset)
 
-def run(cfg, dev_override: str | None, offline: bool) -> None:
-    conn = init_db(cfg.state_dir / "vision.db")
+
+@contextlib.contextmanager
+def cycle_lock(cfg):
+    """Serialize cycles: the daemon and one-shot runs (--dev, fallback) share it."""
+    cfg.state_dir.mkdir(parents=True, exist_ok=True)
+    with open(cfg.state_dir / "usb_sync.lock", "w") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def run(
+    cfg,
+    dev_override: str | None,
+    offline: bool,
+    conn=None,
+    state: BatchState | DirectState | None = None,
+) -> None:
+    """One sync cycle. The daemon passes its open `conn` and warm `state`."""
+    proc.reset()
+    # SIGTERM (stop, TimeoutStartSec) unwinds the cycle instead of killing
+    # it: rows of finished copies are committed, the snapshot is unmounted
+    # and removed. Signal handlers can only be set from the main thread.
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, _terminate)
+    try:
+        with cycle_lock(cfg):
+            _run_cycle(cfg, dev_override, offline, conn, state)
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+        log(f"cycle subprocesses: {proc.summary()}")
+
+
+def _terminate(signum, frame) -> None:
+    log("sync: SIGTERM, stopping after a final commit")
+    raise SystemExit(128 + signum)
+
+
+def _run_cycle(cfg, dev_override: str | None, offline: bool, conn, state) -> None:
+    if conn is None:
+        conn = init_db(cfg.state_dir / "vision.db")
 
     if dev_override:
         dev = dev_override
         active = read_active()
         if dev == active:
             raise RuntimeError("refusing to mount active device")
-        active_offset = get_partition_offset(dev)
+        active_offset = _partition_offset(cfg, dev)
         mount_ro(dev, cfg.snapshot_mount, active_offset)
         try:
             record_snapshot_usage(cfg.snapshot_mount, dev)
             # Detached LV (offline-maint before wipe): copy every file, no
             # stability gate, so nothing written just before rotation is lost.
-            stable_and_copy(cfg, cfg.snapshot_mount, conn, force_stable=True)
+            _stable_and_copy_snapshot(
+                cfg, dev, active_offset, conn, force_stable=True, state=state
+            )
         finally:
             umount(cfg.snapshot_mount)
         return
 
     active = read_active()
-    active_offset = get_partition_offset(active)
+    budget = None
+    budget_sec = float(getattr(cfg, "sync_cycle_budget_sec", 0))
+    if budget_sec > 0:
+        budget = CycleBudget(budget_sec, cfg.sync_cycle_backlog_file, active)
+    active_offset = _partition_offset(cfg, active)
+    idle_on = not offline and getattr(cfg, "sync_idle_fast_path", False)
+    before = iostat.sample(active) if idle_on else None
     snap = lv_snapshot(active, cfg.lvm_vg, cfg.snapshot_name)
+    # The snapshot holds exactly the LV at counter `before` only if nothing
+    # was written while it was created.
+    mark = iostat.sample(active) if before is not None else None
+    if mark != before:
+        mark = None
+    idle = mark is not None and mark == iostat.load_sample(cfg.sync_write_mark_file)
+    if idle:
+        log("stability: no writes since the previous snapshot, copying without rescan")
+    keep_snap = False
+    synced = False
     try:
         mount_ro(snap, cfg.snapshot_mount, active_offset)
         record_snapshot_usage(cfg.snapshot_mount, active)
-        sync_manifest = None
+        manifest = None
         if not offline:
             maybe_sync_persist(cfg, cfg.snapshot_mount, active)
-            sync_manifest = maybe_compute_sync_manifest(cfg, cfg.snapshot_mount)
-            if sync_manifest:
-                digest, count, unchanged, mode = sync_manifest
-                resume_scans = max(1, int(cfg.sync_change_resume_scans))
-                if unchanged:
-                    if count > resume_scans:
-                        count = resume_scans
-                    if mode == "suspend" and count >= resume_scans:
-                        mode = "active"
-                else:
-                    mode = "suspend"
-                    count = 0
-                if digest and mode == "active" and unchanged and count >= resume_scans:
-                    log("sync: no changes since last run; skipping copy")
-                    prev_digest, prev_count, prev_mode = read_manifest_state(cfg.sync_manifest_path)
-                    if prev_digest != digest or prev_count != count or prev_mode != mode:
-                        write_manifest_state(cfg.sync_manifest_path, digest, count, mode)
-                    return
-        stable_and_copy(cfg, cfg.snapshot_mount, conn)
-        if not offline and sync_manifest:
-            digest, count, _, mode = sync_manifest
-            resume_scans = max(1, int(cfg.sync_change_resume_scans))
-            if count > resume_scans:
-                count = resume_scans
-            prev_digest, prev_count, prev_mode = read_manifest_state(cfg.sync_manifest_path)
-            if prev_digest != digest or prev_count != count or prev_mode != mode:
-                write_manifest_state(cfg.sync_manifest_path, digest, count, mode)
+            if getattr(cfg, "sync_change_detect", False):
+                settle = max(int(cfg.stable_scans), int(cfg.sync_change_resume_scans))
+                manifest = DirManifest(cfg.sync_dir_manifest_file, settle)
+        keep_snap = _stable_and_copy_snapshot(
+            cfg, snap, active_offset, conn, source=None if offline else active,
+            manifest=manifest, state=state, force_stable=idle, forced_via="counter",
+            budget=budget,
+        )
+        if manifest is not None:
+            update_sync_manifest(cfg, manifest.save())
+        synced = True
     finally:
+        if idle_on:
+            # Only a fully synced snapshot may serve as the idle baseline.
+            iostat.save_sample(cfg.sync_write_mark_file, mark if synced else None)
         umount(cfg.snapshot_mount)
-        lv_remove(cfg.snapshot_name, cfg.lvm_vg)
+        if keep_snap:
+            _keep_prev_snapshot(cfg)
+        else:
+            lv_remove(cfg.snapshot_name, cfg.lvm_vg)
 
 
 def main() -> None:
@@ -737,6 +1826,13 @@ def main() -> None:
     args = parser.parse_args()
 
     cfg = get_config(args.config)
+    if getattr(cfg, "sync_daemon", False) and not args.dev and not args.offline:
+        from .daemon import trigger
+
+        status = trigger(cfg.sync_daemon_socket)
+        if status is not None:
+            raise SystemExit(status)
+        log("sync daemon not reachable, running the cycle in this process")
     run(cfg, args.dev, args.offline)
 
 
@@ -20,6 +20,7 @@ from urllib.parse import parse_qs, urlparse
 
 from vision_sync.config import parse_config_text
 from vision_sync.fsops import safe_join
+from vision_sync.retention import ProtectedMatcher
 
 STATE_DIR = Path("/srv/vision_mirror/.state")
 SHADOW_CONF = STATE_DIR / "vision-gw.conf"
@@ -297,12 +298,14 @@ def set_protected_paths(paths: list) -> tuple:
 
 def get_protected_status() -> dict:
     paths = get_protected_paths()
-    total = 0
+    targets = []
     for rel in paths:
-        try:
-            target = resolve_export_path("mirror", rel)
-        except (ValueError, OSError):
-            continue
+        with contextlib.suppress(ValueError, OSError):
+            targets.append(resolve_export_path("mirror", rel))
+    total = 0
+    # Retention's matcher keeps only outermost roots: a folder protected inside
+    # another protected folder is not counted twice.
+    for target in ProtectedMatcher(targets).roots:
         code, out, _ = run_cmd(["/usr/bin/du", "-sb", str(target)])
         if code == 0 and out:
             with contextlib.suppress(ValueError):
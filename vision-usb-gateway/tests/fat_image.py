@@ -0,0 +1,221 @@
+"""Build small FAT32 images in pure Python for the FatVolume tests and bench.
+
+`tree` maps names to bytes (a file) or to a nested dict (a directory).
+Names that are valid upper- or lower-case 8.3 names get a short entry only
+(lower case via the NT case flags, as Windows and mkfs'd AOI media do);
+anything else gets LFN entries plus a generated NAME~N short name.
+"""
+
+import struct
+import time
+from pathlib import Path
+
+DEFAULT_MTIME = 1_700_000_000
+_SHORT_OK = set(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789$%'-_@~`!(){}^#&")
+
+
+def fat_datetime(ts: int) -> tuple[int, int]:
+    t = time.gmtime(ts)
+    date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    tim = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return date, tim
+
+
+def _lfn_checksum(short: bytes) -> int:
+    s = 0
+    for b in short:
+        s = (((s & 1) << 7) + (s >> 1) + b) & 0xFF
+    return s
+
+
+def _plain_83(name: str) -> tuple[bytes, int] | None:
+    base, dot, ext = name.partition(".")
+    if not base or len(base) > 8 or len(ext) > 3 or "." in ext or (dot and not ext):
+        return None
+    lcase = 0
+    parts = []
+    for part, flag in ((base, 0x08), (ext, 0x10)):
+        if part and part == part.lower() and part != part.upper():
+            lcase |= flag
+        elif part != part.upper():
+            return None
+        raw = part.upper().encode("ascii", "replace")
+        if not set(raw) <= _SHORT_OK:
+            return None
+        parts.append(raw)
+    return parts[0].ljust(8) + parts[1].ljust(3), lcase
+
+
+class FatImageBuilder:
+    def __init__(
+        self,
+        tree: dict,
+        mtimes: dict[str, int] | None = None,
+        cluster_size: int = 512,
+        fragment: bool = False,
+        deleted: tuple[str, ...] = (),
+        label: str = "VISION",
+        slack_clusters: int = 64,
+        total_clusters: int | None = None,
+    ) -> None:
+        self.tree = tree
+        self.mtimes = mtimes or {}
+        self.bps = 512
+        self.spc = cluster_size // self.bps
+        self.cluster_size = cluster_size
+        self.fragment = fragment
+        self.deleted = deleted
+        self.label = label
+        self.slack = slack_clusters
+        self.total_clusters = total_clusters
+        self.next_free = 2
+        self.fat: dict[int, int] = {}
+        self.data: dict[int, bytes] = {}
+        self.chains: dict[str, list[int]] = {}
+
+    def _alloc(self, count: int) -> list[int]:
+        clusters = []
+        for _ in range(max(1, count)):
+            clusters.append(self.next_free)
+            self.next_free += 2 if self.fragment else 1
+        for a, b in zip(clusters, clusters[1:], strict=False):
+            self.fat[a] = b
+        self.fat[clusters[-1]] = 0x0FFFFFFF
+        return clusters
+
+    def _store(self, clusters: list[int], payload: bytes) -> None:
+        cs = self.cluster_size
+        for i, c in enumerate(clusters):
+            self.data[c] = payload[i * cs:(i + 1) * cs]
+
+    def _entries(self, rel: str, node: dict) -> list[tuple]:
+        used: set[bytes] = set()
+        out = []
+        for name, child in node.items():
+            child_rel = f"{rel}/{name}" if rel else name
+            plain = _plain_83(name)
+            if plain is not None and plain[0] not in used:
+                short, lcase, lfn = plain[0], plain[1], None
+            else:
+                stem, _, ext = name.rpartition(".") if "." in name[1:] else (name, "", "")
+                clean = bytes(b for b in stem.upper().encode("ascii", "ignore") if b in _SHORT_OK)
+                e = bytes(b for b in ext.upper().encode("ascii", "ignore") if b in _SHORT_OK)
+                n = 1
+                while True:
+                    tail = f"~{n}".encode()
+                    short = (clean[: 8 - len(tail)] + tail).ljust(8) + e[:3].ljust(3)
+                    if short not in used:
+                        break
+                    n += 1
+                lcase, lfn = 0, name
+            used.add(short)
+            out.append((child_rel, name, child, short, lcase, lfn))
+        return out
+
+    def _dir_bytes(self, entries, self_cluster: int, parent_cluster: int, rel: str) -> bytes:
+        buf = bytearray()
+        if rel:
+            date, tim = fat_datetime(self.mtimes.get(rel, DEFAULT_MTIME))
+            for raw, c in ((b".          ", self_cluster), (b"..         ", parent_cluster)):
+                buf += struct.pack(
+                    "<11sBBBHHHHHHHI", raw, 0x10, 0, 0, tim, date, date, c >> 16, tim, date,
+                    c & 0xFFFF, 0,
+                )
+        else:
+            buf += struct.pack(
+                "<11sBBBHHHHHHHI", self.label.upper().encode().ljust(11)[:11], 0x08,
+                0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+            )
+            for name in self.deleted:
+                plain = _plain_83(name)
+                raw = b"\xe5" + plain[0][1:]
+                buf += struct.pack("<11sBBBHHHHHHHI", raw, 0x20, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+        for child_rel, _name, child, short, lcase, lfn in entries:
+            if lfn is not None:
+                units = lfn.encode("utf-16-le")
+                if len(units) % 26:
+                    units += b"\x00\x00"
+                while len(units) % 26:
+                    units += b"\xff\xff"
+                chunks = [units[i:i + 26] for i in range(0, len(units), 26)]
+                csum = _lfn_checksum(short)
+                for seq in range(len(chunks), 0, -1):
+                    ch = chunks[seq - 1]
+                    first = seq | (0x40 if seq == len(chunks) else 0)
+                    buf += (
+                        bytes([first]) + ch[:10] + bytes([0x0F, 0, csum]) + ch[10:22]
+                        + b"\x00\x00" + ch[22:26]
+                    )
+            is_dir = isinstance(child, dict)
+            cluster = self.chains[child_rel][0] if self.chains.get(child_rel) else 0
+            date, tim = fat_datetime(self.mtimes.get(child_rel, DEFAULT_MTIME))
+            buf += struct.pack(
+                "<11sBBBHHHHHHHI", short, 0x10 if is_dir else 0x20, lcase, 0, tim, date, date,
+                cluster >> 16, tim, date, cluster & 0xFFFF, 0 if is_dir else len(child),
+            )
+        return bytes(buf)
+
+    def _build_dir(self, rel: str, node: dict, parent_cluster: int) -> list[int]:
+        entries = self._entries(rel, node)
+        # Size the directory first so its clusters precede its children.
+        size = 32 * (2 + len(self.deleted) + len(entries))
+        size += sum(32 * ((len(e[5]) + 1 + 12) // 13) for e in entries if e[5] is not None)
+        clusters = self._alloc((size + 32 + self.cluster_size - 1) // self.cluster_size)
+        self.chains[rel] = clusters
+        for child_rel, _name, child, *_ in entries:
+            if isinstance(child, dict):
+                self._build_dir(child_rel, child, clusters[0] if rel else 0)
+            elif child:
+                n = (len(child) + self.cluster_size - 1) // self.cluster_size
+                self.chains[child_rel] = self._alloc(n)
+                self._store(self.chains[child_rel], child)
+        self._store(clusters, self._dir_bytes(entries, clusters[0], parent_cluster, rel))
+        return clusters
+
+    def build(self) -> bytes:
+        self._build_dir("", self.tree, 0)
+        bps, spc = self.bps, self.spc
+        cluster_count = self.total_clusters or self.next_free - 2 + self.slack
+        assert cluster_count >= self.next_free - 2, "image too small for the tree"
+        fat_sectors = ((cluster_count + 2) * 4 + bps - 1) // bps
+        reserved = 32
+        total = reserved + 2 * fat_sectors + cluster_count * spc
+        bs = bytearray(bps)
+        bs[0:3] = b"\xeb\x58\x90"
+        bs[3:11] = b"MSWIN4.1"
+        struct.pack_into(
+            "<HBHBHHBHHHII", bs, 11, bps, spc, reserved, 2, 0, 0, 0xF8, 0, 32, 64, 0, total
+        )
+        struct.pack_into("<IHHIHH", bs, 36, fat_sectors, 0, 0, 2, 1, 6)
+        bs[64] = 0x80
+        bs[66] = 0x29
+        bs[71:82] = b"NO NAME    "
+        bs[82:90] = b"FAT32   "
+        bs[510:512] = b"\x55\xaa"
+        fat = bytearray(fat_sectors * bps)
+        struct.pack_into("<II", fat, 0, 0x0FFFFFF8, 0x0FFFFFFF)
+        for c, v in self.fat.items():
+            struct.pack_into("<I", fat, 4 * c, v)
+        data = bytearray(cluster_count * self.cluster_size)
+        for c, chunk in self.data.items():
+            pos = (c - 2) * self.cluster_size
+            data[pos:pos + len(chunk)] = chunk
+        reserved_area = bytes(bs) + bytes((reserved - 1) * bps)
+        return reserved_area + bytes(fat) * 2 + bytes(data)
+
+
+def build_fat32(path: Path, tree: dict, offset: int = 0, **kwargs) -> FatImageBuilder:
+    """Write a FAT32 image of `tree` to `path`, `offset` bytes into the file.
+
+    With an offset the gap starts with an MBR holding one FAT32 (LBA) entry.
+    """
+    builder = FatImageBuilder(tree, **kwargs)
+    image = builder.build()
+    head = bytearray(offset)
+    if offset:
+        entry = struct.pack("<B3sB3sII", 0, b"\0\0\0", 0x0C, b"\0\0\0", offset // 512,
+                            len(image) // 512)
+        head[446:462] = entry
+        head[510:512] = b"\x55\xaa"
+    path.write_bytes(bytes(head) + image)
+    return builder
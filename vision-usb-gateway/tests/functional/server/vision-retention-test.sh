@@ -90,31 +90,24 @@ ln "$RAW/b.txt" "$BYDATE2/b.txt"
 ln "$RAW/c.txt" "$BYDATE3/c.txt"
 
 python3 - <<PY
-import sqlite3
+import time
 from pathlib import Path
 
-db = Path("$STATE") / "vision.db"
-conn = sqlite3.connect(str(db))
-conn.execute("""
-CREATE TABLE IF NOT EXISTS synced_files (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  source_path TEXT,
-  size INTEGER,
-  mtime INTEGER,
-  raw_path TEXT,
-  bydate_path TEXT,
-  synced_at INTEGER
-)
-""")
+from vision_sync.db import init_db, mark_synced
+
+conn = init_db(Path("$STATE") / "vision.db")
+# Recent synced_at values: rows older than RETENTION_ROW_TTL_DAYS are pruned
+# before the delete loop runs.
+now = int(time.time())
+# The oldest row uses the current form (paths relative to MIRROR_MOUNT); the
+# others are absolute, as rows written before schema v2 are.
 rows = [
-  ("a.txt", 1, 1, "$RAW/a.txt", "$BYDATE/a.txt", 1),
-  ("b.txt", 1, 1, "$RAW/b.txt", "$BYDATE2/b.txt", 2),
-  ("c.txt", 1, 1, "$RAW/c.txt", "$BYDATE3/c.txt", 3),
+  ("a.txt", 1, 1, "raw/a.txt", "bydate/2024/01/01/a.txt", now - 3),
+  ("b.txt", 1, 1, "$RAW/b.txt", "$BYDATE2/b.txt", now - 2),
+  ("c.txt", 1, 1, "$RAW/c.txt", "$BYDATE3/c.txt", now - 1),
 ]
-conn.executemany(
-  "INSERT INTO synced_files (source_path,size,mtime,raw_path,bydate_path,synced_at) VALUES (?,?,?,?,?,?)",
-  rows,
-)
+for row in rows:
+  mark_synced(conn, *row)
 conn.commit()
 conn.close()
 PY
@@ -141,7 +134,7 @@ rows = conn.execute("SELECT raw_path FROM synced_files ORDER BY synced_at ASC").
 conn.close()
 remaining = [r[0] for r in rows]
 print("Remaining:", remaining)
-assert "$RAW/a.txt" not in remaining, "oldest row should be deleted"
+assert "raw/a.txt" not in remaining, "oldest row should be deleted"
 assert "$RAW/b.txt" in remaining and "$RAW/c.txt" in remaining, "newer rows should remain"
 PY
 
@@ -76,11 +76,10 @@ sync
 printf '{"paths": ["raw/keep_me"]}' >"$MIRROR/.state/retention-protected.json"
 
 python3 - "$MIRROR/.state/vision.db" <<'PY'
-import sqlite3, sys
-c = sqlite3.connect(sys.argv[1])
-c.execute("CREATE TABLE synced_files (id INTEGER PRIMARY KEY, raw_path TEXT, bydate_path TEXT, synced_at INT)")
-c.execute("CREATE TABLE file_state (path TEXT, last_seen INT)")
-c.commit()
+import sys
+from pathlib import Path
+from vision_sync.db import init_db
+init_db(Path(sys.argv[1])).close()
 PY
 
 # mirror-retention.sh honours CONF_FILE; plain env vars would be overwritten by
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from vision_sync.activity import ActivityScheduler
+from vision_sync.iostat import written_sectors
+
+
+def _run(scheduler: ActivityScheduler, samples: list[tuple[float, int]]) -> list[float]:
+    fired = []
+    for now, written in samples:
+        if scheduler.observe(now, written):
+            scheduler.fired(now)
+            fired.append(now)
+    return fired
+
+
+def test_fires_after_burst_then_follow_up_then_sleeps():
+    s = ActivityScheduler(quiet_sec=5, max_defer_sec=120, followups=1)
+    s.observe(0, 100)
+    s.fired(0)
+    # Follow-up of the startup cycle at 5; burst from t=10 to t=14, synced
+    # 5 s after it ends and once more for the second stable scan.
+    samples = [(t, 100 + 8 * max(0, min(t, 14) - 9)) for t in range(1, 60)]
+    assert _run(s, samples) == [5, 19, 24]
+
+
+def test_streaming_writes_fire_at_the_defer_cap():
+    s = ActivityScheduler(quiet_sec=5, max_defer_sec=30, followups=0)
+    s.observe(0, 0)
+    s.fired(0)
+    assert _run(s, [(t, t * 8) for t in range(1, 100)]) == [31, 62, 93]
+
+
+def test_idle_lv_starts_nothing():
+    s = ActivityScheduler(quiet_sec=5, max_defer_sec=30, followups=1)
+    assert _run(s, [(t, 500) for t in range(100, 400)]) == [105, 110]
+
+
+def test_written_sectors_reads_the_write_field(tmp_path: Path):
+    stat = tmp_path / "stat"
+    stat.write_text("  120 3 4000 50  77 9 123456 800 0 900 1000 0 0 0 0\n")
+    assert written_sectors(stat) == 123456
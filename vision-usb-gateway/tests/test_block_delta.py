@@ -0,0 +1,177 @@
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+from fat_image import build_fat32
+
+from vision_sync import sync
+from vision_sync.db import init_db, update_state
+from vision_sync.delta import DeltaPlan, DeltaState, compare_ranges, parse_thin_delta, pending_dirs
+from vision_sync.fat import FatVolume
+from vision_sync.sync import stable_and_copy
+
+BASE = {
+    "a": {"x.jpg": b"x" * 900},
+    "b": {"y.jpg": b"y" * 900},
+}
+
+
+def _image(path: Path, tree: dict) -> Path:
+    # A fixed cluster count keeps the FAT/data layout identical across images,
+    # the way a real LV's geometry never changes between snapshots.
+    build_fat32(path, tree, total_clusters=256)
+    return path
+
+
+def _materialize(root: Path, tree: dict, rel: str = "") -> None:
+    for name, child in tree.items():
+        path = root / rel / name
+        if isinstance(child, dict):
+            path.mkdir(parents=True, exist_ok=True)
+            _materialize(root, child, f"{rel}/{name}" if rel else name)
+        else:
+            path.write_bytes(child)
+        os.utime(path, (1_700_000_000, 1_700_000_000))
+
+
+def _cfg(tmp_path: Path, mount: Path) -> SimpleNamespace:
+    mirror = tmp_path / "mirror"
+    return SimpleNamespace(
+        mirror_mount=mirror, state_dir=mirror / ".state", mirror_free_min_mb=0,
+        mirror_retention_trigger_pct=101, max_file_size=1 << 30, stable_scans=2,
+        copy_chunk=1 << 20, append_always=False, bydate_use_file_time=False, sync_log_every=0,
+        sync_scan_depth=1, sync_hot_dirs=0, sync_cold_audit_dirs_per_run=0,
+        sync_dir_index_file=tmp_path / "idx.json", snapshot_mount=mount,
+        sync_scan_source="fat", sync_copy_source="mount", sync_fat_tz_offset_min=0,
+        sync_block_delta=True, lvm_vg="vg0", snapshot_name="snap",
+        sync_prev_snapshot_name="snap_prev", sync_delta_state_file=tmp_path / "delta.json",
+    )
+
+
+def test_parse_thin_delta_merges_changed_runs():
+    xml = """<superblock uuid="" time="1" transaction="2" data_block_size="128" nr_data_blocks="0">
+  <diff left="3" right="4">
+    <same begin="0" length="10"/>
+    <different begin="10" length="2"/>
+    <right_only begin="12" length="1"/>
+    <same begin="13" length="5"/>
+    <left_only begin="18" length="1"/>
+  </diff>
+</superblock>"""
+    assert parse_thin_delta(xml, 65536) == [(10 * 65536, 3 * 65536), (18 * 65536, 65536)]
+
+
+def test_changed_file_maps_to_its_directory_only(tmp_path: Path):
+    old = _image(tmp_path / "old.img", BASE)
+    new = _image(tmp_path / "new.img", {"a": BASE["a"], "b": {**BASE["b"], "z.jpg": b"z" * 700}})
+    state = DeltaState(tmp_path / "delta.json")
+    with FatVolume(old) as vol:
+        state.rebuild(vol)
+    state.save("usb_0", 100)
+
+    state = DeltaState(tmp_path / "delta.json")
+    assert state.usable("usb_0") and not state.usable("usb_1")
+    with FatVolume(new) as vol:
+        plan = state.plan(vol, compare_ranges(old, new, chunk=512), set())
+    assert plan == DeltaPlan(["b"], [])
+
+
+def test_new_directory_is_walked_and_indexed(tmp_path: Path):
+    old = _image(tmp_path / "old.img", BASE)
+    new = _image(tmp_path / "new.img", {**BASE, "c": {"d": {"n.jpg": b"n"}}})
+    state = DeltaState(tmp_path / "delta.json")
+    with FatVolume(old) as vol:
+        state.rebuild(vol)
+    with FatVolume(new) as vol:
+        plan = state.plan(vol, compare_ranges(old, new, chunk=512), {"a"})
+        assert plan == DeltaPlan(["", "a"], ["c"])
+        state.update(vol, plan)
+        assert state.dirs["c/d"] == vol.dir_chain("c/d")
+
+
+def test_pending_dirs_are_unstable_recent_files(tmp_path: Path):
+    conn = init_db(tmp_path / "v.db")
+    for path, seen in (("a/1.jpg", 200), ("b/2.jpg", 150), ("c/3.jpg", 50), ("top.jpg", 300)):
+        update_state(conn, path, 1, 1, seen)
+    update_state(conn, "b/2.jpg", 1, 1, 200)
+    assert pending_dirs(conn, 2, 100) == {"a", ""}
+    conn.close()
+
+
+def test_delta_dirs_inside_audit_roots_are_listed_once(tmp_path: Path):
+    root = tmp_path / "snap"
+    _materialize(root, {"a": {"s": {"1.jpg": b"1"}}, "b": {"2.jpg": b"2"}})
+    conn = init_db(tmp_path / "v.db")
+    cfg = _cfg(tmp_path, root)
+    cfg.sync_cold_audit_dirs_per_run = 2
+    stable_and_copy(cfg, root, conn, delta=DeltaPlan(["a/s", "b"], []))
+    counts = dict(conn.execute("SELECT path, stable_count FROM v_file_state"))
+    assert counts == {"a/s/1.jpg": 1, "b/2.jpg": 1}
+    conn.close()
+
+
+def test_snapshot_cycles_full_scan_then_delta(tmp_path: Path, monkeypatch):
+    old = _image(tmp_path / "old.img", BASE)
+    new_tree = {"a": BASE["a"], "b": {**BASE["b"], "z.jpg": b"z" * 700}}
+    new = _image(tmp_path / "new.img", new_tree)
+    monkeypatch.setattr(sync, "thin_delta_ranges", lambda *a: compare_ranges(old, new, 512))
+    conn = init_db(tmp_path / "v.db")
+
+    mount_old = tmp_path / "m_old"
+    _materialize(mount_old, BASE)
+    cfg = _cfg(tmp_path, mount_old)
+    cfg.sync_hot_dirs = 8
+    assert sync._stable_and_copy_snapshot(cfg, str(old), None, conn, source="usb_0")
+    assert set(dict(conn.execute("SELECT path, stable_count FROM v_file_state"))) == {
+        "a/x.jpg", "b/y.jpg"
+    }
+
+    mount_new = tmp_path / "m_new"
+    _materialize(mount_new, new_tree)
+    cfg.snapshot_mount = mount_new
+    scanned = []
+    real = sync._process_file
+    monkeypatch.setattr(
+        sync, "_process_file", lambda rec, *a, **k: (scanned.append(rec.rel), real(rec, *a, **k))
+    )
+    assert sync._stable_and_copy_snapshot(cfg, str(new), None, conn, source="usb_0")
+    # b changed; a did not, but its file is one scan short of stable.
+    assert sorted(scanned) == ["a/x.jpg", "b/y.jpg", "b/z.jpg"]
+    assert (cfg.mirror_mount / "raw" / "a" / "x.jpg").exists()
+
+    # Nothing changed since: only b, where z.jpg still waits for its 2nd scan.
+    scanned.clear()
+    monkeypatch.setattr(sync, "thin_delta_ranges", lambda *a: [])
+    assert sync._stable_and_copy_snapshot(cfg, str(new), None, conn, source="usb_0")
+    assert sorted(scanned) == ["b/y.jpg", "b/z.jpg"]
+    assert (cfg.mirror_mount / "raw" / "b" / "z.jpg").exists()
+    conn.close()
+
+
+def test_low_free_space_keeps_the_previous_delta_base(tmp_path: Path, monkeypatch):
+    old = _image(tmp_path / "old.img", BASE)
+    new_tree = {"a": BASE["a"], "b": {**BASE["b"], "z.jpg": b"z" * 700}}
+    new = _image(tmp_path / "new.img", new_tree)
+    monkeypatch.setattr(sync, "thin_delta_ranges", lambda *a: compare_ranges(old, new, 512))
+    conn = init_db(tmp_path / "v.db")
+    mount_old = tmp_path / "m_old"
+    _materialize(mount_old, BASE)
+    cfg = _cfg(tmp_path, mount_old)
+    assert sync._stable_and_copy_snapshot(cfg, str(old), None, conn, source="usb_0")
+    saved = (tmp_path / "delta.json").read_text()
+
+    # Delta cycle while the mirror is short of space: nothing is listed, so
+    # this snapshot must not become the base and the index stays as it was.
+    mount_new = tmp_path / "m_new"
+    _materialize(mount_new, new_tree)
+    cfg.snapshot_mount = mount_new
+    monkeypatch.setattr(sync, "check_mirror_free_space", lambda cfg: False)
+    assert not sync._stable_and_copy_snapshot(cfg, str(new), None, conn, source="usb_0")
+    assert (tmp_path / "delta.json").read_text() == saved
+
+    # Space is back: the delta against the kept base still lists b.
+    monkeypatch.undo()
+    monkeypatch.setattr(sync, "thin_delta_ranges", lambda *a: compare_ranges(old, new, 512))
+    assert sync._stable_and_copy_snapshot(cfg, str(new), None, conn, source="usb_0")
+    assert "b/z.jpg" in dict(conn.execute("SELECT path, stable_count FROM v_file_state"))
+    conn.close()
@@ -61,6 +61,20 @@ def test_get_config_defaults(tmp_path: Path):
     assert cfg.bydate_use_file_time is False
     assert cfg.sync_scan_depth == 1
     assert cfg.sync_hot_dirs == 1
+    assert cfg.sync_copy_workers == 1
+    assert cfg.sync_hash_algo == "sha256"
+    assert cfg.sync_scan_source == "mount"
+    assert cfg.sync_copy_source == "mount"
+    assert cfg.sync_geometry_file.name == "usb_sync.geometry.json"
+    assert cfg.sync_daemon is False
+    assert cfg.sync_idle_fast_path is False
+    assert cfg.sync_cycle_budget_sec == 0
+    assert cfg.sync_checkpoint_files == 500
+    assert cfg.sync_resume_min_mb == 0
+    assert cfg.sync_resume_segment_mb == 64
+    assert cfg.sync_progressive_globs == []
+    assert cfg.sync_folder_units is False
+    assert str(cfg.sync_daemon_socket) == "/run/vision-sync.sock"
 
 
 def test_get_config_custom_values(tmp_path: Path):
@@ -0,0 +1,124 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from vision_sync import daemon, sync
+from vision_sync.db import init_db
+
+
+def _config(tmp_path: Path) -> Path:
+    conf = tmp_path / "vision-gw.conf"
+    conf.write_text(
+        f"MIRROR_MOUNT={tmp_path / 'mirror'}\n"
+        "SYNC_STATE_BATCH=true\n"
+        "SYNC_DAEMON=true\n"
+        f"SYNC_DAEMON_SOCKET={tmp_path / 'sync.sock'}\n"
+    )
+    return conf
+
+
+def test_trigger_without_daemon_returns_none(tmp_path: Path):
+    assert daemon.trigger(tmp_path / "missing.sock") is None
+
+
+def test_daemon_runs_cycles_on_trigger(tmp_path: Path, monkeypatch):
+    conf = _config(tmp_path)
+    runs = []
+
+    def fake_run(cfg, dev, offline, conn=None, state=None):
+        runs.append((conn, state))
+        if len(runs) == 2:
+            raise RuntimeError("mount failed")
+
+    monkeypatch.setattr(sync, "run", fake_run)
+    server = daemon.SyncDaemon(str(conf))
+    threading.Thread(target=server.serve, daemon=True).start()
+    sock = tmp_path / "sync.sock"
+    for _ in range(100):
+        if daemon.trigger(sock, "ping") == 0:
+            break
+        threading.Event().wait(0.02)
+
+    assert daemon.trigger(sock) == 0
+    assert daemon.trigger(sock) == 1
+    assert daemon.trigger(sock) == 0
+    assert daemon.trigger(sock, "bogus") == 1
+    # Same connection throughout; the failed cycle dropped the warm state.
+    assert runs[0][0] is runs[2][0]
+    assert runs[0][1] is runs[1][1] and runs[2][1] is not runs[1][1]
+
+
+def test_state_reloads_after_another_connection_commits(tmp_path: Path):
+    server = daemon.SyncDaemon(str(_config(tmp_path)))
+    cfg = server.config()
+    conn, state = server._db(cfg)
+    assert server._db(cfg) == (conn, state)
+
+    other = init_db(cfg.state_dir / "vision.db")
+    other.execute("DELETE FROM file_state")
+    other.commit()
+    other.close()
+    conn2, state2 = server._db(cfg)
+    assert conn2 is conn and state2 is not state
+
+
+def _serve_one_cycle(tmp_path: Path, monkeypatch, kill_client) -> tuple[list, int]:
+    """One `cycle` from a real trigger process, killed by `kill_client` mid-cycle.
+
+    The daemon side runs on this (main) thread, as under systemd.
+    """
+    conf = _config(tmp_path)
+    server = daemon.SyncDaemon(str(conf))
+    sock_path = tmp_path / "sync.sock"
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(str(sock_path))
+    listener.listen(1)
+    env = dict(os.environ, PYTHONPATH=str(Path(daemon.__file__).parents[1]))
+    client = subprocess.Popen(
+        [sys.executable, "-m", "vision_sync.daemon", "--trigger", "--config", str(conf)], env=env
+    )
+    events = []
+
+    def fake_run(cfg, dev, offline, conn=None, state=None):
+        kill_client(client)
+        try:
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                time.sleep(0.01)
+        except BaseException as exc:
+            events.append(type(exc).__name__)  # the cycle's salvage + commit
+            raise
+        events.append("ran to the end")
+
+    monkeypatch.setattr(sync, "run", fake_run)
+    previous = signal.signal(signal.SIGUSR1, server._cancel_signal)
+    server.cancellable = True
+    try:
+        with listener:
+            conn, _ = listener.accept()
+            server.serve_client(conn)
+        status = client.wait(10)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+        client.kill()
+    return events, status
+
+
+def test_sigterm_on_the_trigger_cancels_the_cycle_and_waits_for_it(tmp_path: Path, monkeypatch):
+    events, status = _serve_one_cycle(
+        tmp_path, monkeypatch, lambda client: client.send_signal(signal.SIGTERM)
+    )
+    assert events == ["CycleCancelled"]
+    # Exits only after the daemon unwound, with the in-process SIGTERM status.
+    assert status == 128 + signal.SIGTERM
+
+
+def test_trigger_killed_mid_cycle_cancels_the_cycle(tmp_path: Path, monkeypatch):
+    events, status = _serve_one_cycle(tmp_path, monkeypatch, lambda client: client.kill())
+    assert events == ["CycleCancelled"]
+    assert status == -signal.SIGKILL
@@ -1,6 +1,6 @@
 from pathlib import Path
 
-from vision_sync.db import init_db, is_already_synced, mark_synced
+from vision_sync.db import BatchState, init_db, is_already_synced, mark_synced
 
 
 def test_db_state(tmp_path: Path):
@@ -10,3 +10,79 @@ def test_db_state(tmp_path: Path):
     assert not is_already_synced(conn, "a.jpg", 1, 2)
     mark_synced(conn, "a.jpg", 1, 2, "/raw/a", "/bydate/a", 3)
     assert is_already_synced(conn, "a.jpg", 1, 2)
+
+
+def test_db_records_digest_and_algo(tmp_path: Path):
+    conn = init_db(tmp_path / "vision.db")
+    mark_synced(conn, "a.jpg", 1, 2, "/raw/a", "/bydate/a", 3, "abcd1234", "blake2b-64")
+    row = conn.execute("SELECT digest, hash_algo FROM synced_files").fetchone()
+    assert row == ("abcd1234", "blake2b-64")
+
+
+def test_init_db_adds_digest_columns_to_old_schema(tmp_path: Path):
+    import sqlite3
+
+    db = tmp_path / "vision.db"
+    old = sqlite3.connect(str(db))
+    old.execute(
+        "CREATE TABLE synced_files (id INTEGER PRIMARY KEY AUTOINCREMENT, source_path TEXT,"
+        " size INTEGER, mtime INTEGER, raw_path TEXT, bydate_path TEXT, synced_at INTEGER)"
+    )
+    old.commit()
+    old.close()
+
+    conn = init_db(db)
+    mark_synced(conn, "a.jpg", 1, 2, "/raw/a", "/bydate/a", 3)
+    assert is_already_synced(conn, "a.jpg", 1, 2)
+
+
+def test_init_db_migrates_v1_rows_in_batches(tmp_path: Path, monkeypatch):
+    import sqlite3
+
+    from vision_sync import db as dbmod
+
+    mirror = tmp_path / "mirror"
+    path = mirror / ".state" / "vision.db"
+    path.parent.mkdir(parents=True)
+    old = sqlite3.connect(str(path))
+    old.execute(
+        "CREATE TABLE file_state (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER,"
+        " stable_count INTEGER, last_seen INTEGER)"
+    )
+    old.execute(
+        "CREATE TABLE synced_files (id INTEGER PRIMARY KEY AUTOINCREMENT, source_path TEXT,"
+        " size INTEGER, mtime INTEGER, raw_path TEXT, bydate_path TEXT, synced_at INTEGER,"
+        " digest TEXT DEFAULT '', hash_algo TEXT DEFAULT '')"
+    )
+    old.executemany(
+        "INSERT INTO file_state VALUES (?, ?, ?, ?, ?)",
+        [(f"d{i % 2}/f{i}.jpg", i, 10, 2, 100) for i in range(5)] + [("top.jpg", 1, 1, 1, 1)],
+    )
+    old.execute(
+        "INSERT INTO synced_files VALUES (7, 'd1/f1.jpg', 1, 10, ?, ?, 50, 'ab', 'sha256')",
+        (f"{mirror}/raw/d1/f1.jpg", f"{mirror}/bydate/2024/01/01/f1.jpg"),
+    )
+    old.execute(
+        "INSERT INTO synced_files VALUES (9, 'x.jpg', 1, 1, '/elsewhere/x.jpg', '', 60, '', '')"
+    )
+    old.commit()
+    old.close()
+
+    monkeypatch.setattr(dbmod, "MIGRATE_BATCH", 2)
+    conn = init_db(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == dbmod.SCHEMA_VERSION
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert not tables & {"file_state_v1", "synced_files_v1"}
+    assert conn.execute("SELECT COUNT(*) FROM v_file_state").fetchone()[0] == 6
+    assert conn.execute("SELECT COUNT(*) FROM src_dirs").fetchone()[0] == 3  # d0, d1, ""
+    rows = conn.execute(
+        "SELECT id, source_path, raw_path, bydate_path, digest FROM v_synced_files ORDER BY id"
+    ).fetchall()
+    assert rows == [
+        (7, "d1/f1.jpg", "raw/d1/f1.jpg", "bydate/2024/01/01/f1.jpg", "ab"),
+        (9, "x.jpg", "/elsewhere/x.jpg", "", ""),
+    ]
+    assert is_already_synced(conn, "d1/f1.jpg", 1, 10)
+    state = BatchState(conn, stable_cap=2)
+    assert state.update("d0/f2.jpg", 2, 10, 200) == 2
+    assert state.is_synced("d1/f1.jpg", 1, 10)
@@ -0,0 +1,206 @@
+import os
+import struct
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from fat_image import build_fat32
+
+from vision_sync.fat import FatError, FatVolume, fat_time_to_unix
+from vision_sync.fsops import FileRecord, MountTree
+from vision_sync.sync import open_fat_volume, scan_dirs_by_depth
+
+TREE = {
+    "README.TXT": b"hello",
+    "lower.jpg": b"x" * 700,
+    "A long file name with spaces.bmp": b"y" * 1500,
+    "cv-x": {
+        "image": {
+            "SD1_000": {
+                "2024_0101_0800": {"IMG_0001.JPG": b"1" * 2000, "Frame-01.jpg": b"22"},
+                "2024_0102_0800": {"empty.dat": b""},
+            },
+        },
+        "Ünïcode ñame.txt": b"u",
+    },
+    "System Volume Information": {"IndexerVolumeGuid": b"g"},
+}
+MTIMES = {
+    "README.TXT": 1_700_000_000,
+    "cv-x/image/SD1_000/2024_0101_0800": 1_700_000_100,
+    "cv-x/image/SD1_000/2024_0102_0800": 1_700_090_000,
+    "cv-x/image/SD1_000/2024_0101_0800/IMG_0001.JPG": 1_700_000_042,
+}
+
+
+def _materialize(root: Path, tree: dict, mtimes: dict, rel: str = "") -> None:
+    """The same tree as a plain directory, as the vfat mount would show it."""
+    for name, child in tree.items():
+        child_rel = f"{rel}/{name}" if rel else name
+        path = root / child_rel
+        if isinstance(child, dict):
+            path.mkdir(parents=True, exist_ok=True)
+            _materialize(root, child, mtimes, child_rel)
+        else:
+            path.write_bytes(child)
+        ts = mtimes.get(child_rel, 1_700_000_000)
+        os.utime(path, (ts, ts))
+
+
+@pytest.fixture
+def image(tmp_path: Path) -> Path:
+    path = tmp_path / "usb.img"
+    build_fat32(path, TREE, mtimes=MTIMES, deleted=("OLD.TXT",))
+    return path
+
+
+def test_fat_time_to_unix():
+    # 2023-11-14 22:13:20 UTC, the builder's default mtime.
+    date = ((2023 - 1980) << 9) | (11 << 5) | 14
+    tim = (22 << 11) | (13 << 5) | 10
+    assert fat_time_to_unix(date, tim) == 1_700_000_000
+    assert fat_time_to_unix(date, tim, tz_offset=3600) == 1_700_000_000 - 3600
+    assert fat_time_to_unix((2024 - 1980) << 9 | (3 << 5) | 1, 0) == 1_709_251_200
+
+
+def test_scan_matches_mounted_listing(image: Path, tmp_path: Path):
+    mounted = tmp_path / "mnt"
+    mounted.mkdir()
+    _materialize(mounted, TREE, MTIMES)
+    with FatVolume(image) as vol:
+        assert sorted(vol.scan_files()) == sorted(MountTree(mounted).scan_files())
+        files, dirs = vol.scan_level("")
+        assert dirs == ["cv-x"]
+        assert FileRecord("lower.jpg", 700, 1_700_000_000) in files
+        assert "OLD.TXT" not in {f.rel for f in files}
+
+
+def test_short_names_honour_case_flags(image: Path):
+    with FatVolume(image) as vol:
+        names = {f.rel for f in vol.scan_files("cv-x/image", recursive=True)}
+    assert "cv-x/image/SD1_000/2024_0101_0800/IMG_0001.JPG" in names
+    assert "cv-x/image/SD1_000/2024_0101_0800/Frame-01.jpg" in names
+    assert "cv-x/image/SD1_000/2024_0102_0800/empty.dat" in names
+
+
+def test_partition_offset_and_multi_cluster_dirs(tmp_path: Path):
+    tree = {f"frame_{i:05d}_with_a_long_name.jpg": b"" for i in range(300)}
+    path = tmp_path / "part.img"
+    build_fat32(path, {"sess": tree}, offset=1 << 20, cluster_size=1024, fragment=True)
+    with FatVolume(path, offset=1 << 20) as vol:
+        assert vol.cluster_size == 1024
+        files = list(vol.scan_files("sess"))
+        assert len(files) == 300
+        assert len(vol.chain(vol.lookup("sess").cluster)) > 1
+    with pytest.raises(FatError):
+        FatVolume(path)
+
+
+def test_subdirs_feed_depth_scan(image: Path):
+    with FatVolume(image) as vol:
+        at_depth, above = scan_dirs_by_depth(Path("/nonexistent"), 4, vol)
+    assert at_depth == [
+        ("cv-x/image/SD1_000/2024_0102_0800", 1_700_090_000),
+        ("cv-x/image/SD1_000/2024_0101_0800", 1_700_000_100),
+    ]
+    assert above == ["cv-x", "cv-x/image", "cv-x/image/SD1_000"]
+
+
+def test_broken_chain_falls_back_to_mount(image: Path, tmp_path: Path):
+    mounted = tmp_path / "mnt"
+    mounted.mkdir()
+    _materialize(mounted, TREE, MTIMES)
+    with FatVolume(image) as vol:
+        cluster = vol.lookup("cv-x").cluster
+        fat_pos = vol.fat_offset + 4 * cluster
+    data = bytearray(image.read_bytes())
+    struct.pack_into("<I", data, fat_pos, 0x0FFFFFF7)
+    image.write_bytes(bytes(data))
+
+    with FatVolume(image) as vol, pytest.raises(FatError):
+        vol.scan_level("cv-x")
+    with FatVolume(image, fallback=MountTree(mounted)) as vol:
+        assert vol.scan_level("cv-x") == MountTree(mounted).scan_level("cv-x")
+
+
+def test_open_fat_volume_checks_root_against_mount(image: Path, tmp_path: Path):
+    mounted = tmp_path / "mnt"
+    mounted.mkdir()
+    _materialize(mounted, TREE, MTIMES)
+    cfg = SimpleNamespace(
+        sync_scan_source="fat", sync_copy_source="mount", sync_fat_tz_offset_min=0
+    )
+    vol = open_fat_volume(cfg, str(image), None, mounted)
+    assert isinstance(vol, FatVolume)
+    vol.close()
+
+    # A wrong timezone shows up as mtime drift at the root: use the mount.
+    cfg.sync_fat_tz_offset_min = 60
+    assert open_fat_volume(cfg, str(image), None, mounted) is None
+    # Wrong offset: no boot sector there.
+    cfg.sync_fat_tz_offset_min = 0
+    assert open_fat_volume(cfg, str(image), 4096, mounted) is None
+    cfg.sync_scan_source = "mount"
+    assert open_fat_volume(cfg, str(image), None, mounted) is None
+
+
+def test_extents_merge_contiguous_clusters(tmp_path: Path):
+    data = os.urandom(5000)
+    path = tmp_path / "usb.img"
+    build_fat32(path, {"a.bin": data, "b.bin": data}, fragment=False)
+    frag = tmp_path / "frag.img"
+    build_fat32(frag, {"a.bin": data}, fragment=True)
+    with FatVolume(path) as vol:
+        runs = vol.extents(vol.lookup("a.bin").cluster, len(data))
+        assert len(runs) == 1 and runs[0][1] == len(data)
+        assert vol.open_file("b.bin", len(data), 1_700_000_000).readall() == data
+    with FatVolume(frag) as vol:
+        entry = vol.lookup("a.bin")
+        assert len(vol.extents(entry.cluster, len(data))) == 10
+        reader = vol.open_file("a.bin", len(data), entry.mtime)
+        buf = bytearray(3000)
+        assert reader.readinto(buf) == 3000
+        assert bytes(buf) == data[:3000]
+        assert reader.readinto(buf) == 2000
+        assert reader.readinto(buf) == 0
+        # Resume point inside the fourth run of the fragmented file.
+        assert reader.seek(1700) == 1700
+        assert reader.readall() == data[1700:]
+        with pytest.raises(FatError):
+            vol.open_file("a.bin", len(data) + 512, entry.mtime)
+        with pytest.raises(FatError):
+            vol.open_file("a.bin", len(data), entry.mtime + 2)
+
+
+def test_stable_and_copy_reads_file_data_from_device(tmp_path: Path):
+    from vision_sync.db import init_db
+    from vision_sync.sync import stable_and_copy
+
+    fat_tree = {"s": {"big.jpg": b"F" * 5000, "bad.jpg": b"F" * 1200, "zero.jpg": b""}}
+    image = tmp_path / "usb.img"
+    build_fat32(image, fat_tree, fragment=True)
+    # Same sizes/mtimes on the "mount", different bytes: shows where data came from.
+    mounted = tmp_path / "mnt"
+    _materialize(mounted, {"s": {k: b"M" * len(v) for k, v in fat_tree["s"].items()}}, {})
+    with FatVolume(image) as vol:
+        fat_pos = vol.fat_offset + 4 * vol.lookup("s/bad.jpg").cluster
+    data = bytearray(image.read_bytes())
+    struct.pack_into("<I", data, fat_pos, 0x0FFFFFFF)  # chain cut to one cluster
+    image.write_bytes(bytes(data))
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = SimpleNamespace(
+        mirror_mount=mirror, state_dir=mirror / ".state", mirror_free_min_mb=0,
+        mirror_retention_trigger_pct=101, max_file_size=1 << 30, stable_scans=1,
+        copy_chunk=1024, append_always=False, bydate_use_file_time=False, sync_log_every=0,
+        sync_scan_depth=1, sync_hot_dirs=8, sync_cold_audit_dirs_per_run=8,
+        sync_dir_index_file=tmp_path / "idx.json",
+    )
+    with FatVolume(image, fallback=MountTree(mounted)) as vol:
+        stable_and_copy(cfg, mounted, conn, force_stable=True, tree=vol, copy_volume=vol)
+    conn.close()
+    assert (mirror / "raw" / "s" / "big.jpg").read_bytes() == b"F" * 5000
+    assert (mirror / "raw" / "s" / "bad.jpg").read_bytes() == b"M" * 1200
+    assert (mirror / "raw" / "s" / "zero.jpg").read_bytes() == b""
+    assert not list((mirror / "raw" / "s").glob(".*.tmp"))
@@ -112,3 +112,89 @@ def test_safe_join_rejects_traversal(tmp_path: Path):
     base.mkdir()
     with pytest.raises(ValueError, match="traversal"):
         safe_join(base, Path("../../etc"))
+
+
+def test_atomic_copy_overlapped_matches_source(tmp_path: Path):
+    import hashlib
+
+    src = tmp_path / "big.bin"
+    content = os.urandom(10 * 1024 + 123)
+    src.write_bytes(content)
+
+    # 1 KiB chunks: well above the two-chunk threshold for the pipelined engine.
+    result_path, digest = atomic_copy(src, tmp_path / "dest", "big.bin", 1024)
+
+    assert result_path.read_bytes() == content
+    assert digest == hashlib.sha256(content).hexdigest()
+
+
+def test_atomic_copy_overlapped_propagates_read_errors(tmp_path: Path, monkeypatch):
+    import pytest
+
+    from vision_sync import fsops
+
+    src = tmp_path / "big.bin"
+    src.write_bytes(b"x" * 8192)
+
+    def broken_inline(*_args):
+        raise AssertionError("inline path must not be used for multi-chunk files")
+
+    monkeypatch.setattr(fsops, "_copy_inline", broken_inline)
+    real_open = open
+
+    class FailingReader:
+        def __init__(self, f):
+            self.f = f
+
+        def readinto(self, _buf):
+            raise OSError("read failed")
+
+        def fileno(self):
+            return self.f.fileno()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.f.close()
+
+    def fake_open(path, mode="r", *args, **kwargs):
+        f = real_open(path, mode, *args, **kwargs)
+        return FailingReader(f) if Path(path) == src else f
+
+    monkeypatch.setattr("builtins.open", fake_open)
+    with pytest.raises(OSError, match="read failed"):
+        fsops.atomic_copy(src, tmp_path / "dest", "big.bin", 1024)
+
+
+def test_atomic_copy_selectable_hash_algo(tmp_path: Path):
+    import hashlib
+
+    src = tmp_path / "file.dat"
+    src.write_bytes(b"payload")
+
+    _, sha1 = atomic_copy(src, tmp_path / "d1", "f.dat", 4096, "sha1")
+    _, short = atomic_copy(src, tmp_path / "d2", "f.dat", 4096, "blake2b-64")
+
+    assert sha1 == hashlib.sha1(b"payload").hexdigest()
+    assert short == hashlib.blake2b(b"payload", digest_size=8).hexdigest()
+
+
+def test_new_hasher_rejects_unknown_and_too_short():
+    import pytest
+
+    from vision_sync.fsops import new_hasher
+
+    for bad in ("nope", "blake2b-16", "blake2s-512", "shake_128"):
+        with pytest.raises(ValueError, match="unsupported"):
+            new_hasher(bad)
+
+
+def test_syncfs_on_directory(tmp_path: Path):
+    import sys
+
+    from vision_sync.fsops import syncfs
+
+    result = syncfs(tmp_path)
+    if sys.platform.startswith("linux"):
+        assert result is True
@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+
+from vision_sync.fsops import FileRecord, scan_files, scan_level, scan_tree
+
+
+def _write(path: Path, data: bytes, ts: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    os.utime(path, (ts, ts))
+
+
+def test_scan_level_splits_files_and_dirs(tmp_path: Path):
+    _write(tmp_path / "a.jpg", b"abc", 100)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "System Volume Information").mkdir()
+    os.symlink(tmp_path / "a.jpg", tmp_path / "link.jpg")
+
+    files, dirs = scan_level(tmp_path)
+
+    assert files == [FileRecord("a.jpg", 3, 100)]
+    assert dirs == ["sub"]
+
+
+def test_scan_files_recursive_relpaths(tmp_path: Path):
+    _write(tmp_path / "top.jpg", b"1", 1)
+    _write(tmp_path / "a" / "one.jpg", b"22", 2)
+    _write(tmp_path / "a" / "b" / "two.jpg", b"333", 3)
+    _write(tmp_path / "$RECYCLE.BIN" / "gone.jpg", b"x", 4)
+
+    got = sorted(scan_files(tmp_path))
+    assert got == [
+        FileRecord("a/b/two.jpg", 3, 3),
+        FileRecord("a/one.jpg", 2, 2),
+        FileRecord("top.jpg", 1, 1),
+    ]
+    assert sorted(scan_files(tmp_path, "a")) == got[:2]
+    assert list(scan_files(tmp_path, "a", recursive=False)) == [FileRecord("a/one.jpg", 2, 2)]
+
+
+def test_scan_tree_allows_pruning(tmp_path: Path):
+    _write(tmp_path / "keep" / "k.jpg", b"k", 1)
+    _write(tmp_path / "skip" / "s.jpg", b"s", 1)
+
+    seen = []
+    for rel, files, dirs in scan_tree(tmp_path):
+        if rel == "":
+            dirs.remove("skip")
+        seen.extend(f.rel for f in files)
+    assert seen == ["keep/k.jpg"]
+
+
+def test_scan_missing_dir_is_empty(tmp_path: Path):
+    assert list(scan_files(tmp_path / "missing")) == []
@@ -0,0 +1,64 @@
+import struct
+from pathlib import Path
+
+import pytest
+from fat_image import build_fat32
+
+from vision_sync import proc, sync
+from vision_sync.geometry import GeometryCache, parse_partition_offset
+
+
+def _gpt(first_lba: int) -> bytes:
+    head = bytearray(34 * 512)
+    head[446 + 4] = 0xEE
+    struct.pack_into("<I", head, 446 + 8, 1)
+    head[510:512] = b"\x55\xaa"
+    head[512:520] = b"EFI PART"
+    struct.pack_into("<QII", head, 512 + 72, 2, 128, 128)
+    entry = 2 * 512
+    head[entry:entry + 16] = b"\x01" * 16
+    struct.pack_into("<Q", head, entry + 32, first_lba)
+    return bytes(head)
+
+
+def test_parse_mbr_gpt_and_superfloppy(tmp_path: Path):
+    build_fat32(tmp_path / "mbr.img", {"a.jpg": b"a"}, offset=1 << 20)
+    build_fat32(tmp_path / "bare.img", {"a.jpg": b"a"})
+    assert parse_partition_offset((tmp_path / "mbr.img").read_bytes()[:512]) == 1 << 20
+    assert parse_partition_offset((tmp_path / "bare.img").read_bytes()[:512]) is None
+    assert parse_partition_offset(_gpt(2048)) == 2048 * 512
+    with pytest.raises(ValueError):
+        parse_partition_offset(bytes(512))
+
+
+def test_cache_probes_only_when_the_table_changes(tmp_path: Path):
+    dev = tmp_path / "usb.img"
+    dev.write_bytes(bytes(34 * 512))
+    probes = []
+
+    def probe(d):
+        probes.append(d)
+        return 4096
+
+    cache_file = tmp_path / "geometry.json"
+    assert GeometryCache(cache_file).offset(str(dev), probe) == 4096
+    assert GeometryCache(cache_file).offset(str(dev), probe) == 4096
+    assert len(probes) == 1
+
+    dev.write_bytes(_gpt(64))
+    assert GeometryCache(cache_file).offset(str(dev), probe) == 64 * 512
+    assert len(probes) == 1
+
+
+def test_known_offset_mounts_without_partition_mapping(tmp_path: Path, monkeypatch):
+    calls = []
+
+    def fake_run(args, **kwargs):
+        calls.append(args)
+        return sync.subprocess.CompletedProcess(args, 0)
+
+    monkeypatch.setattr(proc.subprocess, "run", fake_run)
+    proc.reset()
+    sync.mount_ro("/dev/vg0/usb_sync_snap", tmp_path / "mnt", 1 << 20)
+    assert [a[0] for a in calls] == ["mount"]
+    assert proc.summary() == "total=1 mount=1"
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from vision_sync import iostat
+
+
+def _fake_sysfs(tmp_path: Path, monkeypatch, written: int, in_flight: int = 0) -> str:
+    dm = tmp_path / "dev" / "dm-3"
+    dm.parent.mkdir(exist_ok=True)
+    dm.touch()
+    lv = tmp_path / "usb_0"
+    if not lv.exists():
+        lv.symlink_to(dm)
+    stat = tmp_path / "sys" / "dm-3" / "stat"
+    stat.parent.mkdir(parents=True, exist_ok=True)
+    stat.write_text(f"10 0 80 5 7 0 {written} 9 {in_flight} 12 14 0 0 0 0\n")
+    boot = tmp_path / "boot_id"
+    boot.write_text("b0\n")
+    monkeypatch.setattr(iostat, "BOOT_ID_FILE", str(boot))
+    monkeypatch.setattr(iostat, "stat_path", lambda dev: stat)
+    return str(lv)
+
+
+def test_sample_round_trip_and_in_flight(tmp_path: Path, monkeypatch):
+    lv = _fake_sysfs(tmp_path, monkeypatch, 4096)
+    mark = tmp_path / "writes.json"
+    first = iostat.sample(lv)
+    iostat.save_sample(mark, first)
+    assert iostat.load_sample(mark) == first == iostat.sample(lv)
+
+    _fake_sysfs(tmp_path, monkeypatch, 4104)
+    assert iostat.sample(lv) != iostat.load_sample(mark)
+    _fake_sysfs(tmp_path, monkeypatch, 4104, in_flight=1)
+    assert iostat.sample(lv) is None
+    iostat.save_sample(mark, None)
+    assert iostat.load_sample(mark) is None
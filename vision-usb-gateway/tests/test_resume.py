@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from vision_sync.fsops import copy_to_temp
+from vision_sync.resume import HEAD_CHECK_BYTES, TAIL_CHECK_BYTES, PartialCopies
+
+MIB = 1 << 20
+
+
+class CountingReader:
+    """Raw reader over bytes that can fail after `fail_at` bytes."""
+
+    def __init__(self, data: bytes, fail_at: int | None = None) -> None:
+        self.data = data
+        self.size = len(data)
+        self.pos = 0
+        self.read = 0
+        self.fail_at = fail_at
+
+    def seek(self, pos: int) -> int:
+        self.pos = pos
+        return pos
+
+    def readinto(self, buf) -> int:
+        if self.fail_at is not None and self.pos >= self.fail_at:
+            raise OSError("device went away")
+        chunk = self.data[self.pos:self.pos + len(buf)]
+        buf[:len(chunk)] = chunk
+        self.pos += len(chunk)
+        self.read += len(chunk)
+        return len(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _registry(tmp_path: Path) -> PartialCopies:
+    return PartialCopies(tmp_path / "state" / "partial.json", 2 * MIB, MIB, 3600)
+
+
+def _copy(tmp_path, registry, data, reader):
+    dest = tmp_path / "raw"
+    partial = registry.get(dest, "big.bin", "dir/big.bin", len(data), 1000, "sha256")
+    return copy_to_temp(dest / "src", dest, "big.bin", 256 * 1024, "sha256", True, reader, partial)
+
+
+def test_interrupted_copy_resumes_from_last_segment(tmp_path: Path):
+    data = os.urandom(5 * MIB + 4321)
+    registry = _registry(tmp_path)
+    with pytest.raises(OSError, match="went away"):
+        _copy(tmp_path, registry, data, CountingReader(data, fail_at=3 * MIB + 5000))
+
+    part = tmp_path / "raw" / f".big.bin.{len(data)}-1000.part"
+    assert part.exists()
+    saved = json.loads((tmp_path / "state" / "partial.json").read_text())
+    assert len(saved["parts"][str(part)]["digests"]) == 3
+
+    # A later cycle (new registry from disk) reads only what is missing,
+    # plus the prefix's head and tail to check the source still matches.
+    registry = _registry(tmp_path)
+    reader = CountingReader(data)
+    temp, digest = _copy(tmp_path, registry, data, reader)
+    assert temp == part
+    assert reader.read == len(data) - 3 * MIB + HEAD_CHECK_BYTES + TAIL_CHECK_BYTES
+    assert temp.read_bytes() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+    # The entry outlives the copy; the caller drops it after the rename.
+    assert str(part) in _registry(tmp_path).entries
+    registry.finish(temp)
+    assert not (tmp_path / "state" / "partial.json").exists()
+
+
+def test_resume_truncates_at_first_bad_segment(tmp_path: Path):
+    data = os.urandom(4 * MIB)
+    registry = _registry(tmp_path)
+    with pytest.raises(OSError):
+        _copy(tmp_path, registry, data, CountingReader(data, fail_at=3 * MIB))
+    part = tmp_path / "raw" / f".big.bin.{len(data)}-1000.part"
+    with open(part, "r+b") as f:
+        f.seek(MIB + 10)
+        f.write(b"\xff" * 4)
+
+    reader = CountingReader(data)
+    temp, digest = _copy(tmp_path, _registry(tmp_path), data, reader)
+    assert reader.read == len(data) - MIB + HEAD_CHECK_BYTES + TAIL_CHECK_BYTES
+    assert temp.read_bytes() == data
+    assert digest == hashlib.sha256(data).hexdigest()
+
+
+def test_small_files_and_stale_parts(tmp_path: Path):
+    registry = _registry(tmp_path)
+    assert registry.get(tmp_path, "small.bin", "small.bin", MIB, 1, "sha256") is None
+
+    old = registry.get(tmp_path, "a.bin", "d/a.bin", 3 * MIB, 1, "sha256")
+    old.temp.write_bytes(b"x")
+    # The same source with another identity supersedes the old part at once.
+    new = registry.get(tmp_path, "a.bin", "d/a.bin", 3 * MIB, 2, "sha256")
+    assert not old.temp.exists()
+    new.temp.write_bytes(b"y")
+
+    other = registry.get(tmp_path, "b.bin", "d/b.bin", 3 * MIB, 1, "sha256")
+    assert registry.expire() == 1  # b.bin never got a part file
+    assert str(other.temp) not in registry.entries
+
+    assert registry.expire(time.time() + 7200) == 1
+    assert not new.temp.exists()
+    assert registry.entries == {}
+
+
+def test_growing_partial_appends_and_restarts_on_rewrite(tmp_path: Path):
+    registry = _registry(tmp_path)
+    first = os.urandom(MIB + 100)
+    grown = first + os.urandom(MIB)
+
+    def extend(data):
+        partial = registry.get(tmp_path, "cam.log", "cam.log", len(data), 1, "sha256", True)
+        reader = CountingReader(data)
+        return partial.extend(reader, 64 * 1024), reader
+
+    added, _ = extend(first)
+    assert added == len(first)
+    added, reader = extend(grown)
+    assert added == MIB
+    # Only the head and tail checks and the new bytes.
+    assert reader.read == HEAD_CHECK_BYTES + TAIL_CHECK_BYTES + MIB
+    assert (tmp_path / "cam.log.partial").read_bytes() == grown
+
+    rewritten = os.urandom(len(grown) + 10)
+    added, _ = extend(rewritten)
+    assert added == len(rewritten)
+    assert (tmp_path / "cam.log.partial").read_bytes() == rewritten
+
+    # Finishing hashes the verified partial and reads only its head and tail.
+    partial = registry.get(tmp_path, "cam.log", "cam.log", len(rewritten), 2, "sha256", True)
+    reader = CountingReader(rewritten)
+    temp, digest = copy_to_temp(
+        tmp_path / "src", tmp_path, "cam.log", 4096, "sha256", True, reader, partial
+    )
+    assert reader.read == HEAD_CHECK_BYTES + 4096
+    assert temp.read_bytes() == rewritten
+    assert digest == hashlib.sha256(rewritten).hexdigest()
+    registry.finish(temp)
+    assert registry.entries == {}
+
+
+def test_growing_partial_starts_over_when_the_header_is_patched(tmp_path: Path):
+    registry = _registry(tmp_path)
+    first = os.urandom(3 * MIB)
+    partial = registry.get(tmp_path, "cam.avi", "cam.avi", len(first), 1, "sha256", True)
+    partial.extend(CountingReader(first), 64 * 1024)
+
+    # The writer fixes up its header (frame count, index size) and appends.
+    patched = first[:4] + b"\x00\x01\x02\x03" + first[8:] + os.urandom(MIB)
+    partial = registry.get(tmp_path, "cam.avi", "cam.avi", len(patched), 2, "sha256", True)
+    temp, digest = copy_to_temp(
+        tmp_path / "src", tmp_path, "cam.avi", 64 * 1024, "sha256", True,
+        CountingReader(patched), partial,
+    )
+    assert temp.read_bytes() == patched
+    assert digest == hashlib.sha256(patched).hexdigest()
+
+    # Between cycles the partial is rebuilt from scratch the same way.
+    partial = registry.get(tmp_path, "cam.avi", "cam.avi", len(first), 3, "sha256", True)
+    partial.extend(CountingReader(first), 64 * 1024)
+    partial = registry.get(tmp_path, "cam.avi", "cam.avi", len(patched), 4, "sha256", True)
+    assert partial.extend(CountingReader(patched), 64 * 1024) == len(patched)
+    assert temp.read_bytes() == patched
+
+
+def test_expire_sweeps_untracked_temps_past_the_ttl(tmp_path: Path):
+    registry = _registry(tmp_path)
+    raw = tmp_path / "raw" / "a"
+    raw.mkdir(parents=True)
+    tracked = registry.get(raw, "big.bin", "a/big.bin", 3 * MIB, 1, "sha256")
+    tracked.temp.write_bytes(b"x")
+    orphans = [raw / ".img.jpg.123.1700000000.tmp", raw / ".old.bin.9-9.part"]
+    keep = [raw / ".fresh.jpg.123.1700000000.tmp", raw / "img.tmp", raw / ".hidden"]
+    for path in orphans + keep + [tracked.temp]:
+        path.write_bytes(b"x")
+    for path in orphans + keep[1:] + [tracked.temp]:
+        os.utime(path, (1, 1))
+
+    now = time.time()
+    assert registry.expire(now, tmp_path / "raw") == 2
+    assert not any(p.exists() for p in orphans)
+    assert all(p.exists() for p in keep + [tracked.temp])
+
+    # The walk over raw/ runs once a day, not every cycle.
+    orphans[0].write_bytes(b"x")
+    os.utime(orphans[0], (1, 1))
+    assert registry.expire(now + 60, tmp_path / "raw") == 0
+    # A day on: the orphan, the idle tracked part and the once fresh temp.
+    assert registry.expire(now + 86400 + 60, tmp_path / "raw") == 3
+    assert registry.entries == {}
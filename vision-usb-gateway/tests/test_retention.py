@@ -0,0 +1,237 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from vision_sync import retention
+from vision_sync.db import init_db, mark_synced
+from vision_sync.retention import (
+    IdleRetention,
+    ProtectedMatcher,
+    Retention,
+    settings_from_env,
+)
+
+TOTAL = 1000
+
+
+def _mirror(tmp_path: Path, files: list[tuple[str, int]]):
+    """raw/<name> with a bydate hardlink and a synced_files row each, oldest first."""
+    mirror = tmp_path / "mirror"
+    (mirror / "raw").mkdir(parents=True)
+    (mirror / "bydate" / "2024" / "01" / "01").mkdir(parents=True)
+    conn = init_db(mirror / ".state" / "vision.db")
+    now = int(time.time())
+    for i, (name, size) in enumerate(files):
+        raw = mirror / "raw" / name
+        raw.parent.mkdir(parents=True, exist_ok=True)
+        raw.write_bytes(b"x" * size)
+        os.link(raw, mirror / "bydate" / "2024" / "01" / "01" / name.replace("/", "_"))
+        mark_synced(
+            conn, name, size, 1, f"raw/{name}",
+            f"bydate/2024/01/01/{name.replace('/', '_')}", now - 1000 + i,
+        )
+    conn.commit()
+    return mirror, conn
+
+
+def _fake_usage(monkeypatch, mirror: Path) -> None:
+    """disk_usage over a TOTAL-byte disk holding exactly the mirror's files."""
+    def disk_usage(path):
+        seen = set()
+        used = 0
+        for p in Path(mirror).rglob("*"):
+            if p.is_file() and ".state" not in p.parts:
+                st = p.stat()
+                if st.st_ino not in seen:
+                    seen.add(st.st_ino)
+                    used += st.st_size
+        return TOTAL, used, TOTAL - used
+    monkeypatch.setattr(retention.shutil, "disk_usage", disk_usage)
+
+
+def _settings(mirror: Path, **env):
+    base = {"MIRROR_MOUNT": str(mirror), "RETENTION_HI": "90", "RETENTION_LO": "50"}
+    base.update(env)
+    return settings_from_env(base)
+
+
+def test_plan_covers_bytes_oldest_first_and_skips_protected(tmp_path: Path, monkeypatch):
+    mirror, conn = _mirror(
+        tmp_path, [("keep/a.jpg", 100), ("b.jpg", 100), ("c.jpg", 100), ("d.jpg", 100)]
+    )
+    (mirror / ".state" / "retention-protected.json").write_text(json.dumps({"paths": ["raw/keep"]}))
+    r = Retention(_settings(mirror), conn)
+    assert [row["raw_path"] for row in r.plan(150)] == ["raw/b.jpg", "raw/c.jpg"]
+    # Rows sharing one raw file (same content reused) free its bytes once.
+    conn.execute("UPDATE synced_files SET raw_path='raw/b.jpg' WHERE raw_path='raw/c.jpg'")
+    assert [row["raw_path"] for row in r.plan(150)] == ["raw/b.jpg", "raw/b.jpg", "raw/d.jpg"]
+
+
+def test_protected_matcher_prefixes_by_component():
+    m = ProtectedMatcher([Path("/m/raw/keep"), Path("/m/raw/keep/sub"), Path("/m/bydate/2024/01/")])
+    assert m.roots == [Path("/m/bydate/2024/01"), Path("/m/raw/keep")]
+    assert Path("/m/raw/keep") in m
+    assert "/m/raw/keep/a/b.jpg" in m
+    assert "/m/bydate/2024/01/x.jpg" in m
+    assert "/m/raw/keep2/a.jpg" not in m
+    assert "/m/raw/kee" not in m
+    assert "/m/raw/keep-old/a.jpg" not in m
+    assert "/m/bydate/2024/02/x.jpg" not in m
+    assert "/a.jpg" not in ProtectedMatcher([])
+
+
+def test_run_deletes_planned_rows_down_to_lo(tmp_path: Path, monkeypatch):
+    files = [(f"f{i}.jpg", 100) for i in range(10)]
+    mirror, conn = _mirror(tmp_path, files)
+    _fake_usage(monkeypatch, mirror)
+    r = Retention(_settings(mirror, RETENTION_BATCH="2", DB_MAINT_INTERVAL_SEC="0"), conn)
+    calls = []
+    real_usage = r.usage
+    monkeypatch.setattr(r, "usage", lambda: calls.append(1) or real_usage())
+    r.run()
+
+    # 1000 used, LO 50%: the five oldest go, in one planned pass.
+    assert r.planned_rows == 5
+    assert len(calls) < 10
+    assert sorted(p.name for p in (mirror / "raw").iterdir()) == [f"f{i}.jpg" for i in range(5, 10)]
+    bydate = mirror / "bydate" / "2024" / "01" / "01"
+    assert not any((bydate / f"f{i}.jpg").exists() for i in range(5))
+    rows = conn.execute("SELECT raw_path FROM synced_files ORDER BY synced_at").fetchall()
+    # Identity rows stay (paths blanked) so the sync does not copy them again.
+    assert [r[0] for r in rows] == [""] * 5 + [f"raw/f{i}.jpg" for i in range(5, 10)]
+
+
+def test_run_replans_when_recorded_sizes_overstate(tmp_path: Path, monkeypatch):
+    files = [(f"f{i}.jpg", 100) for i in range(10)]
+    mirror, conn = _mirror(tmp_path, files)
+    # The recorded sizes claim twice what the files hold.
+    conn.execute("UPDATE synced_files SET size = 200")
+    conn.commit()
+    _fake_usage(monkeypatch, mirror)
+    r = Retention(_settings(mirror, DB_MAINT_INTERVAL_SEC="0"), conn)
+    r.run()
+    assert r.usage_pct() <= 50
+    assert r.planned_rows == 5
+
+
+def test_run_falls_back_to_untracked_files(tmp_path: Path, monkeypatch):
+    mirror, conn = _mirror(tmp_path, [])
+    old = mirror / "raw" / "untracked" / "old.bin"
+    old.parent.mkdir(parents=True)
+    old.write_bytes(b"x" * 600)
+    os.utime(old, (1, 1))
+    new = mirror / "raw" / "untracked" / "new.bin"
+    new.write_bytes(b"x" * 350)
+    _fake_usage(monkeypatch, mirror)
+    r = Retention(_settings(mirror, DB_MAINT_INTERVAL_SEC="0"), conn)
+    r.run()
+    assert not old.exists()
+    assert new.exists()
+    assert r.planned_rows == 0
+
+
+def test_fallback_leaves_the_syncs_work_in_flight_alone(tmp_path: Path, monkeypatch):
+    mirror, conn = _mirror(tmp_path, [])
+    raw = mirror / "raw"
+    inflight = [
+        raw / "cam.log.partial",
+        raw / "a" / ".big.bin.900-1.part",
+        raw / "a" / ".img.jpg.77.1700000000.tmp",
+        raw / ".insp_0001.unit" / "img.jpg",
+    ]
+    for path in inflight:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 200)
+        os.utime(path, (1, 1))
+    untracked = raw / "a" / "old.bin"
+    untracked.write_bytes(b"x" * 200)
+    os.utime(untracked, (2, 2))
+    _fake_usage(monkeypatch, mirror)
+    r = Retention(_settings(mirror, RETENTION_HI="50", RETENTION_LO="0",
+                            DB_MAINT_INTERVAL_SEC="0"), conn)
+    r.run()
+    assert not untracked.exists()
+    assert all(p.exists() for p in inflight)
+
+
+def test_dry_run_deletes_nothing(tmp_path: Path, monkeypatch, capsys):
+    files = [(f"f{i}.jpg", 100) for i in range(10)]
+    mirror, conn = _mirror(tmp_path, files)
+    _fake_usage(monkeypatch, mirror)
+    Retention(_settings(mirror, DRY_RUN="true"), conn).run()
+    assert len(list((mirror / "raw").iterdir())) == 10
+    assert capsys.readouterr().out.count("DRY delete:") == 5
+
+
+def test_fallback_walks_the_mirror_once_per_run(tmp_path: Path, monkeypatch):
+    mirror, conn = _mirror(tmp_path, [])
+    untracked = mirror / "raw" / "untracked"
+    untracked.mkdir()
+    for i in range(6):
+        f = untracked / f"f{i}.bin"
+        f.write_bytes(b"x" * 100)
+        os.utime(f, (i + 1, i + 1))
+    os.link(untracked / "f1.bin", mirror / "bydate" / "2024" / "01" / "01" / "f1.bin")
+    walks = []
+    real_walk = retention._walk
+    monkeypatch.setattr(retention, "_walk", lambda root: walks.append(root) or real_walk(root))
+    r = Retention(_settings(mirror), conn)
+
+    assert r.file_fallback_delete_one()
+    (untracked / "f1.bin").unlink()  # gone before its turn: skipped
+    assert r.file_fallback_delete_one()
+    assert r.file_fallback_delete_one()
+    assert sorted(p.name for p in untracked.iterdir()) == ["f4.bin", "f5.bin"]
+    assert len(walks) == 2  # bydate/ and raw/, not once per deletion
+    assert len(r.untracked) == 2
+
+
+def _idle(tmp_path: Path, monkeypatch, synced_ago: int, **env):
+    """Nine 100-byte files synced `synced_ago` seconds ago on a 1000-byte disk."""
+    mirror, conn = _mirror(tmp_path, [(f"f{i}.jpg", 100) for i in range(9)])
+    conn.execute("UPDATE synced_files SET synced_at = ? - id", (int(time.time()) - synced_ago,))
+    conn.commit()
+    _fake_usage(monkeypatch, mirror)
+    base = {"RETENTION_HI": "95", "RETENTION_LO": "70", "RETENTION_PREDICT": "true",
+            "RETENTION_IDLE_BATCH_MB": "0"}
+    base.update(env)
+    r = Retention(_settings(mirror, **base), conn)
+    monkeypatch.setattr(retention.IdleRetention, "peak_hour", lambda self: False)
+    return mirror, IdleRetention(r, active_file=str(tmp_path / "no-active-lv"))
+
+
+def test_idle_retention_frees_a_batch_when_hi_is_near(tmp_path: Path, monkeypatch):
+    # 900 bytes in the last day, 50 to go to HI (95%): crossed in ~1.3h.
+    mirror, idle = _idle(tmp_path, monkeypatch, 3600)
+    monkeypatch.setattr(idle.s, "idle_batch_mb", 1)
+    assert idle.run() == 2  # down to LO, not further
+    assert len(list((mirror / "raw").iterdir())) == 7
+
+
+def test_idle_retention_waits_for_quiet_and_a_near_forecast(tmp_path: Path, monkeypatch):
+    mirror, idle = _idle(tmp_path, monkeypatch, 60, RETENTION_IDLE_BATCH_MB="1")
+    assert idle.busy() == "recent syncs"
+    assert idle.run() == 0
+    monkeypatch.setattr(retention.IdleRetention, "peak_hour", lambda self: True)
+    monkeypatch.setattr(idle.s, "idle_quiet_min", 0)
+    assert idle.busy() == "peak hour"
+
+    # Synced long ago and slowly: HI is far beyond the horizon.
+    mirror, idle = _idle(tmp_path / "far", monkeypatch, 20 * 3600, RETENTION_IDLE_BATCH_MB="1",
+                         RETENTION_PREDICT_HORIZON_H="1")
+    assert idle.run() == 0
+    assert len(list((mirror / "raw").iterdir())) == 9
+
+
+def test_idle_retention_sees_host_writes(tmp_path: Path, monkeypatch):
+    _, idle = _idle(tmp_path, monkeypatch, 3600)
+    active = tmp_path / "active"
+    active.write_text("/dev/vg0/usb_0")
+    idle.active_file = str(active)
+    counters = iter([(100, 0), (108, 0)])
+    monkeypatch.setattr(retention, "read_stat", lambda path: next(counters))
+    idle.sleep = lambda sec: None
+    assert idle.host_writing()
+    monkeypatch.setattr(retention, "read_stat", lambda path: (100, 0))
+    assert not idle.host_writing()
@@ -1,6 +1,6 @@
 from pathlib import Path
 
-from vision_sync.db import init_db, update_state
+from vision_sync.db import BatchState, init_db, is_already_synced, mark_synced, update_state
 
 
 def test_stable_detection(tmp_path: Path):
@@ -13,3 +13,49 @@ def test_stable_detection(tmp_path: Path):
     assert stable == 2
     stable = update_state(conn, "a.jpg", 11, 101, 3)
     assert stable == 1
+
+
+def test_batch_state_matches_direct_and_defers_writes(tmp_path: Path):
+    conn = init_db(tmp_path / "vision.db")
+    state = BatchState(conn, stable_cap=2)
+
+    assert state.update("a.jpg", 10, 100, 1) == 1
+    assert state.update("a.jpg", 10, 100, 2) == 2
+    # Nothing hits the table until flush().
+    assert conn.execute("SELECT COUNT(*) FROM file_state").fetchone()[0] == 0
+    state.flush()
+    row = conn.execute("SELECT size, mtime, stable_count FROM file_state").fetchone()
+    assert row == (10, 100, 2)
+
+    reloaded = BatchState(conn, stable_cap=2)
+    assert reloaded.update("a.jpg", 11, 101, 3) == 1
+
+
+def test_batch_state_skips_rewrite_of_stable_rows(tmp_path: Path):
+    conn = init_db(tmp_path / "vision.db")
+    update_state(conn, "a.jpg", 10, 100, 1)
+    update_state(conn, "a.jpg", 10, 100, 2)
+    conn.commit()
+
+    state = BatchState(conn, stable_cap=2)
+    assert state.update("a.jpg", 10, 100, 3) == 2
+    assert not state.dirty
+
+
+def test_batch_state_synced_lookup(tmp_path: Path):
+    conn = init_db(tmp_path / "vision.db")
+    update_state(conn, "old.jpg", 1, 2, 1)
+    mark_synced(conn, "old.jpg", 1, 2, "/raw/old", "/bydate/old", 1)
+    mark_synced(conn, "untracked.jpg", 3, 4, "/raw/u", "/bydate/u", 1)
+    conn.commit()
+
+    state = BatchState(conn, stable_cap=2)
+    assert state.is_synced("old.jpg", 1, 2)
+    # Not in file_state, so not preloaded: falls back to the DB.
+    assert state.is_synced("untracked.jpg", 3, 4)
+    assert not state.is_synced("new.jpg", 5, 6)
+
+    state.mark_synced("new.jpg", 5, 6, "/raw/new", "/bydate/new", 2)
+    assert state.is_synced("new.jpg", 5, 6)
+    state.flush()
+    assert is_already_synced(conn, "new.jpg", 5, 6)
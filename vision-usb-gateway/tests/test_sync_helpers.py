@@ -1,6 +1,8 @@
 from pathlib import Path
 
+from vision_sync import sync
 from vision_sync.sync import (
+    _cleanup_lv_mappings,
     _find_tool,
     next_lv,
     read_manifest_state,
@@ -85,3 +87,22 @@ def test_find_tool_with_custom_paths(tmp_path: Path):
     tool.write_text("#!/bin/sh\n")
     result = _find_tool("mytool", search_paths=(str(tool_dir),))
     assert result == str(tool)
+
+
+def test_cleanup_always_force_removes_the_snapshot_mapping(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sync, "_find_tool", lambda name: f"/sbin/{name}")
+    monkeypatch.setattr(sync, "run_best_effort", calls.append)
+    # Mounted with loop,offset: no partition nodes to tear down.
+    monkeypatch.setattr(sync, "_has_partition_mappings", lambda vg, snap: False)
+    _cleanup_lv_mappings("/dev/vg0/snap", "vg0", "snap")
+    assert calls == [["/sbin/dmsetup", "remove", "-f", "vg0-snap"]]
+
+    calls.clear()
+    monkeypatch.setattr(sync, "_has_partition_mappings", lambda vg, snap: True)
+    _cleanup_lv_mappings("/dev/vg0/snap", "vg0", "snap")
+    assert calls[-2:] == [
+        ["/sbin/dmsetup", "remove", "-f", "vg0-snap1"],
+        ["/sbin/dmsetup", "remove", "-f", "vg0-snap"],
+    ]
+    assert ["/sbin/kpartx", "-d", "/dev/vg0/snap"] in calls
@@ -2,7 +2,11 @@ import os
 from pathlib import Path
 from types import SimpleNamespace
 
+import pytest
+
+from vision_sync import sync
 from vision_sync.db import init_db
+from vision_sync.retention import Retention, settings_from_env
 from vision_sync.sync import select_scan_roots, stable_and_copy
 
 
@@ -26,7 +30,7 @@ def _sync_cfg(mirror: Path, tmp_path: Path, depth: int) -> SimpleNamespace:
 
 
 def _synced_paths(conn) -> list[str]:
-    rows = conn.execute("SELECT source_path FROM synced_files").fetchall()
+    rows = conn.execute("SELECT source_path FROM v_synced_files").fetchall()
     return sorted(Path(r[0]).as_posix() for r in rows)
 
 
@@ -151,6 +155,26 @@ def test_offline_force_stable_copies_on_first_pass(tmp_path: Path):
         conn.close()
 
 
+def test_counter_proven_copies_record_how_they_passed(tmp_path: Path):
+    root = tmp_path / "snap"
+    root.mkdir()
+    (root / "old.jpg").write_bytes(b"o")
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.stable_scans = 2
+    try:
+        stable_and_copy(cfg, root, conn)
+        (root / "new.jpg").write_bytes(b"n")
+        stable_and_copy(cfg, root, conn, force_stable=True, forced_via="counter")
+        rows = dict(conn.execute("SELECT source_path, stable_via FROM v_synced_files"))
+    finally:
+        conn.close()
+
+    assert rows == {"old.jpg": "scan", "new.jpg": "counter"}
+
+
 def test_sync_is_idempotent_across_runs(tmp_path: Path):
     root = tmp_path / "snap"
     root.mkdir()
@@ -167,3 +191,470 @@ def test_sync_is_idempotent_across_runs(tmp_path: Path):
         conn.close()
 
     assert count == 1
+
+
+def test_batch_state_mode_copies_after_stable_scans(tmp_path: Path):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    (root / "a" / "one.jpg").write_bytes(b"x")
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.stable_scans = 2
+    cfg.sync_state_batch = True
+    try:
+        stable_and_copy(cfg, root, conn)
+        assert conn.execute("SELECT COUNT(*) FROM synced_files").fetchone()[0] == 0
+        stable_and_copy(cfg, root, conn)
+        stable_and_copy(cfg, root, conn)
+        assert _synced_paths(conn) == ["a/one.jpg"]
+    finally:
+        conn.close()
+    assert (mirror / "raw" / "a" / "one.jpg").read_bytes() == b"x"
+
+
+def test_copy_workers_record_rows_in_scan_order(tmp_path: Path):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    for i in range(40):
+        (root / "a" / f"img{i:02d}.jpg").write_bytes(bytes([i]) * (i + 1))
+
+    def synced_order(workers: int) -> list[str]:
+        mirror = tmp_path / f"mirror{workers}"
+        conn = init_db(mirror / ".state" / "vision.db")
+        cfg = _sync_cfg(mirror, tmp_path, depth=1)
+        cfg.sync_copy_workers = workers
+        try:
+            stable_and_copy(cfg, root, conn)
+            rows = conn.execute("SELECT source_path FROM v_synced_files ORDER BY id").fetchall()
+        finally:
+            conn.close()
+        for i in range(40):
+            raw = mirror / "raw" / "a" / f"img{i:02d}.jpg"
+            assert raw.read_bytes() == bytes([i]) * (i + 1)
+        return [r[0] for r in rows]
+
+    serial = synced_order(1)
+    assert len(serial) == 40
+    assert synced_order(4) == serial
+
+
+def test_batch_durability_syncs_once_per_batch_before_rows(tmp_path: Path, monkeypatch):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    for i in range(5):
+        (root / "a" / f"img{i}.jpg").write_bytes(b"x" * (i + 1))
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.sync_durability = "batch"
+    cfg.sync_durability_batch_files = 2
+    cfg.sync_durability_batch_mb = 512
+
+    flushes = []
+
+    def fake_syncfs(path):
+        # At flush time nothing of this batch is visible yet: only hidden temps.
+        raw = mirror / "raw" / "a"
+        visible = [p.name for p in raw.iterdir() if not p.name.startswith(".")]
+        rows = conn.execute("SELECT COUNT(*) FROM synced_files").fetchone()[0]
+        flushes.append((len(visible), rows))
+        return True
+
+    monkeypatch.setattr(sync, "syncfs", fake_syncfs)
+    try:
+        stable_and_copy(cfg, root, conn)
+        assert len(_synced_paths(conn)) == 5
+    finally:
+        conn.close()
+
+    assert flushes == [(0, 0), (2, 2), (4, 4)]
+    raw = mirror / "raw" / "a"
+    assert sorted(p.name for p in raw.iterdir()) == [f"img{i}.jpg" for i in range(5)]
+
+
+def test_dir_manifest_skips_settled_dirs_until_they_change(tmp_path: Path, monkeypatch):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    (root / "a" / "one.jpg").write_bytes(b"1")
+    (root / "top.jpg").write_bytes(b"t")
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.stable_scans = 2
+    manifest_file = tmp_path / "dirs.json"
+
+    processed: list[str] = []
+    real = sync._process_file
+
+    def spy(rec, *args, **kwargs):
+        processed.append(rec.rel)
+        return real(rec, *args, **kwargs)
+
+    monkeypatch.setattr(sync, "_process_file", spy)
+
+    def cycle() -> list[str]:
+        processed.clear()
+        manifest = sync.DirManifest(manifest_file, settle_runs=2)
+        stable_and_copy(cfg, root, conn, manifest=manifest)
+        manifest.save()
+        return sorted(processed)
+
+    try:
+        assert cycle() == ["a/one.jpg", "top.jpg"]
+        assert cycle() == ["a/one.jpg", "top.jpg"]  # second stable scan: copied
+        assert _synced_paths(conn) == ["a/one.jpg", "top.jpg"]
+        assert cycle() == []  # both folders settled
+        (root / "a" / "two.jpg").write_bytes(b"2")
+        assert cycle() == ["a/one.jpg", "a/two.jpg"]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_dir_manifest_keeps_settled_files_past_the_prune_window(
+    tmp_path: Path, monkeypatch, batch: bool
+):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    (root / "a" / "one.jpg").write_bytes(b"1")
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.stable_scans = 2
+    cfg.sync_state_batch = batch
+    manifest_file = tmp_path / "dirs.json"
+    clock = [1_700_000_000]
+    monkeypatch.setattr(sync.time, "time", lambda: clock[0])
+
+    def cycle() -> None:
+        manifest = sync.DirManifest(manifest_file, settle_runs=2)
+        stable_and_copy(cfg, root, conn, manifest=manifest)
+        manifest.save()
+
+    try:
+        for _ in range(3):
+            cycle()
+        assert _synced_paths(conn) == ["a/one.jpg"]
+        # Forty days in which the folder is skipped every cycle, then the
+        # retention prune (FILE_STATE_PRUNE_DAYS=30).
+        for _ in range(40 * 4):
+            clock[0] += 6 * 3600
+            cycle()
+        r = Retention(settings_from_env({"MIRROR_MOUNT": str(mirror)}), conn)
+        r.now = clock[0]
+        r.prune_rows()
+        rows = conn.execute("SELECT path, stable_count FROM v_file_state").fetchall()
+    finally:
+        conn.close()
+    assert [tuple(row) for row in rows] == [("a/one.jpg", 2)]
+
+
+def test_dir_manifest_prunes_removed_dirs_and_keeps_unwalked(tmp_path: Path):
+    from vision_sync.fsops import FileRecord
+    from vision_sync.sync import DirManifest
+
+    path = tmp_path / "dirs.json"
+    m = DirManifest(path, settle_runs=1)
+    m.observe("a", [FileRecord("a/x", 1, 1)])
+    m.observe("a/gone", [])
+    m.observe("b", [FileRecord("b/y", 1, 1)])
+    first = m.save()
+
+    m = DirManifest(path, settle_runs=1)
+    assert m.observe("a", [FileRecord("a/x", 1, 1)]) is True
+    m.walked_root("a", recursive=True)
+    second = m.save()
+
+    assert sorted(DirManifest(path, 1).dirs) == ["a", "b"]
+    assert first != second
+
+
+def test_budget_orders_by_priority_and_carries_the_rest(tmp_path: Path, monkeypatch):
+    root = tmp_path / "snap"
+    for name, ts in (("old", 100), ("new", 300)):
+        _touch_dir(root / name / "sub", ts)
+        (root / name / "sub" / f"{name}.jpg").write_bytes(name.encode())
+        os.utime(root / name, (ts, ts))
+    (root / "top.jpg").write_bytes(b"t")
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.sync_hot_dirs = 1
+    cfg.sync_cold_audit_dirs_per_run = 1
+    backlog = tmp_path / "backlog.json"
+    listed: list[str] = []
+    real = sync.MountTree.scan_level
+    monkeypatch.setattr(
+        sync.MountTree, "scan_level", lambda self, rel="": (listed.append(rel), real(self, rel))[1]
+    )
+    # Three listings fit: the hot tree ("new", "new/sub") and the root level.
+    budget = sync.CycleBudget(60, backlog, "usb_0")
+    monkeypatch.setattr(budget, "expired", lambda: len(listed) >= 3)
+    try:
+        stable_and_copy(cfg, root, conn, budget=budget)
+        assert listed == ["new", "new/sub", ""]
+        assert _synced_paths(conn) == ["new/sub/new.jpg", "top.jpg"]
+
+        listed.clear()
+        stable_and_copy(cfg, root, conn, budget=sync.CycleBudget(60, backlog, "usb_0"))
+        assert listed[:2] == ["new", "new/sub"] and "old/sub" in listed
+        assert "old/sub/old.jpg" in _synced_paths(conn)
+        assert not backlog.exists()
+    finally:
+        conn.close()
+
+
+def test_budget_spent_before_listing_still_walks_the_first_unit(tmp_path: Path, monkeypatch):
+    root = tmp_path / "snap"
+    for name, ts in (("old", 100), ("new", 300)):
+        _touch_dir(root / name / "sub", ts)
+        (root / name / "sub" / f"{name}.jpg").write_bytes(name.encode())
+        os.utime(root / name, (ts, ts))
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.sync_hot_dirs = 1
+    cfg.sync_cold_audit_dirs_per_run = 1
+    backlog = tmp_path / "backlog.json"
+    listed: list[str] = []
+    real = sync.MountTree.scan_level
+    monkeypatch.setattr(
+        sync.MountTree, "scan_level", lambda self, rel="": (listed.append(rel), real(self, rel))[1]
+    )
+    logs: list[str] = []
+    monkeypatch.setattr(sync, "log", logs.append)
+    # Snapshot, mount and planning used the whole budget already.
+    budget = sync.CycleBudget(60, backlog, "usb_0")
+    monkeypatch.setattr(budget, "expired", lambda: True)
+    try:
+        stable_and_copy(cfg, root, conn, budget=budget)
+        assert listed == ["new", "new/sub"]
+        assert _synced_paths(conn) == ["new/sub/new.jpg"]
+        assert backlog.exists()
+        assert any("WARNING" in line for line in logs)
+    finally:
+        conn.close()
+
+
+def test_failed_cycle_keeps_rows_of_finished_copies(tmp_path: Path, monkeypatch):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    for i in range(6):
+        (root / "a" / f"img{i}.jpg").write_bytes(b"x" * (i + 1))
+
+    mirror = tmp_path / "mirror"
+    db = mirror / ".state" / "vision.db"
+    conn = init_db(db)
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.sync_checkpoint_files = 2
+    commits = []
+    real_copy = sync._copy_temp
+
+    def flaky(job, *args):
+        if job.rel == "a/img4.jpg":
+            raise SystemExit(143)  # SIGTERM mid-cycle
+        commits.append(init_db(db).execute("SELECT COUNT(*) FROM synced_files").fetchone()[0])
+        return real_copy(job, *args)
+
+    monkeypatch.setattr(sync, "_copy_temp", flaky)
+    try:
+        with pytest.raises(SystemExit):
+            stable_and_copy(cfg, root, conn)
+    finally:
+        conn.close()
+    # Checkpoints every 2 rows were visible to other connections mid-cycle,
+    # and the final commit kept the 4 copies made before the interruption.
+    assert commits == [0, 0, 2, 2]
+    reopened = init_db(db)
+    assert reopened.execute("SELECT COUNT(*) FROM synced_files").fetchone()[0] == 4
+    reopened.close()
+
+
+def test_progressive_globs_mirror_growing_files_before_stable(tmp_path: Path):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    log_file = root / "a" / "CAM.LOG"
+    other = root / "a" / "img.jpg"
+    log_file.write_bytes(b"first\n")
+    other.write_bytes(b"jpg")
+    os.utime(log_file, (1000, 1000))
+
+    mirror = tmp_path / "mirror"
+    partial = mirror / "raw" / "a" / "CAM.LOG.partial"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.stable_scans = 2
+    cfg.sync_resume_min_mb = 0
+    cfg.sync_resume_file = mirror / ".state" / "partial.json"
+    cfg.sync_progressive_globs = ["*.log"]
+    try:
+        stable_and_copy(cfg, root, conn)
+        assert partial.read_bytes() == b"first\n"
+        assert not (mirror / "raw" / "a" / "img.jpg").exists()
+
+        with open(log_file, "ab") as f:
+            f.write(b"second\n")
+        os.utime(log_file, (1010, 1010))
+        stable_and_copy(cfg, root, conn)
+        assert partial.read_bytes() == b"first\nsecond\n"
+        assert _synced_paths(conn) == ["a/img.jpg"]
+
+        stable_and_copy(cfg, root, conn)
+        assert _synced_paths(conn) == ["a/CAM.LOG", "a/img.jpg"]
+    finally:
+        conn.close()
+    assert (mirror / "raw" / "a" / "CAM.LOG").read_bytes() == b"first\nsecond\n"
+    assert not partial.exists()
+    assert not cfg.sync_resume_file.exists()
+
+
+def test_progressive_copy_follows_a_header_patched_in_place(tmp_path: Path):
+    root = tmp_path / "snap"
+    root.mkdir()
+    video = root / "cam.avi"
+    video.write_bytes(b"RIFF\x00\x00\x00\x00AVI " + os.urandom(64 * 1024))
+    os.utime(video, (1000, 1000))
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    cfg.stable_scans = 2
+    cfg.sync_resume_min_mb = 0
+    cfg.sync_resume_file = mirror / ".state" / "partial.json"
+    cfg.sync_progressive_globs = ["*.avi"]
+    try:
+        stable_and_copy(cfg, root, conn)
+        assert (mirror / "raw" / "cam.avi.partial").exists()
+
+        # The recorder appends its index and fixes the RIFF size up front.
+        data = bytearray(video.read_bytes() + os.urandom(1 << 20))
+        data[4:8] = len(data).to_bytes(4, "little")
+        video.write_bytes(data)
+        os.utime(video, (1010, 1010))
+        stable_and_copy(cfg, root, conn)
+        stable_and_copy(cfg, root, conn)
+        assert _synced_paths(conn) == ["cam.avi"]
+    finally:
+        conn.close()
+    assert (mirror / "raw" / "cam.avi").read_bytes() == bytes(data)
+
+
+def test_folder_units_wait_for_every_file_and_publish_at_once(tmp_path: Path, monkeypatch):
+    root = tmp_path / "snap"
+    unit = root / "line1" / "insp_0001"
+    (unit / "img").mkdir(parents=True)
+    (unit / "img" / "cam1.png").write_bytes(b"p1")
+    (unit / "result.csv").write_bytes(b"ok")
+    os.utime(unit / "result.csv", (1000, 1000))
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=2)
+    cfg.stable_scans = 2
+    cfg.sync_folder_units = True
+    renames = []
+    real_rename = os.rename
+    monkeypatch.setattr(
+        sync.os, "rename", lambda a, b: (renames.append((Path(a), Path(b))), real_rename(a, b))
+    )
+    try:
+        stable_and_copy(cfg, root, conn)
+        # cam1.png is stable on the second pass, result.csv is still being written.
+        (unit / "result.csv").write_bytes(b"ok;done")
+        os.utime(unit / "result.csv", (1010, 1010))
+        stable_and_copy(cfg, root, conn)
+        assert _synced_paths(conn) == []
+        assert not (mirror / "raw" / "line1").exists()
+
+        renames.clear()
+        stable_and_copy(cfg, root, conn)
+        assert _synced_paths(conn) == [
+            "line1/insp_0001/img/cam1.png", "line1/insp_0001/result.csv",
+        ]
+        raw_paths = [r[0] for r in conn.execute("SELECT raw_path FROM synced_files")]
+    finally:
+        conn.close()
+    published = mirror / "raw" / "line1" / "insp_0001"
+    assert any(a.name == ".insp_0001.unit" and b == published for a, b in renames)
+    assert (published / "img" / "cam1.png").read_bytes() == b"p1"
+    assert (published / "result.csv").read_bytes() == b"ok;done"
+    assert not (mirror / "raw" / "line1" / ".insp_0001.unit").exists()
+    assert all((mirror / p).is_relative_to(published) for p in raw_paths)
+
+
+def test_folder_unit_published_before_its_rows_is_adopted(tmp_path: Path, monkeypatch):
+    root = tmp_path / "snap"
+    unit = root / "line1" / "insp_0001"
+    unit.mkdir(parents=True)
+    (unit / "a.png").write_bytes(b"a")
+    (unit / "b.png").write_bytes(b"b")
+
+    mirror = tmp_path / "mirror"
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=2)
+    cfg.stable_scans = 1
+    cfg.sync_folder_units = True
+    published = mirror / "raw" / "line1" / "insp_0001"
+
+    def crash(*args):
+        raise KeyboardInterrupt("killed after the rename")
+
+    try:
+        monkeypatch.setattr(sync, "_link_bydate", crash)
+        with pytest.raises(KeyboardInterrupt):
+            stable_and_copy(cfg, root, conn)
+        conn.rollback()
+        monkeypatch.undo()
+        assert (published / sync.UNIT_PENDING_FILE).exists()
+        assert _synced_paths(conn) == []
+
+        # The host added c.png meanwhile; b.png's copy was lost.
+        (unit / "c.png").write_bytes(b"c")
+        (published / "b.png").unlink()
+        stable_and_copy(cfg, root, conn)
+        stable_and_copy(cfg, root, conn)
+        assert _synced_paths(conn) == [
+            "line1/insp_0001/a.png", "line1/insp_0001/b.png", "line1/insp_0001/c.png",
+        ]
+    finally:
+        conn.close()
+    assert sorted(p.name for p in published.iterdir()) == ["a.png", "b.png", "c.png"]
+    assert any((mirror / "bydate").rglob("a.png"))
+
+
+def test_dest_planner_resolves_each_folder_once_and_keeps_collisions(tmp_path, monkeypatch):
+    root = tmp_path / "snap"
+    (root / "a").mkdir(parents=True)
+    for i in range(20):
+        (root / "a" / f"f{i:02d}.jpg").write_bytes(b"new %d" % i)
+    os.utime(root / "a" / "f00.jpg", (1000, 1000))
+
+    mirror = tmp_path / "mirror"
+    (mirror / "raw" / "a").mkdir(parents=True)
+    (mirror / "raw" / "a" / "f00.jpg").write_bytes(b"older copy")
+    joins, listings = [], []
+    real_join, real_listdir = sync.safe_join, os.listdir
+    monkeypatch.setattr(sync, "safe_join", lambda b, r: (joins.append(r), real_join(b, r))[1])
+    monkeypatch.setattr(
+        sync.os, "listdir", lambda p: (listings.append(Path(p)), real_listdir(p))[1]
+    )
+    conn = init_db(mirror / ".state" / "vision.db")
+    cfg = _sync_cfg(mirror, tmp_path, depth=1)
+    try:
+        stable_and_copy(cfg, root, conn)
+    finally:
+        conn.close()
+
+    assert len(joins) == 1
+    assert sorted(p.name for p in listings).count("a") == 1
+    names = sorted(p.name for p in (mirror / "raw" / "a").iterdir())
+    assert len(names) == 21
+    assert "f00.jpg" in names
+    assert any(n.startswith("f00_1000_") for n in names)
@@ -235,3 +235,24 @@ def test_protected_writes_a_list_retention_can_parse(roots, monkeypatch, tmp_pat
     assert code == 0
     data = json.loads(written["payload"])
     assert data["paths"] == ["raw", "raw/2026"], "deduped, normalised, sorted"
+
+
+def test_protected_status_counts_nested_folders_once(roots, monkeypatch, tmp_path):
+    _, mirror, _ = roots
+    (mirror / "raw" / "2026" / "keep").mkdir()
+    listed = tmp_path / "protected.json"
+    listed.write_text(json.dumps({"paths": ["raw/2026/keep", "raw/2026"]}), encoding="utf-8")
+    monkeypatch.setattr(server, "PROTECTED_FILE", listed)
+    monkeypatch.setattr(server, "RETENTION_BLOCKED", tmp_path / "blocked.json")
+    du = []
+
+    def fake_run(args):
+        if args[0].endswith("/du"):
+            du.append(args[-1])
+        return 0, "10\tx", ""
+
+    monkeypatch.setattr(server, "run_cmd", fake_run)
+    status = server.get_protected_status()
+    assert du == [str((mirror / "raw" / "2026").resolve())]
+    assert status["protected_bytes"] == 10
+    assert status["paths"] == ["raw/2026/keep", "raw/2026"]